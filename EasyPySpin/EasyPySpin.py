@@ -1,5 +1,59 @@
 import cv2
+import numpy as np
 import PySpin
+from .FramePool import frame_view
+
+# GenICam nodes whose handles are looked up once when the camera is opened
+NODE_NAMES = (
+    "ExposureTime",
+    "ExposureAuto",
+    "Gain",
+    "GainAuto",
+    "AutoExposureEVCompensation",
+    "Gamma",
+    "AcquisitionFrameRateEnable",
+    "AcquisitionFrameRate",
+    "DeviceIndicatorMode",
+    "Width",
+    "Height",
+    "DeviceTemperature",
+)
+# nodes whose limits, or values for the image size, are cached until the
+# camera reports the node changed, for example the frame rate limits when the
+# exposure time changes
+CACHED_NODES = (
+    "ExposureTime",
+    "Gain",
+    "AutoExposureEVCompensation",
+    "Gamma",
+    "AcquisitionFrameRate",
+    "Width",
+    "Height",
+)
+# order set_many() applies properties in, so that the limits a property
+# depends on, such as the frame rate's on the exposure time, are already final
+SET_ORDER = (
+    cv2.CAP_PROP_EXPOSURE,
+    cv2.CAP_PROP_GAIN,
+    cv2.CAP_PROP_BRIGHTNESS,
+    cv2.CAP_PROP_GAMMA,
+    cv2.CAP_PROP_FPS,
+    cv2.CAP_PROP_BACKLIGHT,
+)
+
+
+class _StaleCallback(PySpin.NodeCallback):
+    """
+    Marks a cached node stale when the camera reports that it changed.
+    """
+
+    def __init__(self, stale, name):
+        super(_StaleCallback, self).__init__()
+        self._stale = stale
+        self._name = name
+
+    def CallbackFunction(self, node):
+        self._stale.add(self._name)
 
 
 class VideoCapture:
@@ -12,11 +66,17 @@ class VideoCapture:
         camera
     nodemap : PySpin.INodeMap
         nodemap represents the elements of a camera description file.
+    frame_id : int
+        camera's id of the last frame returned by read().
+    timestamp : int
+        camera's timestamp of the last frame returned by read() in nanoseconds.
 
     Methods
     -------
     read()
         returns the next frame.
+    read_into(out)
+        returns the next frame, copied into out.
     release()
         Closes capturing device.
     isOpened()
@@ -25,6 +85,10 @@ class VideoCapture:
         Sets a property.
     get(propId)
         Gets a property.
+    set_many(settings)
+        Sets several properties in one pass.
+    get_many(propIds)
+        Gets several properties in one pass.
     """
 
     def __init__(self, index):
@@ -34,6 +98,8 @@ class VideoCapture:
         index : int
             id of the video capturing device to open.
         """
+        self.frame_id = -1
+        self.timestamp = -1
         self._system = PySpin.System.GetInstance()
         self._cam_list = self._system.GetCameras()
         # num_cam = self.cam_list.GetSize()
@@ -56,7 +122,66 @@ class VideoCapture:
         handling_mode_entry = handling_mode.GetEntryByName("NewestOnly")
         handling_mode.SetIntValue(handling_mode_entry.GetValue())
 
+        self._open_nodes()
+        self._setters = {
+            cv2.CAP_PROP_EXPOSURE: self._set_Exposure,
+            cv2.CAP_PROP_GAIN: self._set_GainSetting,
+            cv2.CAP_PROP_BRIGHTNESS: self._set_Brightness,
+            cv2.CAP_PROP_GAMMA: self._set_Gamma,
+            cv2.CAP_PROP_FPS: self._set_FrameRate,
+            cv2.CAP_PROP_BACKLIGHT: self._set_BackLight,
+        }
+        self._getters = {
+            cv2.CAP_PROP_EXPOSURE: self._get_ExposureTime,
+            cv2.CAP_PROP_GAIN: self._get_Gain,
+            cv2.CAP_PROP_BRIGHTNESS: self._get_Brightness,
+            cv2.CAP_PROP_GAMMA: self._get_Gamma,
+            cv2.CAP_PROP_FRAME_WIDTH: self._get_Width,
+            cv2.CAP_PROP_FRAME_HEIGHT: self._get_Height,
+            cv2.CAP_PROP_FPS: self._get_FrameRate,
+            cv2.CAP_PROP_TEMPERATURE: self._get_Temperature,
+            cv2.CAP_PROP_BACKLIGHT: self._get_BackLight,
+        }
+
+    def _open_nodes(self):
+        """
+        Looks up the node handles once and watches the cached nodes.
+
+        Every node read or written goes over USB, so the handles, the limits
+        used to clip values and the image size are kept here instead of being
+        looked up on every call. A node callback marks a cached node stale
+        when the camera reports that it changed, and only then is it read
+        again.
+        """
+        self._node = {name: getattr(self.cam, name) for name in NODE_NAMES}
+        self._cache = {}
+        self._stale = set(CACHED_NODES)
+        self._callbacks = []
+        for name in CACHED_NODES:
+            callback = _StaleCallback(self._stale, name)
+            PySpin.RegisterNodeCallback(self._node[name].GetNode(), callback)
+            self._callbacks.append(callback)
+
+    def _cached(self, name, read):
+        """
+        Returns the cached read of a node, reading it again if it is stale.
+        """
+        if name in self._stale or name not in self._cache:
+            # cleared first, so a change reported during the read is kept
+            self._stale.discard(name)
+            self._cache[name] = read(self._node[name])
+        return self._cache[name]
+
+    def _limits(self, name):
+        return self._cached(name, lambda node: (node.GetMin(), node.GetMax()))
+
     def __del__(self):
+        try:
+            for callback in self._callbacks:
+                PySpin.DeregisterNodeCallback(callback)
+            self._callbacks = []
+        except:
+            pass
         try:
             if self.cam.IsStreaming():
                 self.cam.EndAcquisition()
@@ -93,16 +218,56 @@ class VideoCapture:
         image : array_like 
             grabbed image is returned here. If no image has been grabbed the image will be None.
         """
+        return self._grab(None)
+
+    def read_into(self, out):
+        """
+        returns the next frame, copied into out.
+
+        The image is copied once from the Spinnaker buffer into out before the
+        buffer is released, so a preallocated array or a FrameRing slot can be
+        filled without allocating a new array for every frame.
+
+        Parameters
+        ----------
+        out : numpy.ndarray
+            array of the frame's shape and type, or a contiguous buffer of at
+            least as many bytes as the frame, such as a FrameRing slot.
+
+        Returns
+        -------
+        retval : bool
+            false if no frames has been grabbed.
+        image : array_like
+            view of out holding the grabbed image. If no image has been grabbed the image will be None.
+        """
+        return self._grab(out)
+
+    def _grab(self, out):
+        """
+        Grabs the next image, copying it into out or a new array when None.
+        """
         if not self.cam.IsStreaming():
             self.cam.BeginAcquisition()
 
         image = self.cam.GetNextImage()
-        if image.IsIncomplete():
-            return False, None
-
-        img_NDArray = image.GetNDArray()
-        image.Release()
-        return True, img_NDArray
+        try:
+            if image.IsIncomplete():
+                return False, None
+
+            self.frame_id = image.GetFrameID()
+            self.timestamp = image.GetTimeStamp()
+            # a view of the Spinnaker buffer, only valid until it is released
+            img_NDArray = image.GetNDArray()
+            if out is None:
+                return True, img_NDArray.copy()
+            frame = frame_view(out, img_NDArray.shape, img_NDArray.dtype)
+            np.copyto(frame, img_NDArray)
+            return True, frame
+        finally:
+            # incomplete images are released too, or the stream runs out of
+            # buffers
+            image.Release()
 
     def set(self, propId, value):
         """
@@ -120,47 +285,32 @@ class VideoCapture:
         retval : bool
            True if property setting success.
         """
-        # Exposure setting
-        if propId == cv2.CAP_PROP_EXPOSURE:
-            # Auto
-            if value < 0:
-                return self._set_ExposureAuto(PySpin.ExposureAuto_Continuous)
-
-            # Manual
-            ret = self._set_ExposureAuto(PySpin.ExposureAuto_Off)
-            if ret == False:
-                return False
-            return self._set_ExposureTime(value)
-
-        # Gain setting
-        if propId == cv2.CAP_PROP_GAIN:
-            # Auto
-            if value < 0:
-                return self._set_GainAuto(PySpin.GainAuto_Continuous)
-
-            # Manual
-            ret = self._set_GainAuto(PySpin.GainAuto_Off)
-            if ret == False:
-                return False
-            return self._set_Gain(value)
-
-        # Brightness(EV) setting
-        if propId == cv2.CAP_PROP_BRIGHTNESS:
-            return self._set_Brightness(value)
-
-        # Gamma setting
-        if propId == cv2.CAP_PROP_GAMMA:
-            return self._set_Gamma(value)
-
-        # FrameRate setting
-        if propId == cv2.CAP_PROP_FPS:
-            return self._set_FrameRate(value)
-
-        # BackLigth setting
-        if propId == cv2.CAP_PROP_BACKLIGHT:
-            return self._set_BackLight(value)
-
-        return False
+        setter = self._setters.get(propId)
+        if setter is None:
+            return False
+        return setter(value)
+
+    def set_many(self, settings):
+        """
+        Sets several properties in one pass, such as a whole settings profile.
+
+        The properties are set in SET_ORDER, so a property whose limits depend
+        on another, like the frame rate on the exposure time, is clipped to
+        its final limits.
+
+        Parameters
+        ----------
+        settings : dict
+            Values by property identifier from cv2.VideoCaptureProperties.
+
+        Returns
+        -------
+        retval : dict
+           Whether each property was set, by property identifier.
+        """
+        order = [propId for propId in SET_ORDER if propId in settings]
+        order += [propId for propId in settings if propId not in SET_ORDER]
+        return {propId: self.set(propId, settings[propId]) for propId in order}
 
     def get(self, propId):
         """
@@ -176,93 +326,86 @@ class VideoCapture:
         value : int or float or bool
            Value for the specified property. Value Flase is returned when querying a property that is not supported.
         """
-        if propId == cv2.CAP_PROP_EXPOSURE:
-            return self._get_ExposureTime()
-
-        if propId == cv2.CAP_PROP_GAIN:
-            return self._get_Gain()
+        getter = self._getters.get(propId)
+        if getter is None:
+            return False
+        return getter()
 
-        if propId == cv2.CAP_PROP_BRIGHTNESS:
-            return self._get_Brightness()
+    def get_many(self, propIds):
+        """
+        Returns several VideoCapture properties in one pass.
 
-        if propId == cv2.CAP_PROP_GAMMA:
-            return self._get_Gamma()
+        Parameters
+        ----------
+        propIds : iterable
+            Property identifiers from cv2.VideoCaptureProperties.
 
-        if propId == cv2.CAP_PROP_FRAME_WIDTH:
-            return self._get_Width()
+        Returns
+        -------
+        values : dict
+           Value of each property by identifier, False when not supported.
+        """
+        return {propId: self.get(propId) for propId in propIds}
 
-        if propId == cv2.CAP_PROP_FRAME_HEIGHT:
-            return self._get_Height()
+    def __clip(self, a, a_min, a_max):
+        return min(max(a, a_min), a_max)
 
-        if propId == cv2.CAP_PROP_FPS:
-            return self._get_FrameRate()
+    def _set_clipped(self, name, value):
+        if not type(value) in (int, float):
+            return False
+        self._node[name].SetValue(self.__clip(value, *self._limits(name)))
+        # the write is reported as a change of the node, but a node's own value
+        # never moves its limits
+        self._stale.discard(name)
+        return True
 
-        if propId == cv2.CAP_PROP_TEMPERATURE:
-            return self._get_Temperature()
+    def _set_Exposure(self, value):
+        # Auto
+        if type(value) in (int, float) and value < 0:
+            return self._set_ExposureAuto(PySpin.ExposureAuto_Continuous)
 
-        if propId == cv2.CAP_PROP_BACKLIGHT:
-            return self._get_BackLight()
+        # Manual
+        ret = self._set_ExposureAuto(PySpin.ExposureAuto_Off)
+        if ret == False:
+            return False
+        return self._set_ExposureTime(value)
 
-        return False
+    def _set_GainSetting(self, value):
+        # Auto
+        if type(value) in (int, float) and value < 0:
+            return self._set_GainAuto(PySpin.GainAuto_Continuous)
 
-    def __clip(self, a, a_min, a_max):
-        return min(max(a, a_min), a_max)
+        # Manual
+        ret = self._set_GainAuto(PySpin.GainAuto_Off)
+        if ret == False:
+            return False
+        return self._set_Gain(value)
 
     def _set_ExposureTime(self, value):
-        if not type(value) in (int, float):
-            return False
-        exposureTime_to_set = self.__clip(
-            value, self.cam.ExposureTime.GetMin(), self.cam.ExposureTime.GetMax()
-        )
-        self.cam.ExposureTime.SetValue(exposureTime_to_set)
-        return True
+        return self._set_clipped("ExposureTime", value)
 
     def _set_ExposureAuto(self, value):
-        self.cam.ExposureAuto.SetValue(value)
+        self._node["ExposureAuto"].SetValue(value)
         return True
 
     def _set_Gain(self, value):
-        if not type(value) in (int, float):
-            return False
-        gain_to_set = self.__clip(value, self.cam.Gain.GetMin(), self.cam.Gain.GetMax())
-        self.cam.Gain.SetValue(gain_to_set)
-        return True
+        return self._set_clipped("Gain", value)
 
     def _set_GainAuto(self, value):
-        self.cam.GainAuto.SetValue(value)
+        self._node["GainAuto"].SetValue(value)
         return True
 
     def _set_Brightness(self, value):
-        if not type(value) in (int, float):
-            return False
-        brightness_to_set = self.__clip(
-            value,
-            self.cam.AutoExposureEVCompensation.GetMin(),
-            self.cam.AutoExposureEVCompensation.GetMax(),
-        )
-        self.cam.AutoExposureEVCompensation.SetValue(brightness_to_set)
-        return True
+        return self._set_clipped("AutoExposureEVCompensation", value)
 
     def _set_Gamma(self, value):
-        if not type(value) in (int, float):
-            return False
-        gamma_to_set = self.__clip(
-            value, self.cam.Gamma.GetMin(), self.cam.Gamma.GetMax()
-        )
-        self.cam.Gamma.SetValue(gamma_to_set)
-        return True
+        return self._set_clipped("Gamma", value)
 
     def _set_FrameRate(self, value):
         if not type(value) in (int, float):
             return False
-        self.cam.AcquisitionFrameRateEnable.SetValue(True)
-        fps_to_set = self.__clip(
-            value,
-            self.cam.AcquisitionFrameRate.GetMin(),
-            self.cam.AcquisitionFrameRate.GetMax(),
-        )
-        self.cam.AcquisitionFrameRate.SetValue(fps_to_set)
-        return True
+        self._node["AcquisitionFrameRateEnable"].SetValue(True)
+        return self._set_clipped("AcquisitionFrameRate", value)
 
     def _set_BackLight(self, value):
         if value == True:
@@ -271,35 +414,35 @@ class VideoCapture:
             backlight_to_set = PySpin.DeviceIndicatorMode_Inactive
         else:
             return False
-        self.cam.DeviceIndicatorMode.SetValue(backlight_to_set)
+        self._node["DeviceIndicatorMode"].SetValue(backlight_to_set)
         return True
 
     def _get_ExposureTime(self):
-        return self.cam.ExposureTime.GetValue()
+        return self._node["ExposureTime"].GetValue()
 
     def _get_Gain(self):
-        return self.cam.Gain.GetValue()
+        return self._node["Gain"].GetValue()
 
     def _get_Brightness(self):
-        return self.cam.AutoExposureEVCompensation.GetValue()
+        return self._node["AutoExposureEVCompensation"].GetValue()
 
     def _get_Gamma(self):
-        return self.cam.Gamma.GetValue()
+        return self._node["Gamma"].GetValue()
 
     def _get_Width(self):
-        return self.cam.Width.GetValue()
+        return self._cached("Width", lambda node: node.GetValue())
 
     def _get_Height(self):
-        return self.cam.Height.GetValue()
+        return self._cached("Height", lambda node: node.GetValue())
 
     def _get_FrameRate(self):
-        return self.cam.AcquisitionFrameRate.GetValue()
+        return self._node["AcquisitionFrameRate"].GetValue()
 
     def _get_Temperature(self):
-        return self.cam.DeviceTemperature.GetValue()
+        return self._node["DeviceTemperature"].GetValue()
 
     def _get_BackLight(self):
-        status = self.cam.DeviceIndicatorMode.GetValue()
+        status = self._node["DeviceIndicatorMode"].GetValue()
         return (
             True
             if status == PySpin.DeviceIndicatorMode_Active
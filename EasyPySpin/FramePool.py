@@ -0,0 +1,94 @@
+import numpy as np
+
+
+def frame_view(out, shape, dtype):
+    """
+    Returns the part of a buffer that a frame is copied into.
+
+    Parameters
+    ----------
+    out : numpy.ndarray
+        either an array of the frame's shape and type, or a contiguous buffer
+        of at least as many bytes as the frame, such as a FrameRing slot.
+    shape : tuple
+        shape of the frame.
+    dtype : numpy.dtype
+        type of the frame's pixels.
+
+    Returns
+    -------
+    view : numpy.ndarray
+        view of out with the frame's shape and type.
+
+    Raises
+    ------
+    ValueError
+        when the frame does not fit in out.
+    """
+    dtype = np.dtype(dtype)
+    if out.shape == tuple(shape) and out.dtype == dtype:
+        return out
+    nbytes = int(np.prod(shape)) * dtype.itemsize
+    if not out.flags.c_contiguous or out.nbytes < nbytes:
+        raise ValueError(
+            f"A {out.nbytes} byte buffer cannot hold a {nbytes} byte frame."
+        )
+    return out.reshape(-1).view(np.uint8)[:nbytes].view(dtype).reshape(shape)
+
+
+class FramePool:
+    """
+    Preallocated frame buffers that a capture reads into in turn.
+
+    read() returns a new array for every frame, a few megabytes at full
+    resolution. Reading through a pool copies each frame once into one of
+    its buffers instead, so capturing allocates nothing. A frame returned by
+    read() stays valid until count more frames have been read.
+
+    Attributes
+    ----------
+    buffers : numpy.ndarray
+        count frames, one per buffer.
+
+    Methods
+    -------
+    read(cap)
+        returns the next frame of a capture in the next buffer.
+    """
+
+    def __init__(self, shape, dtype, count=2):
+        """
+        Parameters
+        ----------
+        shape : tuple
+            shape of the frames.
+        dtype : numpy.dtype
+            type of the frames' pixels.
+        count : int
+            number of buffers, and of frames that stay valid at once.
+        """
+        self.buffers = np.empty((int(count),) + tuple(shape), dtype)
+        self._next = 0
+
+    def __len__(self):
+        return len(self.buffers)
+
+    def read(self, cap):
+        """
+        returns the next frame of a capture in the next buffer.
+
+        Parameters
+        ----------
+        cap : VideoCapture or SimulatedCapture or ReplayCapture
+            capture to read from.
+
+        Returns
+        -------
+        retval : bool
+            false if no frames has been grabbed.
+        image : array_like
+            grabbed image is returned here. If no image has been grabbed the image will be None.
+        """
+        out = self.buffers[self._next]
+        self._next = (self._next + 1) % len(self.buffers)
+        return cap.read_into(out)
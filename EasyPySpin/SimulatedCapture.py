@@ -0,0 +1,453 @@
+import os
+import re
+import time
+import cv2
+import numpy as np
+from .FramePool import frame_view
+
+# image formats OpenCV reads, replayed even outside the repository
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".pgm")
+
+
+def _codec():
+    """
+    Returns the repository's pipeline.codec, which also reads the WGF files of
+    the raw codecs, or None when it cannot be imported.
+    """
+    try:
+        from pipeline import codec
+    except ImportError:
+        return None
+    return codec
+
+
+class SimulatedCapture:
+    """
+    Hardware-free stand-in for VideoCapture that synthesizes frames.
+
+    Frames are paced to the configured frame rate the same way a streaming
+    camera in "NewestOnly" mode is: a caller that falls behind gets the newest
+    frame rather than a backlog.
+
+    Attributes
+    ----------
+    width : int
+        width of the synthesized frames.
+    height : int
+        height of the synthesized frames.
+    bit_depth : int
+        bits per pixel, 8 produces uint8 frames and anything above uint16.
+    frame_id : int
+        id of the last frame returned by read().
+    timestamp : int
+        simulated camera timestamp of the last frame in nanoseconds.
+
+    Methods
+    -------
+    read()
+        returns the next frame.
+    read_into(out)
+        returns the next frame, copied into out.
+    release()
+        Closes capturing device.
+    isOpened()
+        Whether a camera is open or not.
+    set(propId, value)
+        Sets a property.
+    get(propId)
+        Gets a property.
+    set_many(settings)
+        Sets several properties in one pass.
+    get_many(propIds)
+        Gets several properties in one pass.
+    """
+
+    def __init__(self, index=0, width=1920, height=1200, bit_depth=8, fps=8, seed=0):
+        """
+        Parameters
+        ----------
+        index : int or str
+            id of the simulated device, only kept for parity with VideoCapture.
+        width : int
+            width of the frames to synthesize.
+        height : int
+            height of the frames to synthesize.
+        bit_depth : int
+            bits per pixel of the frames to synthesize.
+        fps : float
+            frame rate the frames are delivered at.
+        seed : int
+            seed for the static noise texture so runs are repeatable.
+        """
+        self.index = index
+        self.width = int(width)
+        self.height = int(height)
+        self.bit_depth = int(bit_depth)
+        self.frame_id = -1
+        self.timestamp = -1
+        self._props = self._default_props(fps)
+        self._base = self._make_base(seed)
+        self._start = None
+        self._opened = True
+
+    @staticmethod
+    def _default_props(fps):
+        return {
+            cv2.CAP_PROP_EXPOSURE: 100000.0,
+            cv2.CAP_PROP_GAIN: 0.0,
+            cv2.CAP_PROP_BRIGHTNESS: 0.0,
+            cv2.CAP_PROP_GAMMA: 1.0,
+            cv2.CAP_PROP_FPS: float(fps),
+            cv2.CAP_PROP_BACKLIGHT: True,
+            cv2.CAP_PROP_TEMPERATURE: 40.0,
+        }
+
+    def _make_base(self, seed):
+        # smooth gradient plus a little static noise gives PNG a realistic job
+        dtype = np.uint8 if self.bit_depth <= 8 else np.uint16
+        max_value = (1 << self.bit_depth) - 1
+        rng = np.random.default_rng(seed)
+        x = np.linspace(0.0, 1.0, self.width, dtype=np.float32)
+        y = np.linspace(0.0, 1.0, self.height, dtype=np.float32)[:, None]
+        base = 0.5 + 0.25 * np.sin(6.0 * x) * np.cos(4.0 * y)
+        base = base + rng.normal(0.0, 0.02, (self.height, self.width))
+        return (np.clip(base, 0.0, 1.0) * max_value).astype(dtype)
+
+    def _wait_for_frame(self):
+        # returns the id of the newest frame the camera would have delivered
+        period = 1.0 / self._props[cv2.CAP_PROP_FPS]
+        now = time.monotonic()
+        if self._start is None:
+            self._start = now
+        frame_id = max(int((now - self._start) / period), self.frame_id + 1)
+        delay = self._start + frame_id * period - now
+        if delay > 0:
+            time.sleep(delay)
+        return frame_id
+
+    def release(self):
+        """
+        Closes capturing device.
+        """
+        self._opened = False
+        self._start = None
+
+    def isOpened(self):
+        """
+        Returns true if video capturing has been initialized already.
+        """
+        return self._opened
+
+    def read(self):
+        """
+        returns the next frame.
+
+        Returns
+        -------
+        retval : bool
+            false if no frames has been grabbed.
+        image : array_like
+            grabbed image is returned here. If no image has been grabbed the image will be None.
+        """
+        return self.read_into(np.empty_like(self._base))
+
+    def read_into(self, out):
+        """
+        returns the next frame, copied into out.
+
+        Parameters
+        ----------
+        out : numpy.ndarray
+            array of the frame's shape and type, or a contiguous buffer of at
+            least as many bytes as the frame, such as a FrameRing slot.
+
+        Returns
+        -------
+        retval : bool
+            false if no frames has been grabbed.
+        image : array_like
+            view of out holding the grabbed image. If no image has been grabbed the image will be None.
+        """
+        if not self._opened:
+            return False, None
+        image = frame_view(out, self._base.shape, self._base.dtype)
+        self.frame_id = self._wait_for_frame()
+        # the simulated camera's clock starts with the first frame
+        self.timestamp = int(self.frame_id * 1e9 / self._props[cv2.CAP_PROP_FPS])
+        # scroll the texture so consecutive frames differ, the same as
+        # np.roll(self._base, shift, axis=1) without a temporary array
+        shift = (self.frame_id * 8) % self.width
+        image[:, shift:] = self._base[:, : self.width - shift]
+        image[:, :shift] = self._base[:, self.width - shift :]
+        return True, image
+
+    def set(self, propId, value):
+        """
+        Sets a property in the SimulatedCapture.
+
+        Parameters
+        ----------
+        propId_id : cv2.VideoCaptureProperties
+            Property identifier from cv2.VideoCaptureProperties
+        value : int or float or bool
+            Value of the property.
+
+        Returns
+        -------
+        retval : bool
+           True if property setting success.
+        """
+        if propId not in self._props or propId == cv2.CAP_PROP_TEMPERATURE:
+            return False
+        if propId == cv2.CAP_PROP_BACKLIGHT:
+            if value not in (True, False):
+                return False
+            self._props[propId] = bool(value)
+            return True
+        if not type(value) in (int, float):
+            return False
+        if propId == cv2.CAP_PROP_FPS:
+            if value <= 0:
+                return False
+            # restart pacing so the new rate applies from the next frame
+            self._start = None
+            self.frame_id = -1
+        self._props[propId] = float(value)
+        return True
+
+    def get(self, propId):
+        """
+        Returns the specified SimulatedCapture property.
+
+        Parameters
+        ----------
+        propId_id : cv2.VideoCaptureProperties
+            Property identifier from cv2.VideoCaptureProperties
+
+        Returns
+        -------
+        value : int or float or bool
+           Value for the specified property. Value False is returned when querying a property that is not supported.
+        """
+        if propId == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.width
+        if propId == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.height
+        return self._props.get(propId, False)
+
+    def set_many(self, settings):
+        """
+        Sets several properties in one pass, see VideoCapture.set_many().
+
+        Parameters
+        ----------
+        settings : dict
+            Values by property identifier from cv2.VideoCaptureProperties.
+
+        Returns
+        -------
+        retval : dict
+           Whether each property was set, by property identifier.
+        """
+        return {propId: self.set(propId, value) for propId, value in settings.items()}
+
+    def get_many(self, propIds):
+        """
+        Returns several SimulatedCapture properties in one pass.
+
+        Parameters
+        ----------
+        propIds : iterable
+            Property identifiers from cv2.VideoCaptureProperties.
+
+        Returns
+        -------
+        values : dict
+           Value of each property by identifier, False when not supported.
+        """
+        return {propId: self.get(propId) for propId in propIds}
+
+
+class ReplayCapture(SimulatedCapture):
+    """
+    Hardware-free stand-in for VideoCapture that replays recorded frames.
+
+    Frames are read from a directory of images, such as an event directory
+    written by the cSBC, in the order of the number in their file name. When the
+    directory holds a "timestamps.txt" file with one timestamp in seconds per
+    frame, listed in ascending file number order, the original timing is
+    reproduced. Otherwise frames are delivered at the configured frame rate.
+
+    Attributes
+    ----------
+    paths : list
+        paths of the frames in replay order.
+    timestamps : list or None
+        recorded timestamps of the frames, None when replaying at a fixed rate.
+    frame_id : int
+        id of the last frame returned by read().
+    timestamp : int
+        time of the last frame since the start of the recording in nanoseconds.
+    """
+
+    def __init__(self, path, fps=8, loop=True, reverse=False, preload=False):
+        """
+        Parameters
+        ----------
+        path : str
+            directory containing the recorded frames.
+        fps : float
+            frame rate to replay at when no timestamps are recorded.
+        loop : bool
+            start again from the first frame after the last one.
+        reverse : bool
+            replay in descending file number, event directories store the
+            newest frame as img_0.
+        preload : bool
+            decode every frame up front so decoding does not limit the rate.
+        """
+        self.paths = self._list_frames(path, reverse)
+        if not self.paths:
+            raise ValueError(f"No frames to replay in {path}")
+        self.timestamps = self._load_timestamps(path, reverse)
+        self.loop = loop
+        self._cache = [self._decode(p) for p in self.paths] if preload else None
+
+        first = self._cache[0] if preload else self._decode(self.paths[0])
+        self.index = path
+        self.height, self.width = first.shape[:2]
+        self.bit_depth = 8 if first.dtype == np.uint8 else 16
+        self.frame_id = -1
+        self.timestamp = -1
+        self._props = self._default_props(fps)
+        self._start = None
+        self._opened = True
+
+    @staticmethod
+    def _list_frames(path, reverse):
+        codec = _codec()
+        exts = IMAGE_EXTS + ((codec.RAW_EXT,) if codec is not None else ())
+        names = [n for n in os.listdir(path) if n.lower().endswith(exts)]
+
+        def frame_number(name):
+            digits = re.findall(r"\d+", name)
+            return (int(digits[-1]) if digits else -1, name)
+
+        names.sort(key=frame_number, reverse=reverse)
+        return [os.path.join(path, n) for n in names]
+
+    def _load_timestamps(self, path, reverse):
+        ts_path = os.path.join(path, "timestamps.txt")
+        if not os.path.exists(ts_path):
+            return None
+        with open(ts_path) as f:
+            timestamps = [float(line) for line in f if line.strip()]
+        if len(timestamps) != len(self.paths):
+            return None
+        return timestamps[::-1] if reverse else timestamps
+
+    @staticmethod
+    def _decode(path):
+        codec = _codec()
+        if codec is None:
+            return cv2.imread(path, cv2.IMREAD_UNCHANGED)
+        return codec.readImage(path)
+
+    def _frame_time(self, frame_id):
+        # offset of frame_id from the start of the replay in seconds
+        count = len(self.paths)
+        if self.timestamps is None:
+            return frame_id / self._props[cv2.CAP_PROP_FPS]
+        span = self.timestamps[-1] - self.timestamps[0]
+        # keep the average spacing between the last and first frame of a loop
+        gap = span / (count - 1) if count > 1 else 0.0
+        lap, pos = divmod(frame_id, count)
+        return lap * (span + gap) + self.timestamps[pos] - self.timestamps[0]
+
+    def _wait_for_frame(self):
+        now = time.monotonic()
+        if self._start is None:
+            self._start = now
+        frame_id = self.frame_id + 1
+        delay = self._start + self._frame_time(frame_id) - now
+        if delay > 0:
+            time.sleep(delay)
+        return frame_id
+
+    def read(self):
+        """
+        returns the next recorded frame.
+
+        Returns
+        -------
+        retval : bool
+            false if no frames has been grabbed or the replay has ended.
+        image : array_like
+            grabbed image is returned here. If no image has been grabbed the image will be None.
+        """
+        if not self._opened:
+            return False, None
+        if not self.loop and self.frame_id + 1 >= len(self.paths):
+            return False, None
+        self.frame_id = self._wait_for_frame()
+        self.timestamp = int(self._frame_time(self.frame_id) * 1e9)
+        pos = self.frame_id % len(self.paths)
+        if self._cache is not None:
+            return True, self._cache[pos]
+        frame = self._decode(self.paths[pos])
+        return frame is not None, frame
+
+    def read_into(self, out):
+        """
+        returns the next recorded frame, copied into out.
+
+        Parameters
+        ----------
+        out : numpy.ndarray
+            array of the frame's shape and type, or a contiguous buffer of at
+            least as many bytes as the frame, such as a FrameRing slot.
+
+        Returns
+        -------
+        retval : bool
+            false if no frames has been grabbed or the replay has ended.
+        image : array_like
+            view of out holding the grabbed image. If no image has been grabbed the image will be None.
+        """
+        success, frame = self.read()
+        if not success:
+            return False, None
+        image = frame_view(out, frame.shape, frame.dtype)
+        np.copyto(image, frame)
+        return True, image
+
+
+def create_capture(index=0, backend="flir", **kwargs):
+    """
+    Opens a capture device for the selected backend.
+
+    Parameters
+    ----------
+    index : int or str
+        id or serial number of the camera, or the frame directory for "replay".
+    backend : str
+        "flir" for a Spinnaker camera, "simulated" for synthesized frames or
+        "replay" for recorded frames.
+    **kwargs
+        passed on to the backend's constructor.
+
+    Returns
+    -------
+    cap : VideoCapture or SimulatedCapture or ReplayCapture
+        the opened capture device.
+    """
+    if backend == "flir":
+        # imported here so the other backends work without the Spinnaker SDK
+        from .EasyPySpin import VideoCapture
+
+        return VideoCapture(index)
+    if backend == "simulated":
+        return SimulatedCapture(index, **kwargs)
+    if backend == "replay":
+        return ReplayCapture(index, **kwargs)
+    raise ValueError(f"Unknown capture backend {backend}")
@@ -1 +1,9 @@
-from .EasyPySpin import VideoCapture
+from .SimulatedCapture import SimulatedCapture, ReplayCapture, create_capture
+from .FramePool import FramePool, frame_view
+
+try:
+    from .EasyPySpin import VideoCapture
+except ImportError:
+    # PySpin is only installed alongside the Spinnaker SDK, the simulated and
+    # replay backends still work without it
+    VideoCapture = None
@@ -18,22 +18,76 @@ found in ./logs/cSBC.log.
 
 import os
 import cv2
+import json
 import time
 import socket
 import shutil
+import asyncio
 import logging
 import datetime
+import threading
 import EasyPySpin
+import numpy as np
 import multiprocessing as mp
-from collections import deque
+from pipeline import protocol, trace
+from pipeline.control import ControlState, STATE_NAMES
+from pipeline.frame_ring import FrameRing
+from pipeline.manifest import (
+    buildManifest,
+    encodeManifest,
+    missingFrames,
+    MANIFEST_NAME,
+)
+from pipeline.codec import getCodec
+from pipeline.encoder import EncoderPool, FlushEncoder
+from pipeline.preview import PreviewBuilder, productPath
+from pipeline.stats import CaptureStats, ProcessStats
+from pipeline.logpipe import (
+    startLogging,
+    logEvent,
+    FRAME,
+    FRAME_INCOMPLETE,
+    FRAME_DROPPED,
+    EVENT_HANDOFF,
+    EVENT_WRITTEN,
+    EVENT_FAILED,
+)
+from pipeline.dedup import signature, findDuplicates
+from pipeline.writer import DiskWriter, makeReport, FSYNC_NONE, FSYNC_FILE
+from pipeline.event_container import (
+    ContainerWriter,
+    CONTAINER_NAME,
+    RAW_CODEC,
+)
 
 # import constants for this file
 from config.cSBC_config import *
 
+# Commands that wait for the capture process or the disk and run off the
+# asyncio event loop, TRACE since dumping every ring of spans takes seconds
+BLOCKING_COMMANDS = {protocol.EVENT, protocol.PREVIEW, protocol.TRACE}
+# Codec the frames of an event are stored with
+CODEC = getCodec(IMG_CODEC)
+# Camera properties logged when a camera is opened, by their names in the log
+CAMERA_PROPERTIES = {
+    cv2.CAP_PROP_EXPOSURE: "Exposure",
+    cv2.CAP_PROP_GAIN: "Gain",
+    cv2.CAP_PROP_BRIGHTNESS: "Brightness",
+    cv2.CAP_PROP_GAMMA: "Gamma",
+    cv2.CAP_PROP_FPS: "FPS",
+    cv2.CAP_PROP_BACKLIGHT: "Backlight",
+    cv2.CAP_PROP_FRAME_WIDTH: "Frame Width",
+    cv2.CAP_PROP_FRAME_HEIGHT: "Frame Height",
+    cv2.CAP_PROP_TEMPERATURE: "Temperature",
+}
+
 
 def createLogger():
     """Create and sets the basic configuration for the logger for this SBC.
 
+    Starts the log writer process, every process started afterwards logs
+    through it.
+
     Parameters
     ----------
     None
@@ -42,28 +96,56 @@ def createLogger():
     -------
     logger
         Returns a logger with the specified name.
+    logWriter
+        Returns the log writer, to be closed once every other process exited.
 
     Raises
     ------
     None
     
     """
-    logging.basicConfig(
-        filename=LOG_FILE,
-        filemode=FILEMODE,
-        format=MESSAGE_FORMAT,
-        datefmt=DATE_FORMAT,
-        level=logging.DEBUG,
+    logWriter = startLogging(
+        LOG_FILE,
+        MESSAGE_FORMAT,
+        DATE_FORMAT,
+        level=getattr(logging, LOG_LEVEL),
+        fresh=FILEMODE == "w",
+        maxBytes=LOG_MAX_BYTES,
+        backups=LOG_BACKUPS,
+        queueSize=LOG_QUEUE_SIZE,
+        rateInterval=LOG_RATE_INTERVAL,
+        rateBurst=LOG_BURST,
+        eventsPath=EVENT_LOG,
     )
-    return logging.getLogger(LOGGER_NAME)
+    return logging.getLogger(LOGGER_NAME), logWriter
+
+
+def cameraName(camera):
+    """Returns the name of a camera in CAMERAS used for its logs and directories."""
+    return "cam_" + os.path.basename(str(CAMERAS[camera]).rstrip(os.sep))
+
+
+def eventPath(eventTime, camera=0):
+    """Returns the directory a camera writes an event to, from the event's time."""
+    # get the event's datetime in iso format
+    dtime_str = datetime.datetime.fromtimestamp(eventTime).isoformat()
+    # create a path using the event's datetime, every camera writes the same
+    # event to its own directory within it
+    dtime_path = os.path.join(IMG_DIR, dtime_str)
+    if len(CAMERAS) > 1:
+        dtime_path = os.path.join(dtime_path, cameraName(camera))
+    return dtime_path
 
 
-def createDatetimePath():
-    """Helper function that creates a new directory based on the current time.
+def createDatetimePath(eventTime, camera=0):
+    """Helper function that creates a new directory based on the event's time.
 
     Parameters
     ----------
-    None
+    eventTime : float
+        The wall clock time the event was requested at.
+    camera : int
+        The camera writing to the directory.
 
     Returns
     -------
@@ -76,12 +158,9 @@ def createDatetimePath():
     None
     
     """
-    # get the current datetime in iso format
-    dtime_str = datetime.datetime.now().isoformat()
-    # create a path using the current datetime
-    dtime_path = os.path.join(IMG_DIR, dtime_str)
+    dtime_path = eventPath(eventTime, camera)
     # make a new directory using the new path
-    os.mkdir(dtime_path)
+    os.makedirs(dtime_path, exist_ok=True)
     return dtime_path
 
 
@@ -104,22 +183,19 @@ def logCameraProperties(cap, logger):
     None
     
     """
-    logger.debug(f"Camera Exposure: {cap.get(cv2.CAP_PROP_EXPOSURE)}")
-    logger.debug(f"Camera Gain: {cap.get(cv2.CAP_PROP_GAIN)}")
-    logger.debug(f"Camera Brightness: {cap.get(cv2.CAP_PROP_BRIGHTNESS)}")
-    logger.debug(f"Camera Gamma: {cap.get(cv2.CAP_PROP_GAMMA)}")
-    logger.debug(f"Camera FPS: {cap.get(cv2.CAP_PROP_FPS)}")
-    logger.debug(f"Camera Backlight: {cap.get(cv2.CAP_PROP_BACKLIGHT)}")
-    logger.debug(f"Camera Frame Width: {cap.get(cv2.CAP_PROP_FRAME_WIDTH)}")
-    logger.debug(f"Camera Frame Height: {cap.get(cv2.CAP_PROP_FRAME_HEIGHT)}")
-    logger.debug(f"Camera Temperature: {cap.get(cv2.CAP_PROP_TEMPERATURE)}")
-
-
-def initializeCamera(logger):
+    # read in one pass, the image size is cached by the camera wrapper
+    values = cap.get_many(CAMERA_PROPERTIES)
+    for propId, name in CAMERA_PROPERTIES.items():
+        logger.debug(f"Camera {name}: {values[propId]}")
+
+
+def initializeCamera(camera, logger):
     """Initalizes camera object with the correct settings.
     
     Parameters
     ----------
+    camera : int
+        The camera in CAMERAS to open.
     logger : logging
         The logger for the cSBC.
 
@@ -133,36 +209,473 @@ def initializeCamera(logger):
     None
     
     """
-    # create the camera reference
-    cap = EasyPySpin.VideoCapture(0)
+    # create the camera reference for the configured backend
+    cap = EasyPySpin.create_capture(
+        CAMERAS[camera], CAMERA_BACKEND, **CAMERA_OPTIONS[CAMERA_BACKEND]
+    )
     logger.debug(f"Created {cap}")
 
-    # set the camera settings
-    cap.set(cv2.CAP_PROP_EXPOSURE, EXPOSURE)
-    cap.set(cv2.CAP_PROP_GAIN, GAIN)
-    cap.set(cv2.CAP_PROP_BRIGHTNESS, BRIGHTNESS)
-    cap.set(cv2.CAP_PROP_GAMMA, GAMMA)
-    cap.set(cv2.CAP_PROP_FPS, FPS)
-    cap.set(cv2.CAP_PROP_BACKLIGHT, BACKLIGHT)
+    # set the camera settings as one profile
+    settings = {
+        cv2.CAP_PROP_EXPOSURE: EXPOSURE,
+        cv2.CAP_PROP_GAIN: GAIN,
+        cv2.CAP_PROP_BRIGHTNESS: BRIGHTNESS,
+        cv2.CAP_PROP_GAMMA: GAMMA,
+        cv2.CAP_PROP_FPS: FPS,
+        cv2.CAP_PROP_BACKLIGHT: BACKLIGHT,
+    }
+    for propId, ok in cap.set_many(settings).items():
+        if not ok:
+            logger.warning(f"Camera {CAMERA_PROPERTIES[propId]} could not be set.")
 
     # log the properties
     logCameraProperties(cap, logger)
     return cap
 
 
-def writeImages(rollBuf, diskImages, logger):
-    """Write images from rolling buffer to disk.
+def pinCaptureCore(camera, logger):
+    """Pins a camera's capture process to its own core.
+    
+    Worker processes started before this keep every core, so only the capture
+    loop and the threads it starts afterwards are pinned.
+    
+    Parameters
+    ----------
+    camera : int
+        The camera in CAMERAS captured by this process.
+    logger : logging
+        The logger for the cSBC.
+
+    Returns
+    -------
+    None
+
+    Raises
+    ------
+    None
+    
+    """
+    if CAPTURE_CORES == [] or not hasattr(os, "sched_setaffinity"):
+        return
+    if CAPTURE_CORES is None:
+        # the next free core in turn
+        cores = sorted(os.sched_getaffinity(0))
+        core = cores[camera % len(cores)]
+    else:
+        core = CAPTURE_CORES[camera % len(CAPTURE_CORES)]
+    os.sched_setaffinity(0, {core})
+    logger.debug(f"Pinned capture process to core {core}.")
+
+
+def createRollingBuffer(frame, logger):
+    """Creates the shared memory rolling buffer sized for the camera's frames.
+    
+    Parameters
+    ----------
+    frame : numpy.ndarray
+        A raw frame from the camera used to size the buffer's slots.
+    logger : logging
+        The logger for the cSBC.
+
+    Returns
+    -------
+    rollBuf
+        Returns a FrameRing with ROLL_BUF_SIZE slots, or in lazy mode with as
+        many raw frames as fit in half of RAW_BUF_BUDGET, since there are two
+        rolling buffers.
+
+    Raises
+    ------
+    None
+    
+    """
+    if LAZY_ENCODE:
+        # raw frames are a fixed size so the budget gives the depth directly
+        numSlots = max(1, RAW_BUF_BUDGET // 2 // frame.nbytes)
+        slotSize = frame.nbytes
+    else:
+        # an encoded frame that does not compress can be slightly larger than
+        # the raw frame, so leave room for the codec's own overhead
+        numSlots = ROLL_BUF_SIZE
+        slotSize = frame.nbytes + frame.nbytes // 100 + 4096
+    rollBuf = FrameRing(numSlots, slotSize)
+    logger.debug(
+        f"Created rolling buffer {rollBuf.name} of {numSlots} slots of {slotSize} bytes."
+    )
+    return rollBuf
+
+
+def createEncoder(frame, stats, logger):
+    """Starts the pool of processes that encode images off the capture loop.
+    
+    Parameters
+    ----------
+    frame : numpy.ndarray
+        A raw frame from the camera used to size the pool's staging slots.
+    stats : CaptureStats
+        The statistics of the capture process.
+    logger : logging
+        The logger for the cSBC.
+
+    Returns
+    -------
+    encoder
+        Returns an EncoderPool, or None if ENCODER_WORKERS is 0 and images are
+        encoded in the capture loop or in lazy mode.
+
+    Raises
+    ------
+    None
+    
+    """
+    if LAZY_ENCODE:
+        logger.debug("Keeping raw frames, images are encoded when written.")
+        return None
+    if ENCODER_WORKERS <= 0:
+        logger.debug("Encoding images in the capture loop.")
+        return None
+    encoder = EncoderPool(frame, CODEC, ENCODER_WORKERS, ENCODER_QUEUE_DEPTH, stats)
+    logger.debug(
+        f"Started {ENCODER_WORKERS} encoder workers with {ENCODER_QUEUE_DEPTH} staging slots."
+    )
+    return encoder
+
+
+def createFlushEncoder(rollBufs, frame, logger):
+    """Starts the processes that encode raw frames when an event is written.
+    
+    Parameters
+    ----------
+    rollBufs : list
+        The rings holding the raw frames.
+    frame : numpy.ndarray
+        A raw frame from the camera, giving the shape and type of the frames.
+    logger : logging
+        The logger for the cSBC.
+
+    Returns
+    -------
+    flushEncoder
+        Returns a FlushEncoder in lazy mode, else None.
+
+    Raises
+    ------
+    None
+    
+    """
+    if not LAZY_ENCODE:
+        return None
+    flushEncoder = FlushEncoder(
+        rollBufs,
+        frame,
+        CODEC,
+        FLUSH_WORKERS,
+        fsync=WRITER_DURABILITY == FSYNC_FILE,
+        preallocate=WRITER_PREALLOCATE,
+    )
+    logger.debug(f"Started {flushEncoder.numWorkers} flush encoder workers.")
+    return flushEncoder
+
+
+def createPreviewBuilder(logger):
+    """Starts the low priority process that builds the previews of events.
+    
+    Parameters
+    ----------
+    logger : logging
+        The logger for the cSBC.
+
+    Returns
+    -------
+    previews
+        Returns a PreviewBuilder, or None if PREVIEWS is off.
+
+    Raises
+    ------
+    None
+    
+    """
+    if not PREVIEWS:
+        return None
+    settings = {
+        "budgets": PREVIEW_BUDGETS,
+        "thumbnails": PREVIEW_THUMBNAILS,
+        "thumbnailWidth": PREVIEW_THUMBNAIL_WIDTH,
+        "sheetFrames": PREVIEW_SHEET_FRAMES,
+        "tileWidth": PREVIEW_TILE_WIDTH,
+        "clipStep": PREVIEW_CLIP_STEP,
+        "clipWidth": PREVIEW_CLIP_WIDTH,
+    }
+    previews = PreviewBuilder(settings, logger)
+    logger.debug(f"Started preview builder with budgets {PREVIEW_BUDGETS}.")
+    return previews
+
+
+def reportEncoder(encoder, reported, logger):
+    """Logs dropped frames and encode lag when the encoder pool falls behind.
+    
+    Parameters
+    ----------
+    encoder : EncoderPool
+        The pool encoding images for the rolling buffer.
+    reported : dict
+        The number of drops already reported and the time of the last report,
+        updated in place.
+    logger : logging
+        The logger for the cSBC.
+
+    Returns
+    -------
+    None
+
+    Raises
+    ------
+    None
+    
+    """
+    now = time.time()
+    if encoder.dropped == reported["dropped"]:
+        return
+    if now - reported["time"] < ENCODER_REPORT_INTERVAL:
+        return
+    logger.warning(
+        f"Encoder pool behind: dropped {encoder.dropped - reported['dropped']} "
+        f"frames ({encoder.dropped} in total), encode lag {encoder.lag:.3f} s "
+        f"(max {encoder.maxLag:.3f} s), last encode took "
+        f"{encoder.encodeSeconds:.3f} s, {encoder.restarts} dead workers replaced."
+    )
+    reported["dropped"], reported["time"] = encoder.dropped, now
+
+
+def storeImage(rollBuf, img, info, logger, stats=None):
+    """Copies an encoded image into the rolling buffer.
+    
+    Parameters
+    ----------
+    rollBuf : FrameRing
+        The ring that contains all the current images saved in memory.
+    img : numpy.ndarray
+        The encoded image.
+    info : tuple
+        The (timestamp, monotonic, frameId, cameraTimestamp, signature) of the
+        frame.
+    logger : logging
+        The logger for the cSBC.
+    stats : CaptureStats
+        Counts the images dropped, None for none.
+
+    Returns
+    -------
+    None
+
+    Raises
+    ------
+    None
+    
+    """
+    with trace.span("store", info[2]):
+        stored = rollBuf.write(img, *info)
+    if stored < 0:
+        logger.warning(f"Dropped {img.size} byte image larger than a slot.")
+        if stats is not None:
+            stats.count("ring_dropped")
+
+
+def writeContainer(rollBuf, seqs, refs, dtime_path, writer, flushEncoder=None):
+    """Write images from rolling buffer to a single event container file.
+    
+    Parameters
+    ----------
+    rollBuf : FrameRing
+        The ring that contains all the current images saved in memory at this 
+        time.
+    seqs : list
+        The sequence numbers of the event's frames, oldest first.
+    refs : list
+        The frame each frame duplicates, -1 for the frames to write.
+    dtime_path : str
+        The event directory to create the container in.
+    writer : DiskWriter
+        Gives the durability to write the container with.
+    flushEncoder : FlushEncoder
+        Encodes the frames in parallel when the ring holds raw frames, None
+        when it holds encoded images.
+
+    Returns
+    -------
+    report
+        Returns the files, bytes, seconds and megabytes per second of the
+        write.
+    manifest
+        Returns the metadata of every frame, see pipeline/manifest.py.
+
+    Raises
+    ------
+    None
+    
+    """
+    startTime = time.perf_counter()
+    # frames skipped as duplicates are only listed in the manifest
+    kept = [seq for seq, ref in zip(seqs, refs) if ref < 0]
+    sizes = dict.fromkeys(seqs, -1)
+    codec = CODEC.name
+    path = os.path.join(dtime_path, CONTAINER_NAME)
+    with ContainerWriter(path, fsync=writer.durability != FSYNC_NONE) as container:
+        # in lazy mode store the raw frames as they are so they can be mapped
+        if flushEncoder is not None and CONTAINER_RAW:
+            codec = RAW_CODEC
+            container.setRawFormat(flushEncoder.shape, flushEncoder.dtype)
+            images = (rollBuf.view(seq) for seq in kept)
+        # or encode the raw frames on every core
+        elif flushEncoder is not None:
+            images = flushEncoder.encodeToBytes(rollBuf, kept)
+        else:
+            images = (rollBuf.view(seq) for seq in kept)
+        for seq, img in zip(kept, images):
+            if img is None:
+                continue
+            timestamp = float(rollBuf.meta["timestamp"][seq % rollBuf.numSlots])
+            container.append(img, codec, seq, timestamp)
+            sizes[seq] = img.nbytes
+        numFrames = len(container)
+    seconds = time.perf_counter() - startTime
+    report = makeReport(numFrames, container.nbytes, seconds)
+    sizes = [sizes[seq] for seq in seqs]
+    return report, buildManifest(rollBuf, seqs, sizes, refs)
+
+
+def writeManifest(manifest, dtime_path, writer, logger):
+    """Writes the metadata of an event's frames next to its images.
+    
+    Parameters
+    ----------
+    manifest : numpy.ndarray
+        The metadata of every frame, see pipeline/manifest.py.
+    dtime_path : str
+        The event directory.
+    writer : DiskWriter
+        Writes the manifest with the configured durability.
+    logger : logging
+        The logger for the cSBC.
+
+    Returns
+    -------
+    None
+
+    Raises
+    ------
+    None
+    
+    """
+    with trace.span("manifest"):
+        writer.writeFiles(dtime_path, [(MANIFEST_NAME, encodeManifest(manifest))])
+    missing = missingFrames(manifest)
+    if missing:
+        logger.warning(f"Event at {dtime_path} is missing {missing} camera frames.")
+
+
+def selectFrames(rollBuf, window, logger):
+    """Finds the frames of the rolling buffer captured within an event's window.
+    
+    Parameters
+    ----------
+    rollBuf : FrameRing
+        The ring handed off for the event.
+    window : tuple
+        The (start, end) wall clock times of the event's window.
+    logger : logging
+        The logger for the cSBC.
+
+    Returns
+    -------
+    list
+        Returns the sequence numbers of the frames in the window, oldest first.
+
+    Raises
+    ------
+    None
+    
+    """
+    start, end = window
+    seqs = rollBuf.between(start, end)
+    # the ring only reaches back ROLL_BUF_SIZE frames, or to the last handoff
+    # of this ring when events follow each other closely
+    oldest = rollBuf.oldest()
+    if oldest < rollBuf.head:
+        first = float(rollBuf.meta["timestamp"][oldest % rollBuf.numSlots])
+        if first > start:
+            logger.warning(
+                f"Rolling buffer starts {first - start:.3f} seconds after the "
+                f"start of the event's window."
+            )
+    logger.debug(
+        f"Selected {len(seqs)} of {rollBuf.head - oldest} frames captured within "
+        f"the {end - start:.3f} second event window."
+    )
+    return seqs
+
+
+def markDuplicates(rollBuf, seqs, logger):
+    """Finds the frames of an event that barely differ from the last one kept.
+    
+    Parameters
+    ----------
+    rollBuf : FrameRing
+        The ring handed off for the event.
+    seqs : list
+        The sequence numbers of the event's frames, oldest first.
+    logger : logging
+        The logger for the cSBC.
+
+    Returns
+    -------
+    list
+        Returns for every frame the sequence number of the kept frame it
+        duplicates, or -1 if it is written, all -1 when DEDUP is off.
+
+    Raises
+    ------
+    None
+    
+    """
+    if not DEDUP or not seqs:
+        return [-1] * len(seqs)
+    startTime = time.perf_counter()
+    signatures = rollBuf.meta["signature"][np.asarray(seqs) % rollBuf.numSlots]
+    refs = findDuplicates(signatures, DEDUP_THRESHOLD, DEDUP_MAX_RUN)
+    refs = [seqs[ref] if ref >= 0 else -1 for ref in refs.tolist()]
+    skipped = sum(ref >= 0 for ref in refs)
+    logger.debug(
+        f"Skipping {skipped} of {len(seqs)} frames as near duplicates, compared in "
+        f"{time.perf_counter() - startTime:.6f} seconds."
+    )
+    return refs
+
+
+def writeImages(
+    rollBuf, dtime_path, window, diskImages, logger, writer, flushEncoder=None
+):
+    """Write the images of an event's window from rolling buffer to disk.
     
     Parameters
     ----------
-    rollBuf : deque
-        The deque that contains all the current images saved in memory at this 
+    rollBuf : FrameRing
+        The ring that contains all the current images saved in memory at this 
         time.
+    dtime_path : str
+        The event directory to write the images to.
+    window : tuple
+        The (start, end) wall clock times of the frames to write.
     diskImages : int
         The shared multiprocessing variable to track the total number of images
         captured
     logger : logging
         The logger for the cSBC.
+    writer : DiskWriter
+        Writes the images in parallel with the configured durability.
+    flushEncoder : FlushEncoder
+        Encodes and writes the frames in parallel when the ring holds raw
+        frames, None when it holds encoded images.
 
     Returns
     -------
@@ -175,39 +688,173 @@ def writeImages(rollBuf, diskImages, logger):
     
     """
     try:
-        # number images in order
-        num_captured = 0
-        # create new dir to store images for this event
-        dtime_path = createDatetimePath()
+        startTime = time.perf_counter()
+        # only the frames captured within the window, oldest first
+        with trace.span("select"):
+            seqs = selectFrames(rollBuf, window, logger)
+            refs = markDuplicates(rollBuf, seqs, logger)
+
+        # store the whole event in one file
+        if EVENT_FORMAT == CONTAINER_FORMAT:
+            with trace.span("write"):
+                report, manifest = writeContainer(
+                    rollBuf, seqs, refs, dtime_path, writer, flushEncoder
+                )
+            writeManifest(manifest, dtime_path, writer, logger)
+            with diskImages.get_lock():
+                diskImages.value += report["files"]
+            logger.debug(
+                f"Wrote {report['files']} images ({report['bytes'] / 1e6:.1f} MB) to "
+                f"{CONTAINER_NAME} at {dtime_path} in {report['seconds']:.3f} seconds, "
+                f"{report['mbps']:.1f} MB/s."
+            )
+            return report["files"]
+
+        # reverse the frames to get last image captured first
+        seqs.reverse()
+        refs.reverse()
+        names = [f"img_{i}" + CODEC.ext for i in range(len(seqs))]
+        # frames skipped as duplicates keep their name but are not written
+        kept = [(seq, name) for seq, name, ref in zip(seqs, names, refs) if ref < 0]
+        sizes = dict.fromkeys(seqs, -1)
 
-        # reverse rolling buffer to get last image captured first and write to disk
-        for img in list(reversed(rollBuf)):
-            img_str = f"img_{num_captured}" + IMG_TYPE
-            img.tofile(os.path.join(dtime_path, img_str))
-            # increment counters and log write
-            diskImages.value += 1
-            num_captured += 1
+        # in lazy mode encode the raw frames and write them on every core
+        if flushEncoder is not None:
+            keptSeqs = [seq for seq, name in kept]
+            paths = [os.path.join(dtime_path, name) for seq, name in kept]
+            with trace.span("write"):
+                keptSizes = flushEncoder.encodeToFiles(rollBuf, keptSeqs, paths)
+                sizes.update(zip(keptSeqs, keptSizes))
+                written = [path for path, size in zip(paths, keptSizes) if size >= 0]
+                writer.syncFiles(dtime_path, written)
+            report = makeReport(
+                len(written),
+                sum(size for size in keptSizes if size >= 0),
+                time.perf_counter() - startTime,
+            )
+        # write the encoded images straight from the rolling buffer's slots
+        else:
+            items = []
+            for seq, name in kept:
+                img = rollBuf.view(seq)
+                if img is not None:
+                    sizes[seq] = img.size
+                    items.append((name, img))
+            with trace.span("write"):
+                report = writer.writeFiles(dtime_path, items)
+        sizes = [sizes[seq] for seq in seqs]
+        manifest = buildManifest(rollBuf, seqs, sizes, refs)
+        writeManifest(manifest, dtime_path, writer, logger)
 
-        logger.debug(f"Wrote {num_captured} images to disk at {dtime_path}.")
+        num_captured = report["files"]
+        with diskImages.get_lock():
+            diskImages.value += num_captured
+        logger.debug(
+            f"Wrote {num_captured} images ({report['bytes'] / 1e6:.1f} MB) to disk at "
+            f"{dtime_path} in {report['seconds']:.3f} seconds, {report['mbps']:.1f} MB/s."
+        )
         return num_captured
     except:
         logger.error("Exception occurred", exc_info=True)
 
 
-def captureImages(cameraStatus, eventStatus, diskImages, logger):
+def flushImages(
+    rollBuf,
+    control,
+    camera,
+    eventId,
+    diskImages,
+    logger,
+    writer,
+    flushEncoder=None,
+    previews=None,
+    stats=None,
+):
+    """Writes a rolling buffer to disk in the background and then clears it.
+    
+    Runs in its own thread while the capture loop keeps filling the other
+    rolling buffer, and marks the event as completed when done.
+    
+    Parameters
+    ----------
+    rollBuf : FrameRing
+        The ring handed off by the capture loop when the event was triggered.
+    control : ControlState
+        The state shared with the connection handler.
+    camera : int
+        The camera in CAMERAS whose frames are in the ring.
+    eventId : int
+        The number of the event being written.
+    diskImages : int
+        The shared multiprocessing variable to track the total number of images
+        captured
+    logger : logging
+        The logger for the cSBC.
+    writer : DiskWriter
+        Writes the images in parallel with the configured durability.
+    flushEncoder : FlushEncoder
+        Encodes the frames in lazy mode, else None.
+    previews : PreviewBuilder
+        Builds the event's previews once it is written, None for none.
+    stats : CaptureStats
+        Counts the event and records how long it took to write, None for none.
+
+    Returns
+    -------
+    None
+
+    Raises
+    ------
+    None
+    
+    """
+    num_captured = None
+    flushStart = time.perf_counter()
+    try:
+        logger.debug(f"Writing images to disk from {rollBuf.name}.")
+        # create new dir to store images for this event
+        dtime_path = createDatetimePath(control.eventTime(eventId), camera)
+        window = control.eventWindow(eventId)
+        num_captured = writeImages(
+            rollBuf, dtime_path, window, diskImages, logger, writer, flushEncoder
+        )
+        rollBuf.clear()
+        logger.debug(f"Cleared rolling buffer {rollBuf.name}.")
+        # in the background, once the frames are safely on disk
+        if previews is not None and num_captured is not None:
+            previews.submit(dtime_path)
+    except:
+        logger.error("Exception occurred", exc_info=True)
+    finally:
+        flushEnd = time.perf_counter()
+        seconds = flushEnd - flushStart
+        trace.record("flush", flushStart, flushEnd, eventId)
+        written = num_captured is not None
+        logEvent(EVENT_WRITTEN if written else EVENT_FAILED, camera, eventId, seconds)
+        if stats is not None:
+            stats.observe("write", seconds)
+            stats.count("events" if written else "events_failed")
+            stats.count("event_frames", num_captured or 0)
+        # wakes the connection handler waiting on this event
+        control.finishEvent(eventId, written, camera)
+
+
+def captureImages(control, camera, stats, diskImages, logger):
     """Handles initialization and command dispatch.
     
     Initialize camera, rolling buffer and receives messages for commands. Calls
     function to write images. It runs in a forever loop that will continually
     capture images in memory and then write them to disk when event occurs.
+    Every camera in CAMERAS runs this in its own process.
     
     Parameters
     ----------
-    cameraStatus : bool
-        The shared multiprocessing variable to track if the camera is running.
-    eventStatus : bool
-        The shared multiprocessing variable to track if an event command as 
-        been received.
+    control : ControlState
+        The state shared with the connection handler.
+    camera : int
+        The camera in CAMERAS to capture from.
+    stats : CaptureStats
+        The statistics of the capture process, read by STATS.
     diskImages : int
         The shared multiprocessing variable to track the total number of images
         captured
@@ -223,54 +870,438 @@ def captureImages(cameraStatus, eventStatus, diskImages, logger):
     None
     
     """
+    cap = None
+    rollBuf = spareBuf = encoder = flushEncoder = flusher = writer = None
+    previews = frames = None
+    # every camera's messages carry its name
+    logger = logger.getChild(cameraName(camera))
     try:
         # Create object to handle FLIR camera operations
-        cap = initializeCamera(logger)
+        cap = initializeCamera(camera, logger)
 
-        # Create rolling buffer for images
-        rollBuf = deque(maxlen=ROLL_BUF_SIZE)
-        logger.debug(f"Created {rollBuf}")
+        # Create the two rolling buffers and encoders, sized from the first frame
+        success, frame = cap.read()
+        rollBuf = createRollingBuffer(frame, logger)
+        spareBuf = createRollingBuffer(frame, logger)
+        encoder = createEncoder(frame, stats, logger)
+        flushEncoder = createFlushEncoder([rollBuf, spareBuf], frame, logger)
+        # frames are read into these buffers unless they go straight into the
+        # rolling buffer, so reading a frame never allocates one
+        if not LAZY_ENCODE:
+            frames = EasyPySpin.FramePool(frame.shape, frame.dtype)
+        writer = DiskWriter(WRITER_THREADS, WRITER_DURABILITY, WRITER_PREALLOCATE)
+        logger.debug(
+            f"Created disk writer with {WRITER_THREADS} threads and {WRITER_DURABILITY} durability."
+        )
+        previews = createPreviewBuilder(logger)
+        reported = {"dropped": 0, "time": 0.0}
+        # after the worker processes are started so they keep every core
+        pinCaptureCore(camera, logger)
 
         logger.debug(f"Capturing images.")
         while True:
-            # in standby read frame, encode image, append to rolling buffer
-            if cameraStatus.value and not eventStatus.value:
-                success, frame = cap.read()
-                result, img = cv2.imencode(IMG_TYPE, frame)
-                rollBuf.append(img)
-            # write images when event triggered
-            elif cameraStatus.value and eventStatus.value:
-                logger.debug(f"Writing images to disk.")
-                num_captured = writeImages(rollBuf, diskImages, logger)
-                rollBuf.clear()
-                logger.debug(f"Cleared rolling buffer.")
-                eventStatus.value = False
             # release the camera and exit
-            else:
+            if not control.isRunning():
+                control.acknowledge()
+                logger.debug(f"Shutdown acted on after {control.latency:.6f} seconds.")
                 break
+
+            # on an event hand the rolling buffer to a background writer and
+            # keep capturing into the spare one
+            eventId = control.startEvent(camera) if flusher is None else 0
+            if eventId:
+                handoffStart = time.perf_counter()
+                # the frames still being encoded belong to this event
+                if encoder is not None:
+                    for img, info in encoder.collect(wait=True):
+                        storeImage(rollBuf, img, info, logger, stats)
+                flusher = threading.Thread(
+                    target=flushImages,
+                    args=(
+                        rollBuf,
+                        control,
+                        camera,
+                        eventId,
+                        diskImages,
+                        logger,
+                        writer,
+                        flushEncoder,
+                        previews,
+                        stats,
+                    ),
+                )
+                flusher.start()
+                trace.record("handoff", handoffStart, time.perf_counter(), eventId)
+                stats.observe("handoff", control.latency)
+                logEvent(EVENT_HANDOFF, camera, eventId, control.latency)
+                rollBuf, spareBuf = spareBuf, rollBuf
+                logger.debug(
+                    f"Event {eventId} handed off {control.latency:.6f} seconds after "
+                    f"it was due, swapped to rolling buffer {rollBuf.name}."
+                )
+            # the spare buffer is free again once its flush has finished
+            if flusher is not None and not flusher.is_alive():
+                flusher.join()
+                flusher = None
+            # the frame rate, rolling buffer and queues about once a second
+            if stats.due():
+                stats.publish(
+                    rollBuf,
+                    encoder.inFlight() if encoder is not None else 0,
+                    previews.pending() if previews is not None else 0,
+                    flusher is not None,
+                )
+
+            # read frame, encode image, copy into rolling buffer. Raw frames
+            # are copied once from the camera into their rolling buffer slot,
+            # a failed read empties the slot, costing the oldest frame once full
+            with trace.span("read", camera):
+                if LAZY_ENCODE:
+                    seq, slot = rollBuf.reserve()
+                    success, frame = cap.read_into(slot)
+                else:
+                    success, frame = frames.read(cap)
+            if not success:
+                stats.count("incomplete")
+                logEvent(FRAME_INCOMPLETE, camera)
+                continue
+            stats.frame(cap.frame_id)
+            # host and camera times and the camera's id of the frame
+            info = (
+                time.time(),
+                time.monotonic(),
+                cap.frame_id,
+                cap.timestamp,
+                # a small grey copy to find near duplicates with when written
+                signature(frame) if DEDUP else None,
+            )
+            logEvent(FRAME, camera, info[2], info[0])
+            # keep the raw frame, it is only encoded if an event writes it
+            if LAZY_ENCODE:
+                rollBuf.commit(seq, frame.nbytes, *info)
+                stats.observe("capture_to_ring", time.time() - info[0])
+                continue
+            if encoder is None:
+                encodeStart = time.perf_counter()
+                img = CODEC.encode(frame)
+                encodeEnd = time.perf_counter()
+                stats.observe("encode", encodeEnd - encodeStart)
+                trace.record("encode", encodeStart, encodeEnd, info[2])
+                if img is not None:
+                    storeImage(rollBuf, img, info, logger, stats)
+                stats.observe("capture_to_ring", time.time() - info[0])
+                continue
+            # hand the frame to the pool and store whatever it finished
+            if not encoder.submit(frame, *info):
+                logEvent(FRAME_DROPPED, camera, info[2])
+            for img, info in encoder.collect():
+                storeImage(rollBuf, img, info, logger, stats)
+            reportEncoder(encoder, reported, logger)
     except:
         logger.error("Exception occurred", exc_info=True)
     # release the camera and exit
     finally:
-        cap.release()
-        logger.info("Successfully released camera.")
+        if cap is not None:
+            cap.release()
+            logger.info("Successfully released camera.")
+        if flusher is not None:
+            flusher.join()
+        # wake the connection handler if capture stopped on its own, and stop
+        # the other cameras since no event can be written without this one
+        control.shutdown()
+        if writer is not None:
+            writer.close()
+        if encoder is not None:
+            encoder.close()
+            logger.info("Stopped encoder workers.")
+        if flushEncoder is not None:
+            flushEncoder.close()
+            logger.info("Stopped flush encoder workers.")
+        if previews is not None:
+            previews.close()
+            logger.info("Stopped preview builder.")
+        for buf in (rollBuf, spareBuf):
+            if buf is not None:
+                buf.close()
+                logger.info(f"Freed rolling buffer {buf.name}.")
+
+
+def nameProcesses(cameras):
+    """Names the connection handler and capture processes in processStats.
+    
+    Parameters
+    ----------
+    cameras : dict
+        The statistics snapshot of every camera by name.
+
+    Returns
+    -------
+    dict
+        Returns the names of the processes known by id, the rest are named
+        after their parent.
+
+    Raises
+    ------
+    None
+    
+    """
+    processStats.names[os.getpid()] = "connection handler"
+    for name, snapshot in cameras.items():
+        if snapshot["pid"]:
+            processStats.names[snapshot["pid"]] = name
+    return processStats.names
+
+
+def dumpTrace(stats, logger):
+    """Writes the spans every process recorded as a Chrome trace.
+    
+    Parameters
+    ----------
+    stats : list
+        The CaptureStats of every camera, to name the capture processes.
+    logger : logging
+        The logger for the cSBC.
+
+    Returns
+    -------
+    str
+        Returns the path of the trace written.
+
+    Raises
+    ------
+    OSError
+        When the trace cannot be written.
+    
+    """
+    cameras = {
+        cameraName(camera): stats[camera].snapshot() for camera in range(len(stats))
+    }
+    names = nameProcesses(cameras)
+    stamp = datetime.datetime.now().strftime("%Y%m%dT%H%M%S")
+    path = os.path.join(TRACE_DIR, f"trace_{stamp}.json")
+    startTime = time.perf_counter()
+    spans = tracer.dump(path, names)
+    logger.info(
+        f"Dumped {spans} spans to {path} in {time.perf_counter() - startTime:.3f} "
+        f"seconds, {tracer.lost} spans lost to too many processes."
+    )
+    return path
+
+
+def collectStats(control, diskImages, stats):
+    """Gathers the statistics of the whole cSBC for the STATS command.
+    
+    Reads every camera's shared statistics and the CPU use and memory of
+    every process, without waiting for the capture processes.
+    
+    Parameters
+    ----------
+    control : ControlState
+        The state shared with the capture process.
+    diskImages : int
+        The shared multiprocessing variable to track the total number of images
+        captured
+    stats : list
+        The CaptureStats of every camera.
+
+    Returns
+    -------
+    dict
+        Returns the time, uptime, images written, event queue, every camera's
+        statistics by name and every process's CPU use and memory.
+
+    Raises
+    ------
+    None
+    
+    """
+    cameras = {
+        cameraName(camera): stats[camera].snapshot() for camera in range(len(stats))
+    }
+    nameProcesses(cameras)
+    waiting, unwritten = control.queued()
+    return {
+        "time": time.time(),
+        "uptime": time.time() - startTime,
+        "disk_images": diskImages.value,
+        "state": STATE_NAMES[control.state],
+        "events_waiting": waiting,
+        "events_unwritten": unwritten,
+        "cameras": cameras,
+        "processes": processStats.snapshot(),
+    }
+
+
+def performCommand(
+    requestId, command, payload, control, diskImages, stats, logger
+):
+    """Performs one command and changes system state.
+    
+    Parameters
+    ----------
+    requestId : int
+        The id of the request, echoed in the response.
+    command : int
+        The command code, see pipeline/protocol.py.
+    payload : bytes
+        The payload of the request, empty for the defaults.
+    control : ControlState
+        The state shared with the capture process.
+    diskImages : int
+        The shared multiprocessing variable to track the total number of images
+        captured
+    stats : list
+        The CaptureStats of every camera.
+    logger : logging
+        The logger for the cSBC.
+
+    Returns
+    -------
+    response
+        Returns the response frame to send to the mSBC.
+    shutdown
+        Returns True if the system has shutdown, else False.
+
+    Raises
+    ------
+    None
+    
+    """
+    commandStart = time.perf_counter()
+    try:
+        values = protocol.unpackRequest(command, payload)
+        logger.debug(
+            f"Recieved {protocol.COMMAND_NAMES.get(command, command)} {values} "
+            f"({requestId})."
+        )
+
+        # get uptime of the system
+        if command == protocol.UPTIME:
+            uptime = time.time() - startTime
+            logger.debug(f"The current uptime is {uptime:.6f} seconds.")
+            return protocol.packResponse(requestId, command, (uptime,)), False
+
+        # Triggers an event and by default doesn't respond till it is completed
+        elif command == protocol.EVENT:
+            defaults = (protocol.WAIT_WRITTEN, -1.0, -1.0, 0.0)
+            wait, pre, post, triggerTime = values or defaults
+            # negative durations and a zero trigger time take the defaults
+            pre = EVENT_PRE_TRIGGER if pre < 0 else pre
+            post = EVENT_DELAY if post < 0 else post
+            # the rolling buffer is handed off once the window has been
+            # captured, a trigger for an event that is not handed off yet
+            # follows the policy
+            eventId, result = control.triggerEvent(pre, post, triggerTime or None)
+            logger.debug(
+                f"Trigger {protocol.TRIGGER_NAMES[result]} as event {eventId} "
+                f"from {pre} seconds before to {post} seconds after."
+            )
+            state = protocol.EVENT_UNKNOWN
+            if eventId:
+                # sleep until the capture process has captured or written the
+                # event
+                captured = wait == protocol.WAIT_CAPTURED
+                with trace.span("wait", eventId):
+                    ready = not wait or control.waitForEvent(eventId, captured=captured)
+                if not ready:
+                    done = "captured" if captured else "written"
+                    logger.warning(f"Event {eventId} was not {done}.")
+                state, triggers = control.eventStatus(eventId)
+            response = (eventId, result, state)
+            return protocol.packResponse(requestId, command, response), False
+
+        # Reports the state of an event
+        elif command == protocol.EVENT_STATUS:
+            (eventId,) = values or (0,)
+            state, triggers = control.eventStatus(eventId)
+            response = (eventId, state, triggers)
+            return protocol.packResponse(requestId, command, response), False
+
+        # Sends a preview product of a written event
+        elif command == protocol.PREVIEW:
+            eventId, product, camera = values or (0, protocol.PREVIEW_CONTACT_SHEET, 0)
+            eventId = eventId or control.lastEvent()
+            state, triggers = control.eventStatus(eventId)
+            path = None
+            known = product in protocol.PRODUCT_NAMES and camera < len(CAMERAS)
+            if state == protocol.EVENT_WRITTEN and known:
+                name = protocol.PRODUCT_NAMES[product]
+                path = productPath(eventPath(control.eventTime(eventId), camera), name)
+            # the previews are built in the background, so may not exist yet
+            if path is None or not os.path.exists(path):
+                name = protocol.PRODUCT_NAMES.get(product, product)
+                logger.debug(f"No {name} preview of event {eventId} yet.")
+                return protocol.pack(requestId, protocol.NOT_FOUND), False
+            with open(path, "rb") as f:
+                data = f.read()
+            if len(data) + protocol.RESPONSES[command].size > protocol.MAX_PAYLOAD:
+                logger.error(f"Preview {path} of {len(data)} bytes is too large to send.")
+                return protocol.pack(requestId, protocol.ERROR), False
+            response = protocol.packResponse(
+                requestId, command, (eventId, product), data=data
+            )
+            return response, False
+
+        # Reports the counters, latencies and resources of the pipeline
+        elif command == protocol.STATS:
+            snapshot = collectStats(control, diskImages, stats)
+            data = json.dumps(snapshot, separators=(",", ":")).encode()
+            response = protocol.packResponse(
+                requestId, command, (snapshot["time"],), data=data
+            )
+            return response, False
+
+        # Switches tracing on or off, or writes the spans recorded to a file
+        elif command == protocol.TRACE:
+            (action,) = values or (protocol.TRACE_DUMP,)
+            path = ""
+            if action == protocol.TRACE_START:
+                tracer.enabled = True
+            elif action == protocol.TRACE_STOP:
+                tracer.enabled = False
+            elif action == protocol.TRACE_DUMP:
+                path = dumpTrace(stats, logger)
+            elif action != protocol.TRACE_STATUS:
+                logger.warning(f"Unknown trace action {action}.")
+                return protocol.pack(requestId, protocol.ERROR), False
+            spans = int((tracer.rings["end"] > 0).sum())
+            response = protocol.packResponse(
+                requestId, command, (tracer.enabled, spans), data=path.encode()
+            )
+            return response, False
+
+        # Shutsdown cSBC
+        elif command == protocol.SHUTDOWN:
+            control.shutdown()
+            response = protocol.packResponse(requestId, command, (diskImages.value,))
+            return response, True
+
+        logger.warning(f"Unknown command {command}.")
+        return protocol.pack(requestId, protocol.UNKNOWN_COMMAND), False
+    except:
+        logger.error("Exception occurred", exc_info=True)
+        return protocol.pack(requestId, protocol.ERROR), False
+    finally:
+        trace.record("command", commandStart, time.perf_counter(), command)
 
 
-def performCommand(conn, cameraStatus, eventStatus, diskImages, logger):
-    """Handle data transferred over connection and changes system state.
+def serveConnection(conn, control, diskImages, stats, logger):
+    """Answers every command sent over one connection until it closes.
+    
+    Requests may be pipelined, they are read from a buffered stream and
+    answered in the order they were sent.
     
     Parameters
     ----------
     conn: socket
         The connection to the mSBC.
-    cameraStatus : bool
-        The shared multiprocessing variable to track if the camera is running.
-    eventStatus : bool
-        The shared multiprocessing variable to track if an event command as 
-        been received.
+    control : ControlState
+        The state shared with the capture process.
     diskImages : int
         The shared multiprocessing variable to track the total number of images
         captured
+    stats : list
+        The CaptureStats of every camera.
     logger : logging
         The logger for the cSBC.
 
@@ -286,56 +1317,46 @@ def performCommand(conn, cameraStatus, eventStatus, diskImages, logger):
     """
     try:
         # open the connection to the client
-        with conn:
-            # receive the command
-            data = conn.recv(4096).decode("utf-8")
-            logger.debug(f"Recieved {data}.")
-
-            # get uptime of the system
-            if data == UPTIME:
-                uptime = round(time.time() - startTime, 6)
-                conn.sendall(UPTIME_RESP % uptime)
-                logger.debug(f"The current uptime is {uptime} seconds.")
-
-            # Triggers an event and doesn't continue function till even completed
-            elif data == EVENT:
-                # Wait for time for full event to complete
-                time.sleep(EVENT_DELAY)
-                eventStatus.value, cameraStatus.value = True, True
-                while eventStatus.value:
-                    continue
-                conn.sendall(EVENT_RESP)
-
-            # Shutsdown cSBC
-            elif data == SHUTDOWN:
-                eventStatus.value, cameraStatus.value = False, False
-                conn.sendall(SHUTDOWN_RESP % diskImages.value)
-                return True
-
+        with conn, conn.makefile("rb") as reader:
+            protocol.configureSocket(conn)
+            while True:
+                # receive the next command, None once the client disconnects
+                frame = protocol.readFrame(reader)
+                if frame is None:
+                    return False
+                requestId, command, payload = frame
+                response, shutdown = performCommand(
+                    requestId, command, payload, control, diskImages, stats, logger
+                )
+                conn.sendall(response)
+                if shutdown:
+                    return True
+    except (OSError, protocol.ProtocolError) as e:
+        logger.warning(f"Dropped connection: {e}")
         return False
     except:
         logger.error("Exception occurred", exc_info=True)
+        return False
 
 
-def connectionHandler(cameraStatus, eventStatus, diskImages, logger):
+def connectionHandler(control, diskImages, stats, logger):
     """Handles commands from mSBC and directs controls to do correct events.
     
-    In a forever loop it listens for a connection. When a connection is accepted
-    the socket is closed to any further connections and processes the data
-    received. Depending on the return value of the function to perform the
-    command received the loop will contine and listen for another connection
-    or terminate the forever loop.
+    Binds the server socket once and in a forever loop accepts a connection and
+    serves every command sent over it. Connections are persistent, the mSBC
+    keeps its connection open between commands. Depending on the return value
+    of the function serving the connection the loop will contine and accept
+    another connection or terminate the forever loop.
     
     Parameters
     ----------
-    cameraStatus : bool
-        The shared multiprocessing variable to track if the camera is running.
-    eventStatus : bool
-        The shared multiprocessing variable to track if an event command as 
-        been received.
+    control : ControlState
+        The state shared with the capture process.
     diskImages : int
         The shared multiprocessing variable to track the total number of images
         captured
+    stats : list
+        The CaptureStats of every camera.
     logger : logging
         The logger for the cSBC.
 
@@ -349,26 +1370,163 @@ def connectionHandler(cameraStatus, eventStatus, diskImages, logger):
     
     """
     try:
-        while True:
-            # open a socket for this server, bind to port and wait for connection
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-                s.bind((HOST, PORT))
-                s.listen(NUM_CONN)
-                logger.debug(f"Bound to {HOST}-{PORT} and listening.")
+        # open a socket for this server, bind to port and wait for connections
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            s.bind((HOST, PORT))
+            s.listen(NUM_CONN)
+            logger.debug(f"Bound to {HOST}-{PORT} and listening.")
 
+            while True:
                 # Establish connection with client.
                 conn, addr = s.accept()
-                # Closes socket to disallow for more connections
-                s.close()
-                logger.debug(
-                    f"Acccepted connection from {conn}-{addr} and closed server socket."
-                )
+                logger.debug(f"Acccepted connection from {addr}.")
 
                 # handle connection and break if shutdown received
-                if performCommand(conn, cameraStatus, eventStatus, diskImages, logger):
+                if serveConnection(conn, control, diskImages, stats, logger):
                     break
+                logger.debug(f"Connection from {addr} closed.")
+
+    except:
+        logger.error("Exception occurred", exc_info=True)
+
+
+async def handleClient(
+    reader, writer, control, diskImages, stats, logger, stopped
+):
+    """Serves every command sent over one connection of the asyncio server.
+    
+    Each command is answered as soon as it is done, so quick commands are
+    answered immediately while an EVENT from this or another connection is
+    still being written. Commands that block run on a thread of the event
+    loop's executor.
+    
+    Parameters
+    ----------
+    reader : asyncio.StreamReader
+        The reading side of the connection.
+    writer : asyncio.StreamWriter
+        The writing side of the connection.
+    control : ControlState
+        The state shared with the capture process.
+    diskImages : int
+        The shared multiprocessing variable to track the total number of images
+        captured
+    stats : list
+        The CaptureStats of every camera.
+    logger : logging
+        The logger for the cSBC.
+    stopped : asyncio.Event
+        Set when the SHUTDOWN command is received.
+
+    Returns
+    -------
+    None
+
+    Raises
+    ------
+    None
+    
+    """
+    addr = writer.get_extra_info("peername")
+    logger.debug(f"Acccepted connection from {addr}.")
+    protocol.configureSocket(writer.get_extra_info("socket"))
+    loop = asyncio.get_running_loop()
+    # responses finish out of order, so they take turns writing
+    lock = asyncio.Lock()
+    tasks = set()
+
+    async def respond(requestId, command, payload):
+        args = (requestId, command, payload, control, diskImages, stats, logger)
+        if command in BLOCKING_COMMANDS:
+            response, shutdown = await loop.run_in_executor(None, performCommand, *args)
+        else:
+            response, shutdown = performCommand(*args)
+        try:
+            async with lock:
+                writer.write(response)
+                await writer.drain()
+        except OSError as e:
+            logger.warning(f"Could not respond to {addr}: {e}")
+        if shutdown:
+            stopped.set()
+
+    try:
+        while True:
+            # receive the next command, None once the client disconnects
+            frame = await protocol.readFrameAsync(reader)
+            if frame is None:
+                break
+            requestId, command, payload = frame
+            task = asyncio.create_task(respond(requestId, command, payload))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        # finish the commands already received
+        await asyncio.gather(*tasks)
+        logger.debug(f"Connection from {addr} closed.")
+    except (OSError, protocol.ProtocolError) as e:
+        logger.warning(f"Dropped connection: {e}")
+    except asyncio.CancelledError:
+        pass
+    except:
+        logger.error("Exception occurred", exc_info=True)
+    finally:
+        writer.close()
+
+
+async def serve(control, diskImages, stats, logger):
+    """Runs the asyncio server until the SHUTDOWN command is received."""
+    stopped = asyncio.Event()
+    clients = set()
+
+    async def onConnect(reader, writer):
+        clients.add(writer)
+        try:
+            await handleClient(
+                reader, writer, control, diskImages, stats, logger, stopped
+            )
+        finally:
+            clients.discard(writer)
 
+    server = await asyncio.start_server(onConnect, HOST, PORT, reuse_address=True)
+    logger.debug(f"Bound to {HOST}-{PORT} and listening for many connections.")
+    async with server:
+        await stopped.wait()
+        # disconnect the remaining clients so the server can close
+        for writer in list(clients):
+            writer.close()
+
+
+def asyncConnectionHandler(control, diskImages, stats, logger):
+    """Handles commands from every client at once on an asyncio event loop.
+    
+    Unlike `connectionHandler()` the listening socket stays open and any number
+    of clients, such as the mSBC, monitors and transfer tools, are served
+    concurrently. The loop ends when any client sends the shutdown command.
+    
+    Parameters
+    ----------
+    control : ControlState
+        The state shared with the capture process.
+    diskImages : int
+        The shared multiprocessing variable to track the total number of images
+        captured
+    stats : list
+        The CaptureStats of every camera.
+    logger : logging
+        The logger for the cSBC.
+
+    Returns
+    -------
+    None
+
+    Raises
+    ------
+    None
+    
+    """
+    try:
+        asyncio.run(serve(control, diskImages, stats, logger))
     except:
         logger.error("Exception occurred", exc_info=True)
 
@@ -393,18 +1551,26 @@ if __name__ == "__main__":
     None
     
     """
+    logWriter = None
     try:
         # track start time
         global startTime
         startTime = time.time()
+        # CPU use and memory of this process and all its children
+        global processStats
+        processStats = ProcessStats(os.getpid(), {os.getpid(): "main"})
+        # spans of every pipeline stage, recorded while tracing is on
+        global tracer
+        tracer = trace.startTracing(TRACE_PROCESSES, TRACE_SPANS, TRACE_ENABLED)
 
-        # shared variable across processes
-        cameraStatus = mp.Value("i", True)
-        eventStatus = mp.Value("i", False)
+        # shared state and variables across processes
+        control = ControlState(EVENT_POLICY, EVENT_QUEUE_DEPTH, len(CAMERAS))
         diskImages = mp.Value("i", 0)
+        stats = [CaptureStats() for camera in CAMERAS]
 
-        # create logger
-        logger = createLogger()
+        # create logger, before any other process so they all log through it
+        logger, logWriter = createLogger()
+        processStats.names[logWriter.pid] = "log writer"
         logger.debug(f"Logger created for {__file__}.")
 
         # create new images directory each time cSBC starts up
@@ -416,23 +1582,38 @@ if __name__ == "__main__":
 
         # create a process with a target function
         p1 = mp.Process(
-            target=connectionHandler,
-            args=(cameraStatus, eventStatus, diskImages, logger,),
-        )
-        p2 = mp.Process(
-            target=captureImages, args=(cameraStatus, eventStatus, diskImages, logger,)
+            target=(
+                asyncConnectionHandler
+                if SERVER_MODE == ASYNC_SERVER
+                else connectionHandler
+            ),
+            args=(control, diskImages, stats, logger,),
         )
+        # one capture process per camera
+        captures = [
+            mp.Process(
+                target=captureImages,
+                args=(control, camera, stats[camera], diskImages, logger),
+            )
+            for camera in range(len(CAMERAS))
+        ]
 
         # start the process
         p1.start()
         logger.debug(f"{p1}.")
-        p2.start()
-        logger.debug(f"{p2}.")
+        for p2 in captures:
+            p2.start()
+            logger.debug(f"{p2}.")
 
         # Stops execution of current program until this process completes.
-        p2.join()
-        logger.debug(f"{p2}.")
+        for p2 in captures:
+            p2.join()
+            logger.debug(f"{p2}.")
         p1.join()
         logger.debug(f"{p1}.")
     except:
         logger.error("Exception occurred", exc_info=True)
+    finally:
+        # write the last messages of every process
+        if logWriter is not None:
+            logWriter.close()
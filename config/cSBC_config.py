@@ -11,14 +11,83 @@ Contains
 """
 
 ########### Camera constants ###########
-# Maximum number of images in rolling buffer at once
+# Maximum number of images in rolling buffer at once, there are two rolling
+# buffers so one can be written to disk while the other is filled
 ROLL_BUF_SIZE = 150
 # Location of image directory to save images
 IMG_DIR = "images"
-# Type of image to save to disk
-IMG_TYPE = ".png"
-# Amount of time in seconds to wait after event occurs
+# Codec the frames of an event are stored with: "png:<level>" (0-9),
+# "jpg:<quality>" (0-100), "raw", or "raw+zlib:<level>", "raw+lz4" and
+# "raw+zstd:<level>" for raw frames through a fast compressor; run
+# `python -m pipeline.codec images/<event>` to compare them on recorded frames
+IMG_CODEC = "png:1"
+# Keep raw frames in the rolling buffer and only encode the frames an event
+# writes, using every core while writing instead of encoding every frame
+LAZY_ENCODE = False
+# Memory in bytes for the two raw rolling buffers in lazy mode, which sets how
+# many frames each holds in place of ROLL_BUF_SIZE
+RAW_BUF_BUDGET = 512 * 1024 * 1024
+# Number of worker processes encoding an event in lazy mode, None for one per core
+FLUSH_WORKERS = None
+# Number of worker processes encoding images, 0 encodes in the capture loop
+ENCODER_WORKERS = 2
+# Number of raw frames that can wait for an encoder before frames are dropped
+ENCODER_QUEUE_DEPTH = 8
+# Minimum number of seconds between reports of frames dropped by the encoders
+ENCODER_REPORT_INTERVAL = 5
+# Number of threads writing an event's images to disk at once, run
+# `python -m pipeline.writer --dir images` to find the fastest for the storage
+WRITER_THREADS = 4
+# When images are flushed to storage: "none" leaves it to the operating system,
+# "event" once all images of an event are written, "file" after every image
+WRITER_DURABILITY = "none"
+# Reserve each image's full size on disk before writing it
+WRITER_PREALLOCATE = True
+# How events are stored: "images" writes one image file per frame, "container"
+# writes all frames of the event to one file, see pipeline/event_container.py
+IMAGES_FORMAT = "images"
+CONTAINER_FORMAT = "container"
+EVENT_FORMAT = IMAGES_FORMAT
+# In lazy mode, store raw frames in the container instead of encoding them, so
+# events are written faster and can be memory-mapped by MappedEvent
+CONTAINER_RAW = False
+# Amount of time in seconds to keep capturing after event occurs, used when an
+# EVENT does not give its own post-trigger duration
 EVENT_DELAY = 5
+# Amount of time in seconds before the event to write frames from, used when an
+# EVENT does not give its own pre-trigger duration; the rolling buffer only
+# holds ROLL_BUF_SIZE / FPS seconds of frames (18.75 s at 150 frames and 8 fps),
+# so keep EVENT_PRE_TRIGGER + EVENT_DELAY below that or the window is cut short
+EVENT_PRE_TRIGGER = 13
+# What to do with an EVENT that arrives before earlier events are written:
+# "coalesce" merges it into the event still waiting for its window to be
+# captured if their windows overlap, "queue" writes it as an event of its own
+# afterwards and "drop" refuses it
+EVENT_POLICY = "coalesce"
+# Most events that can be waiting or being written at once, more are refused
+EVENT_QUEUE_DEPTH = 4
+# Skip writing frames that barely differ from the last frame written, they are
+# still listed in the manifest, see pipeline/dedup.py
+DEDUP = False
+# Mean absolute difference in grey levels of two frames' small signatures
+# above which a frame is written
+DEDUP_THRESHOLD = 2.0
+# Most frames skipped in a row before one is written anyway, 0 for no limit
+DEDUP_MAX_RUN = 10
+# Build small preview products of every event in the background for the
+# downlink, see pipeline/preview.py
+PREVIEWS = True
+# Most bytes of each preview product, the frames are shrunk until it fits
+PREVIEW_BUDGETS = {"thumbnails": 48000, "sheet": 24000, "clip": 60000}
+# Number of thumbnails and their width in pixels before shrinking to fit
+PREVIEW_THUMBNAILS = 8
+PREVIEW_THUMBNAIL_WIDTH = 320
+# Number of frames in the contact sheet and the width of each tile
+PREVIEW_SHEET_FRAMES = 16
+PREVIEW_TILE_WIDTH = 160
+# The clip keeps every PREVIEW_CLIP_STEP-th frame at this width
+PREVIEW_CLIP_STEP = 4
+PREVIEW_CLIP_WIDTH = 160
 # Camera Settings
 EXPOSURE = 100000
 GAIN = 10
@@ -26,6 +95,22 @@ BRIGHTNESS = 10
 GAMMA = 0.25
 FPS = 8
 BACKLIGHT = 1
+# Camera backend: "flir" for the FLIR camera, "simulated" for synthesized frames
+# or "replay" for recorded frames, the last two need no camera attached
+CAMERA_BACKEND = "flir"
+# Every camera attached to this cSBC, by serial number (a str) or index, or the
+# directories of frames to replay; each camera runs its own capture process and
+# writes its frames to its own directory in an event when there are several
+CAMERAS = [0]
+# Core to pin each camera's capture process to, in the order of CAMERAS, None
+# to give each camera the next free core in turn or [] to leave it to the OS
+CAPTURE_CORES = None
+# Extra options for each backend, see EasyPySpin/SimulatedCapture.py
+CAMERA_OPTIONS = {
+    "flir": {},
+    "simulated": {"width": 1920, "height": 1200, "bit_depth": 8},
+    "replay": {"loop": True, "reverse": True},
+}
 
 
 ########### Server constants ###########
@@ -35,29 +120,52 @@ HOST = "0.0.0.0"
 PORT = 65431
 # number of connections that will be allowed to queue for this server
 NUM_CONN = 0
+# Server modes: "blocking" serves one connection at a time and answers its
+# commands in order, "asyncio" serves many connections at once and answers
+# quick commands immediately, even while an event is being written
+BLOCKING_SERVER = "blocking"
+ASYNC_SERVER = "asyncio"
+SERVER_MODE = ASYNC_SERVER
 
 
 ########### Logging Constants ###########
+# Every process logs through one log writer process, see pipeline/logpipe.py
 # Name of file to log to
 LOG_FILE = "logs/cSBC.log"
+# "w" starts every run with an empty log, keeping the last run's as .1, "a"
+# appends to it
 FILEMODE = "w"
 LOGGER_NAME = "cSBC Logger"
 DATE_FORMAT = "%Y-%m-%dT%H:%M:%S"
 MESSAGE_FORMAT = "%(asctime)s.%(msecs)03d # %(name)s # %(levelname)s # %(message)s"
+# Lowest level of the messages logged
+LOG_LEVEL = "DEBUG"
+# Size in bytes the log is rotated at, 0 to never rotate it, and the number of
+# rotated logs to keep
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUPS = 3
+# Most messages waiting for the log writer, more are dropped and counted
+LOG_QUEUE_SIZE = 10000
+# Messages logged from the same line are limited to LOG_BURST every
+# LOG_RATE_INTERVAL seconds, 0 for no limit, errors are never limited
+LOG_RATE_INTERVAL = 10
+LOG_BURST = 10
+# Binary log of every frame and event for timing analysis, read it with
+# `python -m pipeline.logpipe logs/cSBC.events`, None to not write it
+EVENT_LOG = None
+# Record spans of every pipeline stage from the start, else only once a TRACE
+# command starts tracing, see pipeline/trace.py
+TRACE_ENABLED = False
+# Most processes that can record spans, and the newest spans kept per process
+TRACE_PROCESSES = 32
+TRACE_SPANS = 4096
+# Directory the Chrome traces dumped by TRACE are written to
+TRACE_DIR = "logs"
 
 
 ########### DATA TRANSFER FORMAT ###########
-## Note: When adding new commands add the command to COMMANDS and a response in RESPONSES.
-## Also add a case for the command in the `performCommands()` function and
-## any other necessary locations that compute the necessary values.
-
-# RESPONSES Responses to client
-UPTIME_RESP = b"The server's uptime is %0.6f seconds."
-EVENT_RESP = b"EVENT captured."
-SHUTDOWN_RESP = b"Server SHUTDOWN. Captured %d images in total."
-
-
-# COMMANDS
-UPTIME = "UPTIME"
-EVENT = "EVENT"
-SHUTDOWN = "SHUTDOWN"
+## Note: Commands, their codes and the format of their responses are defined in
+## `pipeline/protocol.py`. When adding new commands add the command's code to
+## COMMAND_NAMES and the struct of its response to RESPONSES there. Also add a
+## case for the command in the `performCommand()` function and any other
+## necessary locations that compute the necessary values.
@@ -14,6 +14,41 @@ Contains
 HOST = "127.0.0.1"
 # The port used by the server
 PORT = 65431
+# Every cSBC commands are sent to, as (host, port)
+NODES = [(HOST, PORT)]
+# Seconds to wait for the server to accept a connection
+CONNECT_TIMEOUT = 5
+# Seconds before and after the trigger each cSBC writes for an EVENT, negative
+# for the cSBC's own EVENT_PRE_TRIGGER and EVENT_DELAY
+EVENT_PRE_TRIGGER = -1
+EVENT_POST_TRIGGER = -1
+# Send the mSBC's time of the trigger with an EVENT so every cSBC writes the
+# same window, only if the clocks of the SBCs are synchronized
+SEND_TRIGGER_TIME = False
+# Seconds each cSBC has to answer a command, by command name, an EVENT is
+# answered once its post-trigger window has passed and the event is written
+DEADLINES = {
+    "UPTIME": 2,
+    "EVENT": 120,
+    "SHUTDOWN": 10,
+    "PREVIEW": 60,
+    "STATS": 2,
+    "TRACE": 30,
+}
+# Deadlines of particular cSBCs that differ from DEADLINES, by (host, port) and
+# then by command name, such as a slower node that takes longer to write events:
+# {("192.168.1.12", 65431): {"EVENT": 180}}
+NODE_DEADLINES = {}
+# Preview product a PREVIEW asks each cSBC for, "thumbnails", "sheet" or
+# "clip", of its newest written event and from which of its cameras
+PREVIEW_PRODUCT = "sheet"
+PREVIEW_CAMERA = 0
+# Directory the received previews are saved to
+PREVIEW_DIR = "previews"
+# File the statistics received for STATS are appended to, one JSON line each
+STATS_FILE = "logs/stats.jsonl"
+# Seconds to wait for commands without a deadline
+DEFAULT_DEADLINE = 10
 # Internal error strings
 EXCEPTION = "EXCEPTION"
 
@@ -28,19 +63,34 @@ MESSAGE_FORMAT = "%(asctime)s.%(msecs)03d # %(name)s # %(levelname)s # %(message
 
 ########### DATA TRANSFER FORMAT ###########
 ## Note: When adding new commands add the command to USER INPUTS and COMMANDS. Also update the console strings.
-## Also add a case for the command in the `readInput()` function.
+## The command names in COMMANDS are the ones defined in `pipeline/protocol.py`.
 
 # USER INPUTS
 UPTIME = "u"
 EVENT = "e"
 SHUTDOWN = "s"
+PREVIEW = "p"
+STATS = "t"
+TRACE = "r"
+TRACE_START = "r+"
+TRACE_STOP = "r-"
 
 # COMMANDS
 COMMANDS = {
-    UPTIME: b"UPTIME",
-    EVENT: b"EVENT",
-    SHUTDOWN: b"SHUTDOWN",
+    UPTIME: "UPTIME",
+    EVENT: "EVENT",
+    SHUTDOWN: "SHUTDOWN",
+    PREVIEW: "PREVIEW",
+    STATS: "STATS",
+    TRACE: "TRACE",
+    TRACE_START: "TRACE",
+    TRACE_STOP: "TRACE",
 }
+# What each TRACE input asks the cSBCs to do, see pipeline/protocol.py: "r"
+# writes the spans recorded to a Chrome trace on each cSBC, "r+" and "r-"
+# switch tracing on and off
+TRACE_ACTIONS = {TRACE: "dump", TRACE_START: "start", TRACE_STOP: "stop"}
 
 ########### CONSOLE STRINGS ###########
-PROMPT = "What command would you like to send? [u,e,s]: "
+# several commands separated by spaces are pipelined over the connection
+PROMPT = "What command(s) would you like to send? [u,e,s,p,t,r,r+,r-]: "
@@ -8,14 +8,18 @@ Email: imatin@ucsd.edu
 The client on the WaveGlider will be the mSBC. The reason for this is because
 it will only be run when it needs to issue commands to the cSBCs. As a client 
 it will connect to the cSBCs when it needs to issue a command to turn on 
-(STANDBY), turn off (SHUTOFF), or capture images (EVENT). The log file for this
-system can be found in ./logs/mSBC.log.
+(STANDBY), turn off (SHUTOFF), or capture images (EVENT). Each command is sent
+to every cSBC in NODES at once. The connections are kept open and commands are
+sent as framed binary requests, see pipeline/protocol.py. The log file for this system can be found in
+./logs/mSBC.log.
 """
 
+import os
+import json
 import time
-import socket
 import logging
-import sys
+from concurrent import futures
+from pipeline import protocol
 
 # imports constants for this file
 from config.mSBC_config import *
@@ -51,7 +55,9 @@ def createLogger():
 
 
 def readInput(logger):
-    """Read user input from the command line and selects the correct command.
+    """Read user input from the command line and selects the correct commands.
+
+    Several commands separated by spaces are sent pipelined.
 
     Parameters
     ----------
@@ -60,10 +66,11 @@ def readInput(logger):
 
     Returns
     -------
-    command
-        Returns a command that is translated from the user input into a command the cSBC expects.
+    commands
+        Returns the commands translated from the user input into the command codes the cSBC expects.
+        Commands sent with values, such as TRACE, are (command code, values) pairs.
     valid
-        Returns a bool that explains if the user inputted a valid command or not.
+        Returns a bool that explains if the user inputted valid commands or not.
         
     Raises
     ------
@@ -73,43 +80,47 @@ def readInput(logger):
     try:
         # reads user input
         userInput = input(PROMPT)
+        commands = []
         valid = True
 
         # selects correct system command based off of user input
-        if userInput == UPTIME:
-            command = COMMANDS[UPTIME]
-        elif userInput == EVENT:
-            command = COMMANDS[EVENT]
-        elif userInput == SHUTDOWN:
-            command = COMMANDS[SHUTDOWN]
-        # handles invalid input
-        else:
+        for word in userInput.split():
+            if word in TRACE_ACTIONS:
+                action = protocol.TRACE_ACTION_CODES[TRACE_ACTIONS[word]]
+                commands.append((protocol.TRACE, (action,)))
+            elif word in COMMANDS:
+                commands.append(protocol.COMMAND_CODES[COMMANDS[word]])
+            # handles invalid input
+            else:
+                valid = False
+                logger.warning(f"User inputted invalid command: {word}.")
+        if not commands:
             valid = False
-            command = userInput
-            logger.warning(f"User inputted invalid command: {command}.")
 
     except:
         logger.error("Exception occurred", exc_info=True)
         valid = False
-        command = EXCEPTION
+        commands = EXCEPTION
         print()
 
-    return command, valid
+    return commands, valid
 
 
-def sendData(command, logger):
-    """Takes in a user command, connects to the cSBC and sends the command.
+def connect(node, logger):
+    """Opens the persistent connection to one cSBC.
 
     Parameters
     ----------
-    command : str
-        The command to send to the cSBC.
+    node : tuple
+        The (host, port) of the cSBC.
     logger : logging
         The logger for the mSBC.
 
     Returns
     -------
-    NONE
+    client
+        Returns a protocol Client connected to the cSBC, or None if the cSBC is
+        not accepting connections.
         
     Raises
     ------
@@ -117,37 +128,249 @@ def sendData(command, logger):
         Handles when the cSBC is not accepting new connections.
         
     """
+    host, port = node
     try:
-        # allow for connection server to begin listening again
-        time.sleep(0.1)
-
-        # open a socket for this client
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            # connect to the server
-            s.connect((HOST, PORT))
-            logger.info(f"Connected to cSBC at HOST={HOST} and PORT={PORT}.")
-
-            # send a command to the server
-            s.sendall(command)
-            logger.info(f"Sent {command} to cSBC.")
-
-            # wait till receive stats back from server
-            # cannot send another command until receive response
-            # if this line is commented out, cSBC will still not accept new commands until processed previous command completely
-            stats = s.recv(4096).decode("utf-8")
-            logger.info(f"Received: {stats}")
-
-    except ConnectionRefusedError as e:
-        logger.error(e)
-    except:
-        logger.error("Fatal Exception occurred", exc_info=True)
-        sys.exit()
+        client = protocol.Client(host, port, CONNECT_TIMEOUT)
+        logger.info(f"Connected to cSBC at HOST={host} and PORT={port}.")
+        return client
+    except OSError as e:
+        logger.error(f"Could not connect to cSBC at HOST={host} and PORT={port}: {e}")
+        return None
+
+
+def connectNodes(clients, pool, logger):
+    """Connects to every cSBC that is not connected, all at once.
+
+    Parameters
+    ----------
+    clients : dict
+        The Client of every node, None when not connected, updated in place.
+    pool : ThreadPoolExecutor
+        The threads to connect on.
+    logger : logging
+        The logger for the mSBC.
+
+    Returns
+    -------
+    None
+        
+    Raises
+    ------
+    None
+        
+    """
+    pending = {
+        node: pool.submit(connect, node, logger)
+        for node, client in clients.items()
+        if client is None
+    }
+    for node, future in pending.items():
+        clients[node] = future.result()
+
+
+def disconnect(clients, node):
+    """Closes a node's connection so it is reopened before the next command."""
+    if clients[node] is not None:
+        clients[node].close()
+        clients[node] = None
+
+
+def receiveResponses(client, count):
+    """Waits for count responses on one connection, see `Client.receive()`."""
+    return [client.receive() for i in range(count)]
+
+
+def savePreview(node, values, logger):
+    """Saves a preview product received from a cSBC.
+
+    Parameters
+    ----------
+    node : tuple
+        The (host, port) of the cSBC.
+    values : tuple
+        The event id, product and bytes of the PREVIEW response.
+    logger : logging
+        The logger for the mSBC.
+
+    Returns
+    -------
+    None
+        
+    Raises
+    ------
+    None
+        
+    """
+    eventId, product, data = values
+    name = protocol.PRODUCT_NAMES[product]
+    # sheets are JPEGs, thumbnails and clips are event containers
+    ext = ".jpg" if product == protocol.PREVIEW_CONTACT_SHEET else ".wgev"
+    host, port = node
+    os.makedirs(PREVIEW_DIR, exist_ok=True)
+    path = os.path.join(PREVIEW_DIR, f"{host}_{port}_event{eventId}_{name}{ext}")
+    with open(path, "wb") as f:
+        f.write(data)
+    logger.info(f"Saved {len(data)} byte preview to {path}.")
+
+
+def saveStats(node, values, logger):
+    """Appends the statistics received from a cSBC to the stats file.
+
+    Parameters
+    ----------
+    node : tuple
+        The (host, port) of the cSBC.
+    values : tuple
+        The snapshot time and JSON of the STATS response.
+    logger : logging
+        The logger for the mSBC.
+
+    Returns
+    -------
+    None
+        
+    Raises
+    ------
+    None
+        
+    """
+    snapshotTime, data = values
+    stats = json.loads(data)
+    for name, camera in stats["cameras"].items():
+        logger.info(
+            f"cSBC {node} {name}: {camera['fps']:.1f} fps, {camera['frames']} "
+            f"frames, {camera['incomplete']} incomplete, "
+            f"{camera['encoder_dropped'] + camera['ring_dropped']} dropped, "
+            f"{camera['camera_gaps']} missed by the camera, rolling buffer "
+            f"{camera['ring_frames']:.0f}/{camera['ring_slots']:.0f} frames, "
+            f"encode p99 {camera['latency']['encode']['p99_ms']:.1f} ms."
+        )
+    # one JSON line per snapshot, tagged with the cSBC it came from
+    host, port = node
+    os.makedirs(os.path.dirname(STATS_FILE) or ".", exist_ok=True)
+    with open(STATS_FILE, "a") as f:
+        f.write(json.dumps({"host": host, "port": port, **stats}) + "\n")
+
+
+def sendData(clients, commands, pool, logger):
+    """Sends commands to every cSBC at once and waits for their responses.
+
+    The commands are written to every connection before any response is
+    awaited, so the cSBCs receive them within the time of a few socket writes
+    of each other. Each cSBC's responses are then awaited on its own thread,
+    and a cSBC that does not answer within the deadline of its commands, from
+    NODE_DEADLINES or else DEADLINES and counted from when they were sent to
+    it, is reported as failed and disconnected.
+
+    Parameters
+    ----------
+    clients : dict
+        The Client of every node, None when not connected, updated in place.
+    commands : list
+        The command codes to send, all in a single write to each cSBC, or
+        (command code, values) pairs to send with values.
+    pool : ThreadPoolExecutor
+        The threads to wait for the responses on, one per node.
+    logger : logging
+        The logger for the mSBC.
+
+    Returns
+    -------
+    list
+        Returns the nodes that failed to answer every command.
+        
+    Raises
+    ------
+    None
+        
+    """
+    codes = [
+        command[0] if isinstance(command, tuple) else command for command in commands
+    ]
+    names = [protocol.COMMAND_NAMES[code] for code in codes]
+    failed = [node for node, client in clients.items() if client is None]
+    # every cSBC is sent the same event window
+    triggerTime = time.time() if SEND_TRIGGER_TIME else 0.0
+    values = {
+        protocol.EVENT: (
+            protocol.WAIT_WRITTEN,
+            EVENT_PRE_TRIGGER,
+            EVENT_POST_TRIGGER,
+            triggerTime,
+        ),
+        protocol.PREVIEW: (0, protocol.PRODUCT_CODES[PREVIEW_PRODUCT], PREVIEW_CAMERA),
+    }
+    requests = [
+        (command, values[command]) if command in values else command
+        for command in commands
+    ]
+
+    # send every command to every cSBC before waiting on any of them
+    waiting, sendTimes = {}, []
+    for node, client in clients.items():
+        if client is None:
+            continue
+        # a cSBC has the deadline of the slowest command sent to it, its own
+        # deadline for a command if it has one
+        deadlines = NODE_DEADLINES.get(node, {})
+        deadline = max(
+            deadlines.get(name, DEADLINES.get(name, DEFAULT_DEADLINE)) for name in names
+        )
+        try:
+            sent = time.perf_counter()
+            sendTimes.append(sent)
+            client.sendMany(requests)
+            future = pool.submit(receiveResponses, client, len(commands))
+            waiting[node] = (future, sent, deadline)
+        except OSError as e:
+            logger.error(f"Lost connection to cSBC {node}: {e}")
+            failed.append(node)
+            disconnect(clients, node)
+    skew = sendTimes[-1] - sendTimes[0] if sendTimes else 0.0
+    logger.info(f"Sent {names} to {len(waiting)} cSBCs within {skew * 1000:.3f} ms.")
+
+    # wait till receive stats back from every server, or its deadline passes,
+    # counted from when its commands were sent
+    for node, (future, sent, deadline) in waiting.items():
+        futures.wait([future], timeout=max(sent + deadline - time.perf_counter(), 0))
+        if not future.done():
+            elapsed = time.perf_counter() - sent
+            logger.error(
+                f"cSBC {node} did not answer within its {deadline} second "
+                f"deadline, {elapsed:.3f} seconds after its commands were sent."
+            )
+            failed.append(node)
+            # wakes its waiting thread
+            disconnect(clients, node)
+            continue
+        try:
+            responses = future.result()
+        except (OSError, protocol.ProtocolError) as e:
+            logger.error(f"Lost connection to cSBC {node}: {e}")
+            failed.append(node)
+            disconnect(clients, node)
+            continue
+        for requestId, command, status, values, seconds in responses:
+            logger.info(
+                f"Received {protocol.describeResponse(command, status, values)} "
+                f"for {protocol.COMMAND_NAMES.get(command, command)} "
+                f"({requestId}) from cSBC {node} in {seconds * 1000:.3f} ms."
+            )
+            if command == protocol.PREVIEW and status == protocol.OK:
+                savePreview(node, values, logger)
+            if command == protocol.STATS and status == protocol.OK:
+                saveStats(node, values, logger)
+
+    if failed:
+        logger.warning(f"{len(failed)} of {len(clients)} cSBCs failed: {failed}.")
+    return failed
 
 
 def clientSend(logger):
-    """Send command to cSBC and receive return message.
+    """Send commands to every cSBC and receive return messages.
     
-    This function will shut down mSBC if it sends the shutdown command.
+    The connections are kept open between commands and reopened if they are
+    lost. This function will shut down mSBC if it sends the shutdown command.
 
     Parameters
     ----------
@@ -163,28 +386,37 @@ def clientSend(logger):
     None
     
     """
-    while True:
-        try:
+    clients = {node: None for node in NODES}
+    # one thread per node to connect and wait for responses on
+    pool = futures.ThreadPoolExecutor(len(clients))
+    try:
+        while True:
             # get user input
-            command, valid = readInput(logger)
+            commands, valid = readInput(logger)
 
             # validate input
             if not valid:
-                if command == EXCEPTION:
+                if commands == EXCEPTION:
                     return
                 else:
                     continue
 
-            # send data to server
-            sendData(command, logger)
+            # connect to the servers that are not connected
+            connectNodes(clients, pool, logger)
+
+            # send data to every server, failed ones reconnect next time
+            sendData(clients, commands, pool, logger)
 
             # break forever loop if shutdown entered
-            if command == COMMANDS[SHUTDOWN]:
+            if protocol.SHUTDOWN in commands:
                 break
 
-        except:
-            logger.error("Fatal Exception occurred", exc_info=True)
-            break
+    except:
+        logger.error("Fatal Exception occurred", exc_info=True)
+    finally:
+        for node in clients:
+            disconnect(clients, node)
+        pool.shutdown()
 
 
 if __name__ == "__main__":
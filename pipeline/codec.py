@@ -0,0 +1,461 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Codecs the frames of an event are stored with, and a benchmark to pick one.
+
+Author: Imran Matin
+Email: imatin@ucsd.edu
+
+Usage:
+# compare every available codec on the frames of a recorded event
+python -m pipeline.codec images/<event>
+# or only some codecs, on at most 20 frames
+python -m pipeline.codec images/<event> --codecs png:1 png:6 jpg:90 raw+zlib:1 -n 20
+
+A codec is named by a spec of its kind and an optional setting:
+- "png:<level>" PNG at compression level 0 to 9, lossless.
+- "jpg:<quality>" JPEG at quality 0 to 100, lossy and 8 bit only.
+- "raw" the raw pixels behind a small header, lossless and nearly free.
+- "raw+<compressor>:<level>" raw pixels compressed with a fast general purpose
+  compressor, "zlib" is always available, "lz4" and "zstd" when the lz4 and
+  zstandard packages are installed.
+
+Raw frames are stored as WGF files (".wgf") that describe their own pixel type
+and shape and how they are compressed, so they can be decoded without the
+event's metadata. `readImage()` and `decodeImage()` read every codec's frames.
+
+How well each codec does depends on the scene and the sensor noise, so the
+benchmark encodes and decodes frames of a recorded event with every codec and
+reports the time per frame, the bytes per frame and whether the frames came
+back exactly.
+"""
+
+import os
+import sys
+import time
+import zlib
+import struct
+import argparse
+import numpy as np
+
+import cv2
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Header of a raw frame: magic, pixel type, compressor, number of dimensions
+# and the size of each
+RAW_MAGIC = b"WGF1"
+RAW_HEADER = struct.Struct("<4s4sBB2x3I")
+RAW_EXT = ".wgf"
+
+
+def _zstdCompress(data, level):
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def _zstdDecompress(data):
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+# Compressors by name: their id in the header, default level, whether they are
+# installed, and their compress(data, level) and decompress(data) functions
+COMPRESSORS = {
+    "none": (0, 0, True, None, None),
+    "zlib": (1, 1, True, zlib.compress, zlib.decompress),
+    "lz4": (
+        2,
+        0,
+        lz4 is not None,
+        lambda data, level: lz4.frame.compress(data, level),
+        lambda data: lz4.frame.decompress(data),
+    ),
+    "zstd": (3, 1, zstandard is not None, _zstdCompress, _zstdDecompress),
+}
+COMPRESSOR_IDS = {info[0]: name for name, info in COMPRESSORS.items()}
+# Codecs the benchmark compares by default, those that are not installed are
+# left out
+BENCHMARK_CODECS = (
+    "png:0",
+    "png:1",
+    "png:3",
+    "png:6",
+    "png:9",
+    "jpg:95",
+    "jpg:85",
+    "raw",
+    "raw+zlib:1",
+    "raw+lz4",
+    "raw+zstd:1",
+    "raw+zstd:3",
+)
+
+
+class ImageCodec:
+    """Encodes frames as an image format OpenCV supports.
+
+    Parameters
+    ----------
+    kind : str
+        The image format, "png" or "jpg".
+    setting : int
+        The PNG compression level or JPEG quality.
+
+    Attributes
+    ----------
+    spec : str
+        The codec's spec, for example "png:1".
+    name : str
+        The codec name stored in an event container, for example "png".
+    ext : str
+        The extension of the codec's files, for example ".png".
+    lossless : bool
+        Whether frames are decoded exactly as they were encoded.
+
+    """
+
+    PARAMS = {"png": cv2.IMWRITE_PNG_COMPRESSION, "jpg": cv2.IMWRITE_JPEG_QUALITY}
+
+    def __init__(self, kind, setting):
+        self.spec = f"{kind}:{setting}"
+        self.name = kind
+        self.ext = "." + kind
+        self.lossless = kind == "png"
+        self.params = [self.PARAMS[kind], int(setting)]
+
+    def encode(self, frame):
+        """Returns a frame encoded as a uint8 array, None if it failed."""
+        # JPEG only stores 8 bit pixels, keep the most significant bits
+        if not self.lossless and frame.dtype != np.uint8:
+            frame = (frame >> (frame.dtype.itemsize * 8 - 8)).astype(np.uint8)
+        result, img = cv2.imencode(self.ext, frame, self.params)
+        return img if result else None
+
+    def decode(self, data):
+        """Returns the frame held by encoded bytes."""
+        return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+
+
+class RawCodec:
+    """Stores frames as their raw pixels, optionally compressed.
+
+    Parameters
+    ----------
+    compressor : str
+        The name of the compressor in COMPRESSORS, "none" to store the pixels
+        as they are.
+    level : int
+        The compressor's level, its default when None.
+
+    Attributes
+    ----------
+    spec, name, ext, lossless
+        See ImageCodec.
+
+    Raises
+    ------
+    ValueError
+        When the compressor is unknown or not installed.
+
+    """
+
+    name = "wgf"
+    ext = RAW_EXT
+    lossless = True
+
+    def __init__(self, compressor="none", level=None):
+        if compressor not in COMPRESSORS:
+            raise ValueError(f"Unknown compressor {compressor}")
+        self.compressorId, defaultLevel, installed = COMPRESSORS[compressor][:3]
+        if not installed:
+            raise ValueError(f"The {compressor} compressor is not installed")
+        self.compressor = compressor
+        self.level = defaultLevel if level is None else int(level)
+        self.spec = "raw" if compressor == "none" else f"raw+{compressor}:{self.level}"
+
+    def encode(self, frame):
+        """Returns a frame encoded as a uint8 array, None if it failed."""
+        if frame.ndim > 3:
+            return None
+        frame = np.ascontiguousarray(frame)
+        dims = frame.shape + (0,) * (3 - frame.ndim)
+        header = RAW_HEADER.pack(
+            RAW_MAGIC,
+            frame.dtype.str.encode(),
+            self.compressorId,
+            frame.ndim,
+            *dims,
+        )
+        if self.compressor == "none":
+            # one copy of the pixels, straight behind the header
+            img = np.empty(RAW_HEADER.size + frame.nbytes, np.uint8)
+            img[: RAW_HEADER.size] = np.frombuffer(header, np.uint8)
+            img[RAW_HEADER.size :] = frame.reshape(-1).view(np.uint8)
+            return img
+        compress = COMPRESSORS[self.compressor][3]
+        return np.frombuffer(header + compress(frame.data, self.level), np.uint8)
+
+    def decode(self, data):
+        """Returns the frame held by encoded bytes."""
+        return decodeRaw(data)
+
+
+def decodeRaw(data):
+    """Returns the frame held by the bytes of a WGF file.
+
+    Parameters
+    ----------
+    data : bytes-like
+        The encoded frame, header first.
+
+    Returns
+    -------
+    numpy.ndarray
+        Returns the decoded frame.
+
+    Raises
+    ------
+    ValueError
+        When the data is not a WGF frame or its compressor is not installed.
+
+    """
+    data = memoryview(data).cast("B")
+    magic, dtype, compressorId, ndim, *dims = RAW_HEADER.unpack_from(data)
+    if magic != RAW_MAGIC or compressorId not in COMPRESSOR_IDS:
+        raise ValueError("Not a WGF frame")
+    compressor = COMPRESSOR_IDS[compressorId]
+    pixels = data[RAW_HEADER.size :]
+    if compressor != "none":
+        if not COMPRESSORS[compressor][2]:
+            raise ValueError(f"The {compressor} compressor is not installed")
+        pixels = COMPRESSORS[compressor][4](pixels)
+    return np.frombuffer(pixels, dtype.rstrip(b"\0").decode()).reshape(dims[:ndim])
+
+
+def getCodec(spec):
+    """Returns the codec a spec names, see the module documentation.
+
+    Parameters
+    ----------
+    spec : str
+        The codec's kind and optional setting, for example "png:1", "jpg:90",
+        "raw" or "raw+zlib:1".
+
+    Returns
+    -------
+    codec
+        Returns an ImageCodec or RawCodec.
+
+    Raises
+    ------
+    ValueError
+        When the spec names no codec or its compressor is not installed.
+
+    """
+    kind, _, setting = spec.strip().lower().partition(":")
+    if setting and not setting.isdigit():
+        raise ValueError(f"Bad codec setting in {spec}")
+    if kind == "png":
+        return ImageCodec(kind, setting or 1)
+    if kind in ("jpg", "jpeg"):
+        return ImageCodec("jpg", setting or 95)
+    if kind == "raw":
+        return RawCodec("none")
+    if kind.startswith("raw+"):
+        return RawCodec(kind[4:], setting or None)
+    raise ValueError(f"Unknown codec {spec}")
+
+
+def decodeImage(data, name):
+    """Returns the frame held by encoded bytes of the codec with a name."""
+    if name == RawCodec.name:
+        return decodeRaw(data)
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+
+
+def readImage(path):
+    """Returns the frame held by an image or WGF file."""
+    if path.endswith(RAW_EXT):
+        with open(path, "rb") as f:
+            return decodeRaw(f.read())
+    return cv2.imread(path, cv2.IMREAD_UNCHANGED)
+
+
+def loadFrames(path, count=0):
+    """Loads recorded frames to benchmark with.
+
+    Parameters
+    ----------
+    path : str
+        An event directory, an event container or a directory of images.
+    count : int
+        The most frames to load, evenly spaced over the event, 0 for all.
+
+    Returns
+    -------
+    list
+        Returns the frames, oldest first.
+
+    Raises
+    ------
+    None
+
+    """
+    # imported here as the previews read their frames with this module
+    from pipeline.preview import eventFrames, spaced
+    from pipeline.event_container import EventContainer
+
+    if os.path.isfile(path):
+        with EventContainer(path) as container:
+            positions = spaced(len(container), count or len(container))
+            return [container.decode(i) for i in positions]
+    try:
+        timestamps, load = eventFrames(path)
+        positions = spaced(len(timestamps), count or len(timestamps))
+        frames = load(positions)
+        return [frames[i] for i in positions]
+    except FileNotFoundError:
+        # a directory of images without a manifest
+        names = sorted(os.listdir(path))
+        frames = [readImage(os.path.join(path, name)) for name in names]
+        frames = [frame for frame in frames if frame is not None]
+        return [frames[i] for i in spaced(len(frames), count or len(frames))]
+
+
+def benchmark(frames, specs, repeats=1):
+    """Encodes and decodes frames with every codec and times them.
+
+    Parameters
+    ----------
+    frames : list
+        The raw frames to encode.
+    specs : list
+        The specs of the codecs to compare.
+    repeats : int
+        How often each frame is encoded and decoded, the fastest time counts.
+
+    Returns
+    -------
+    list
+        Returns one dict per codec with its spec, the encode and decode
+        milliseconds and encoded bytes per frame, the ratio of the raw to the
+        encoded size, the raw megabytes encoded per second and whether every
+        frame came back exactly.
+
+    Raises
+    ------
+    ValueError
+        When a spec names no codec.
+
+    """
+    rawBytes = sum(frame.nbytes for frame in frames)
+    results = []
+    for spec in specs:
+        codec = getCodec(spec)
+        encodeSeconds = decodeSeconds = 0.0
+        size = 0
+        exact = True
+        for frame in frames:
+            times = []
+            for _ in range(max(1, repeats)):
+                start = time.perf_counter()
+                img = codec.encode(frame)
+                times.append(time.perf_counter() - start)
+            encodeSeconds += min(times)
+            size += img.nbytes
+            times = []
+            for _ in range(max(1, repeats)):
+                start = time.perf_counter()
+                decoded = codec.decode(img)
+                times.append(time.perf_counter() - start)
+            decodeSeconds += min(times)
+            exact = exact and np.array_equal(decoded, frame)
+        numFrames = max(1, len(frames))
+        results.append(
+            {
+                "codec": codec.spec,
+                "encode_ms": encodeSeconds / numFrames * 1000,
+                "decode_ms": decodeSeconds / numFrames * 1000,
+                "bytes": size / numFrames,
+                "ratio": rawBytes / max(1, size),
+                "encode_mbps": rawBytes / 1e6 / max(encodeSeconds, 1e-9),
+                "exact": exact,
+            }
+        )
+    return results
+
+
+def available(specs):
+    """Returns the specs whose codecs can be created here."""
+    usable = []
+    for spec in specs:
+        try:
+            getCodec(spec)
+        except ValueError:
+            continue
+        usable.append(spec)
+    return usable
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the encode time, decode time and size of codecs."
+    )
+    parser.add_argument(
+        "path", help="Event directory, event container or directory of images"
+    )
+    parser.add_argument(
+        "-c",
+        "--codecs",
+        nargs="+",
+        default=None,
+        help="Codec specs to compare (Default: every installed codec)",
+    )
+    parser.add_argument(
+        "-n",
+        "--frames",
+        type=int,
+        default=0,
+        help="Frames to use, evenly spaced over the event (Default: all)",
+    )
+    parser.add_argument(
+        "-r",
+        "--repeats",
+        type=int,
+        default=3,
+        help="Times each frame is encoded and decoded (Default: 3)",
+    )
+    args = parser.parse_args()
+
+    frames = loadFrames(args.path, args.frames)
+    if not frames:
+        print(f"No frames found in {args.path}.")
+        return 1
+    specs = args.codecs or available(BENCHMARK_CODECS)
+    frame = frames[0]
+    print(
+        f"{len(frames)} frames of {'x'.join(map(str, frame.shape))} {frame.dtype}, "
+        f"{frame.nbytes} bytes each."
+    )
+    print(
+        f"{'codec':>12} {'encode ms':>10} {'decode ms':>10} {'bytes/frame':>12} "
+        f"{'ratio':>6} {'MB/s':>8} {'exact':>6}"
+    )
+    for result in benchmark(frames, specs, args.repeats):
+        print(
+            f"{result['codec']:>12} {result['encode_ms']:10.2f} "
+            f"{result['decode_ms']:10.2f} {result['bytes']:12.0f} "
+            f"{result['ratio']:6.2f} {result['encode_mbps']:8.1f} "
+            f"{'yes' if result['exact'] else 'no':>6}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,375 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Blocking state machine shared by the connection handler and capture process.
+
+Author: Imran Matin
+Email: imatin@ucsd.edu
+
+Replaces the cameraStatus and eventStatus shared values, which the connection
+handler had to spin on while an event was written. The state lives in shared
+memory and every change is announced on a multiprocessing Condition, so a
+process waiting for a change sleeps in the kernel until it happens.
+
+    STANDBY   capturing into the rolling buffer
+    EVENT     an event was requested and has not been written yet
+    SHUTDOWN  the capture process releases the camera and exits
+
+Events are numbered. The connection handler requests one with
+`triggerEvent()`, which returns at once, and may sleep in `waitForEvent()`; the
+capture process claims it with `startEvent()` once its handoff time has come
+and reports it with `finishEvent()` once it is on disk. How late the capture
+process acted on the last request is kept in `latency`.
+
+With several cameras every camera's capture process claims and reports every
+event on its own, and an event is only written once all of them have written
+it. They share the event's window, so the cameras write the same span of time.
+
+Every event covers a window of time from a number of seconds before its trigger
+to a number of seconds after it. The rolling buffer is handed off as soon as
+the end of the window has been captured, and only the frames captured within
+the window are written. Events are handed off in the order they were
+requested, and an event written from a rolling buffer only reaches back to the
+previous handoff, so the pre-trigger window of an event queued behind another
+is cut short.
+
+A trigger that arrives while earlier events are not written yet is handled by
+the event policy:
+- "coalesce" merges it into the event still waiting for its handoff if their
+  windows overlap, widening that event's window to cover both, or queues it if
+  they do not.
+- "queue" makes it an event of its own, written after the earlier ones.
+- "drop" refuses it.
+A trigger is also refused when the queue is full or the cSBC is shutting down.
+Events are written from the two rolling buffers in turn, so queued events never
+write the same frames twice.
+"""
+
+import time
+import multiprocessing as mp
+
+from pipeline import protocol
+
+# States
+STANDBY = 0
+EVENT = 1
+SHUTDOWN = 2
+STATE_NAMES = {STANDBY: "STANDBY", EVENT: "EVENT", SHUTDOWN: "SHUTDOWN"}
+
+# Event policies
+COALESCE = "coalesce"
+QUEUE = "queue"
+DROP = "drop"
+EVENT_POLICIES = (COALESCE, QUEUE, DROP)
+
+# Number of recent events whose state is remembered
+EVENT_HISTORY = 256
+
+
+class ControlState:
+    """State shared between the cSBC processes, see the module documentation.
+
+    Parameters
+    ----------
+    policy : str
+        What to do with a trigger while earlier events are not written yet,
+        one of "coalesce", "queue" or "drop".
+    maxQueued : int
+        The most events that can be waiting or being written at once.
+    numCameras : int
+        The number of capture processes that write every event.
+
+    Attributes
+    ----------
+    state : int
+        The current state, STANDBY, EVENT or SHUTDOWN.
+    latency : float
+        The seconds between a request being due and the capture process
+        acting on it, for the last request.
+
+    """
+
+    def __init__(self, policy=COALESCE, maxQueued=4, numCameras=1):
+        if policy not in EVENT_POLICIES:
+            raise ValueError(f"Unknown event policy {policy}")
+        self.policy = policy
+        self.maxQueued = max(1, min(int(maxQueued), EVENT_HISTORY // 2))
+        self.numCameras = max(1, int(numCameras))
+        self._cond = mp.Condition()
+        # the condition's lock guards every value, so they need none of their own
+        self._state = mp.RawValue("i", STANDBY)
+        self._requested = mp.RawValue("q", 0)
+        # the newest event each camera has handed off and written
+        self._started = mp.RawArray("q", self.numCameras)
+        self._done = mp.RawArray("q", self.numCameras)
+        self._requestTime = mp.RawValue("d", 0.0)
+        self._latency = mp.RawValue("d", 0.0)
+        # one row per recent event, indexed by event id modulo EVENT_HISTORY,
+        # the window is in wall clock time and the handoff in monotonic time
+        self._eventState = mp.RawArray("i", EVENT_HISTORY)
+        self._windowStart = mp.RawArray("d", EVENT_HISTORY)
+        self._windowEnd = mp.RawArray("d", EVENT_HISTORY)
+        self._handoff = mp.RawArray("d", EVENT_HISTORY)
+        self._triggers = mp.RawArray("i", EVENT_HISTORY)
+        self._eventTime = mp.RawArray("d", EVENT_HISTORY)
+        # cameras that have finished the event, and those that failed to
+        self._finished = mp.RawArray("i", EVENT_HISTORY)
+        self._failed = mp.RawArray("i", EVENT_HISTORY)
+
+    @property
+    def state(self):
+        # a lone aligned int can be read without the lock
+        return self._state.value
+
+    @property
+    def latency(self):
+        return self._latency.value
+
+    def isRunning(self):
+        """Returns True until shutdown is requested."""
+        return self._state.value != SHUTDOWN
+
+    def _request(self, state):
+        """Changes state for a new request and wakes every waiting process."""
+        self._requestTime.value = time.monotonic()
+        self._state.value = state
+        self._cond.notify_all()
+
+    def acknowledge(self):
+        """Records how long the capture process took to act on the last request."""
+        with self._cond:
+            self._latency.value = time.monotonic() - self._requestTime.value
+
+    def _allStarted(self):
+        """Returns the newest event every camera has handed off."""
+        return min(self._started)
+
+    def _allDone(self):
+        """Returns the newest event every camera has written."""
+        return min(self._done)
+
+    def _newEvent(self, start, end, handoff):
+        """Adds an event to the queue and returns its id, the lock must be held."""
+        self._requested.value += 1
+        eventId = self._requested.value
+        index = eventId % EVENT_HISTORY
+        self._eventState[index] = protocol.EVENT_PENDING
+        self._windowStart[index] = start
+        self._windowEnd[index] = end
+        self._handoff[index] = handoff
+        self._triggers[index] = 1
+        self._eventTime[index] = time.time()
+        self._finished[index] = 0
+        self._failed[index] = 0
+        self._request(EVENT)
+        return eventId
+
+    def triggerEvent(self, pre, post, triggerTime=None):
+        """Requests an event, or merges or drops it as the policy says.
+
+        Parameters
+        ----------
+        pre : float
+            The seconds before the trigger to write frames from.
+        post : float
+            The seconds after the trigger to keep capturing and write frames
+            until.
+        triggerTime : float
+            The wall clock time of the trigger, defaults to now. A time in the
+            future is taken as now, so no event holds up the ones behind it.
+
+        Returns
+        -------
+        eventId
+            Returns the number of the event the trigger belongs to, or 0 if it
+            was dropped.
+        result
+            Returns one of the protocol's TRIGGER_ codes.
+
+        Raises
+        ------
+        None
+
+        """
+        with self._cond:
+            if self._state.value == SHUTDOWN:
+                return 0, protocol.TRIGGER_DROPPED_SHUTDOWN
+            now = time.time()
+            triggerTime = now if triggerTime is None else min(triggerTime, now)
+            start, end = triggerTime - pre, triggerTime + post
+            # hand off once the end of the window has been captured
+            handoff = time.monotonic() + max(0.0, end - now)
+            # events no camera has handed off yet can still be merged into
+            waiting = self._requested.value - max(self._started)
+            unwritten = self._requested.value - self._allDone()
+
+            # merge into the newest event whose frames have not been handed
+            # off if the windows overlap
+            eventId = self._requested.value
+            index = eventId % EVENT_HISTORY
+            if (
+                self.policy == COALESCE
+                and waiting
+                and start <= self._windowEnd[index]
+                and end >= self._windowStart[index]
+            ):
+                self._windowStart[index] = min(self._windowStart[index], start)
+                self._windowEnd[index] = max(self._windowEnd[index], end)
+                self._handoff[index] = max(self._handoff[index], handoff)
+                self._triggers[index] += 1
+                return eventId, protocol.TRIGGER_COALESCED
+            if self.policy == DROP and unwritten:
+                return 0, protocol.TRIGGER_DROPPED_BUSY
+            if unwritten >= self.maxQueued:
+                return 0, protocol.TRIGGER_DROPPED_FULL
+            return self._newEvent(start, end, handoff), protocol.TRIGGER_ACCEPTED
+
+    def startEvent(self, camera=0):
+        """Claims a camera's oldest waiting event once its handoff time has come.
+
+        Parameters
+        ----------
+        camera : int
+            The camera whose capture process claims the event.
+
+        Returns
+        -------
+        int
+            Returns the event's number, or 0 if no event is due.
+
+        Raises
+        ------
+        None
+
+        """
+        # cheap check without the lock for the common case of no event
+        if self._started[camera] >= self._requested.value:
+            return 0
+        with self._cond:
+            if self._started[camera] >= self._requested.value:
+                return 0
+            eventId = self._started[camera] + 1
+            index = eventId % EVENT_HISTORY
+            now = time.monotonic()
+            if now < self._handoff[index]:
+                return 0
+            self._started[camera] = eventId
+            self._eventState[index] = protocol.EVENT_WRITING
+            self._latency.value = now - self._handoff[index]
+            self._cond.notify_all()
+            return eventId
+
+    def eventWindow(self, eventId):
+        """Returns the (start, end) wall clock times of an event's window."""
+        with self._cond:
+            index = eventId % EVENT_HISTORY
+            return self._windowStart[index], self._windowEnd[index]
+
+    def lastEvent(self):
+        """Returns the newest event every camera has finished, 0 if none has."""
+        with self._cond:
+            return self._allDone()
+
+    def queued(self):
+        """Returns the events waiting for their handoff and the events not
+        written yet, including those."""
+        with self._cond:
+            requested = self._requested.value
+            return requested - self._allStarted(), requested - self._allDone()
+
+    def eventTime(self, eventId):
+        """Returns the wall clock time an event was requested at."""
+        with self._cond:
+            return self._eventTime[eventId % EVENT_HISTORY]
+
+    def finishEvent(self, eventId, written=True, camera=0):
+        """Reports a camera's event written or failed.
+
+        The event is written once every camera has written it, and failed if
+        any camera failed to. Returns to STANDBY once no event is left.
+        """
+        with self._cond:
+            index = eventId % EVENT_HISTORY
+            self._done[camera] = max(self._done[camera], eventId)
+            self._finished[index] += 1
+            self._failed[index] |= not written
+            if self._finished[index] >= self.numCameras:
+                self._eventState[index] = (
+                    protocol.EVENT_FAILED
+                    if self._failed[index]
+                    else protocol.EVENT_WRITTEN
+                )
+            if self._state.value == EVENT and self._allDone() >= self._requested.value:
+                self._state.value = STANDBY
+            self._cond.notify_all()
+
+    def eventStatus(self, eventId):
+        """Returns the state and number of triggers of a recent event.
+
+        Parameters
+        ----------
+        eventId : int
+            The number returned by `triggerEvent()`.
+
+        Returns
+        -------
+        state
+            Returns one of the protocol's EVENT_ states, EVENT_UNKNOWN if the
+            event does not exist or is too old to be remembered.
+        triggers
+            Returns the number of triggers coalesced into the event.
+
+        Raises
+        ------
+        None
+
+        """
+        with self._cond:
+            newest = self._requested.value
+            if eventId <= 0 or eventId > newest or newest - eventId >= EVENT_HISTORY:
+                return protocol.EVENT_UNKNOWN, 0
+            index = eventId % EVENT_HISTORY
+            return self._eventState[index], self._triggers[index]
+
+    def waitForEvent(self, eventId, timeout=None, captured=False):
+        """Sleeps until an event has been written or shutdown is requested.
+
+        Parameters
+        ----------
+        eventId : int
+            The number returned by `triggerEvent()`.
+        timeout : float
+            The most seconds to wait, forever when None.
+        captured : bool
+            Only wait until the event's window has been captured and handed
+            off to be written by every camera.
+
+        Returns
+        -------
+        bool
+            True if the event was written, or captured when captured is set,
+            False on failure, timeout or shutdown.
+
+        Raises
+        ------
+        None
+
+        """
+        newest = self._allStarted if captured else self._allDone
+        with self._cond:
+            self._cond.wait_for(
+                lambda: newest() >= eventId or self._state.value == SHUTDOWN,
+                timeout,
+            )
+            if captured:
+                return self._allStarted() >= eventId
+            return self._eventState[eventId % EVENT_HISTORY] == protocol.EVENT_WRITTEN
+
+    def shutdown(self):
+        """Requests the capture process to stop and wakes every waiter."""
+        with self._cond:
+            self._request(SHUTDOWN)
+
+    def waitForState(self, state, timeout=None):
+        """Sleeps until the state is state, returns False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._state.value == state, timeout)
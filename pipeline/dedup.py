@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Suppression of near duplicate frames before an event is written.
+
+Author: Imran Matin
+Email: imatin@ucsd.edu
+
+In calm conditions most frames of an event are almost the same as the one
+before, and writing them wastes write bandwidth and storage. The capture loop
+shrinks every frame to a small grey signature, which costs a few hundredths of
+a millisecond, and stores it with the frame's metadata in the rolling buffer.
+
+When an event is written its frames are compared by signature, oldest first.
+A frame is kept if it differs from the last kept frame by more than a
+threshold, the mean absolute difference of their signatures in grey levels,
+and skipped otherwise. The differences between a kept frame and all the frames
+after it are computed at once, so comparing a whole event takes one NumPy
+operation per kept frame. A frame is also kept after at most maxRun skipped
+frames, so a slow drift is never skipped for long.
+
+Skipped frames are still listed in the event's manifest, with the sequence
+number of the kept frame they duplicate, see pipeline/manifest.py.
+"""
+
+import numpy as np
+
+import cv2
+
+from pipeline.frame_ring import SIGNATURE_SHAPE
+
+
+def signature(frame):
+    """Shrinks a raw frame to its SIGNATURE_SHAPE grey signature.
+
+    Parameters
+    ----------
+    frame : numpy.ndarray
+        The raw frame from the camera, grey or BGR, of any integer pixel type.
+
+    Returns
+    -------
+    numpy.ndarray
+        Returns the signature as 8 bit pixels.
+
+    Raises
+    ------
+    None
+
+    """
+    height, width = SIGNATURE_SHAPE
+    # sample every few pixels first so shrinking touches a small part of the
+    # frame, the block average still smooths out the sensor noise
+    stepY = max(1, frame.shape[0] // (height * 4))
+    stepX = max(1, frame.shape[1] // (width * 4))
+    small = cv2.resize(
+        frame[::stepY, ::stepX], (width, height), interpolation=cv2.INTER_AREA
+    )
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    if small.dtype != np.uint8:
+        small = (small >> (small.dtype.itemsize * 8 - 8)).astype(np.uint8)
+    return small
+
+
+def findDuplicates(signatures, threshold, maxRun=0):
+    """Finds the frames that barely differ from the last kept frame.
+
+    Parameters
+    ----------
+    signatures : numpy.ndarray
+        The signature of every frame, oldest first.
+    threshold : float
+        The mean absolute difference in grey levels a frame must exceed to be
+        kept.
+    maxRun : int
+        The most frames skipped in a row, 0 for no limit.
+
+    Returns
+    -------
+    numpy.ndarray
+        Returns for every frame the position of the kept frame it duplicates,
+        or -1 if it is kept. The first frame is always kept.
+
+    Raises
+    ------
+    None
+
+    """
+    numFrames = len(signatures)
+    signatures = signatures.reshape(numFrames, -1).astype(np.int16)
+    refs = np.full(numFrames, -1, np.int64)
+    kept = 0
+    while kept < numFrames - 1:
+        end = numFrames if maxRun <= 0 else min(numFrames, kept + 1 + maxRun)
+        # difference of every following frame to the kept one at once
+        diffs = np.abs(signatures[kept + 1 : end] - signatures[kept]).mean(axis=1)
+        changed = np.flatnonzero(diffs > threshold)
+        following = kept + 1 + changed[0] if changed.size else end
+        refs[kept + 1 : following] = kept
+        kept = following
+    return refs
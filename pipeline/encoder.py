@@ -0,0 +1,527 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Pool of worker processes that encode raw frames off the capture loop.
+
+Author: Imran Matin
+Email: imatin@ucsd.edu
+
+The capture process copies each raw frame into a small shared memory staging
+ring and queues its sequence number. The workers encode the frame straight from
+shared memory into an output slot paired with the staging slot and report back
+only the sequence number and encoded size, so neither raw nor encoded frames are
+pickled. Results are handed back to the capture process in capture order.
+
+When every staging slot is still waiting to be encoded the pool has fallen
+behind the camera. The new frame is then dropped instead of stalling capture,
+and the drop is counted so the capture loop can report it. A frame that fails
+to encode is dropped the same way, and a frame whose result never arrives,
+because its worker died, is given up on after ENCODE_TIMEOUT and the dead
+worker replaced, so one bad frame cannot stop the pool.
+
+In lazy mode the rolling buffer holds raw frames instead, and FlushEncoder
+encodes only the frames an event writes, on every core at once.
+"""
+
+import time
+import queue
+import numpy as np
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import cv2
+
+from pipeline import trace
+from pipeline.frame_ring import FrameRing, _openSharedMemory
+from pipeline.writer import writeFile
+
+# Seconds to wait for a worker before giving up on a frame when draining
+COLLECT_TIMEOUT = 5
+# Seconds after its capture a frame still not encoded is given up on
+ENCODE_TIMEOUT = 10
+
+
+def _encodeWorker(raw, outName, outSlotSize, shape, dtype, codec, tasks, results):
+    """Encodes staged frames until it receives None.
+
+    Parameters
+    ----------
+    raw : FrameRing
+        The staging ring holding the raw frames.
+    outName : str
+        The name of the shared memory block of output slots.
+    outSlotSize : int
+        The size of each output slot in bytes.
+    shape : tuple
+        The shape of a raw frame.
+    dtype : str
+        The type of a raw frame's pixels.
+    codec : codec
+        The codec to encode with, see pipeline/codec.py.
+    tasks : multiprocessing.Queue
+        The sequence numbers of the frames to encode.
+    results : multiprocessing.Queue
+        The (seq, size, seconds) of every encoded frame, size is -1 on failure.
+
+    Returns
+    -------
+    None
+
+    Raises
+    ------
+    None
+
+    """
+    # a single core per worker, the pool provides the parallelism
+    cv2.setNumThreads(1)
+    outShm = _openSharedMemory(outName)
+    out = np.ndarray((raw.numSlots, outSlotSize), np.uint8, outShm.buf)
+    try:
+        while True:
+            seq = tasks.get()
+            if seq is None:
+                break
+            start = time.perf_counter()
+            frame = raw.view(seq, dtype, shape)
+            size = -1
+            try:
+                if frame is not None:
+                    img = codec.encode(frame)
+                    if img is not None and img.size <= outSlotSize:
+                        out[seq % raw.numSlots, : img.size] = img.reshape(-1)
+                        size = img.size
+            except Exception:
+                # reported as a failure, the capture process drops the frame
+                size = -1
+            end = time.perf_counter()
+            trace.record("encode", start, end, seq)
+            results.put((seq, size, end - start))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        del out
+        raw.close()
+        outShm.close()
+
+
+class EncoderPool:
+    """Encodes frames on a pool of worker processes and returns them in order.
+
+    Parameters
+    ----------
+    frame : numpy.ndarray
+        A raw frame from the camera used to size the staging slots.
+    codec : codec
+        The codec to encode with, see pipeline/codec.py.
+    numWorkers : int
+        The number of worker processes.
+    depth : int
+        The number of frames that can be waiting for or in encoding at once.
+    stats : CaptureStats
+        Counts dropped frames and records encode latencies, None for none.
+
+    Attributes
+    ----------
+    submitted : int
+        The number of frames accepted by `submit()`.
+    encoded : int
+        The number of frames returned by `collect()`.
+    dropped : int
+        The number of frames dropped because the pool was behind, or that
+        failed to encode or were given up on.
+    restarts : int
+        The number of workers replaced after they died.
+    lag : float
+        The seconds between the capture and the return of the last frame.
+    maxLag : float
+        The largest lag since the pool was created.
+    encodeSeconds : float
+        The seconds a worker spent encoding the last frame.
+
+    """
+
+    def __init__(self, frame, codec, numWorkers=2, depth=8, stats=None):
+        self.shape = frame.shape
+        self.dtype = frame.dtype.str
+        self.codec = codec
+        self.stats = stats
+        self.depth = int(depth)
+        # room for an encoded frame that is slightly larger than the raw frame
+        self.outSlotSize = frame.nbytes + frame.nbytes // 100 + 4096
+        self.raw = FrameRing(self.depth, frame.nbytes)
+        self._out = shared_memory.SharedMemory(
+            create=True, size=self.depth * self.outSlotSize
+        )
+        self._outSlots = np.ndarray(
+            (self.depth, self.outSlotSize), np.uint8, self._out.buf
+        )
+
+        self.submitted = self.encoded = self.dropped = self.restarts = 0
+        self.lag = self.maxLag = self.encodeSeconds = 0.0
+        # sequence number of the next frame to hand back
+        self._next = 0
+        self._done = {}
+
+        self._tasks = mp.Queue()
+        self._results = mp.Queue()
+        self._workers = [self._startWorker() for i in range(int(numWorkers))]
+
+    def _startWorker(self):
+        """Starts a worker process and returns it."""
+        worker = mp.Process(
+            target=_encodeWorker,
+            args=(
+                self.raw,
+                self._out.name,
+                self.outSlotSize,
+                self.shape,
+                self.dtype,
+                self.codec,
+                self._tasks,
+                self._results,
+            ),
+            daemon=True,
+        )
+        worker.start()
+        return worker
+
+    def _recover(self, expireAll=False):
+        """Gives up on the next frames whose results are overdue.
+
+        A result that never arrives would otherwise hold back every later
+        frame and fill the staging slots, so the frame is counted as dropped
+        when `collect()` reaches it, and dead workers are replaced.
+
+        Parameters
+        ----------
+        expireAll : bool
+            Give up on every frame still missing, however recent.
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        None
+
+        """
+        now = time.monotonic()
+        expired = False
+        for seq in range(self._next, self.raw.head):
+            if seq in self._done:
+                continue
+            # frames are submitted in capture order, so the rest are newer
+            captured = self.raw.meta["monotonic"][seq % self.raw.numSlots]
+            if not expireAll and now - captured < ENCODE_TIMEOUT:
+                break
+            self._done[seq] = -1
+            expired = True
+        if not expired:
+            return
+        for i, worker in enumerate(self._workers):
+            if not worker.is_alive():
+                worker.join()
+                self._workers[i] = self._startWorker()
+                self.restarts += 1
+
+    def _drop(self):
+        """Counts a frame dropped because the pool was behind or failed."""
+        self.dropped += 1
+        if self.stats is not None:
+            self.stats.count("encoder_dropped")
+
+    def inFlight(self):
+        """Returns the number of frames submitted but not yet collected."""
+        return self.raw.head - self._next
+
+    def submit(
+        self,
+        frame,
+        timestamp=None,
+        monotonic=None,
+        frameId=-1,
+        cameraTimestamp=-1,
+        signature=None,
+    ):
+        """Stages a raw frame and queues it for encoding.
+
+        Parameters
+        ----------
+        frame : numpy.ndarray
+            The raw frame from the camera.
+        timestamp, monotonic, frameId, cameraTimestamp, signature
+            Describe the frame, see `FrameRing.commit()`.
+
+        Returns
+        -------
+        bool
+            True if the frame was queued, False if every staging slot is busy
+            and the frame was dropped.
+
+        Raises
+        ------
+        None
+
+        """
+        if self.inFlight() >= self.depth:
+            self._drop()
+            return False
+        seq = self.raw.write(
+            frame, timestamp, monotonic, frameId, cameraTimestamp, signature
+        )
+        self._tasks.put(seq)
+        self.submitted += 1
+        return True
+
+    def collect(self, wait=False):
+        """Returns the frames that finished encoding, in capture order.
+
+        The views point into the pool's output slots and are only valid until
+        the next call to `submit()`, so copy them into the rolling buffer
+        before submitting another frame.
+
+        Parameters
+        ----------
+        wait : bool
+            Wait until every submitted frame is encoded.
+
+        Returns
+        -------
+        list
+            Returns (img, info) for every frame ready to be handed back, info
+            is the frame's description from `FrameRing.info()`.
+
+        Raises
+        ------
+        None
+
+        """
+        # drain every result that is available, blocking only while waiting
+        # for frames that are still being encoded
+        while True:
+            block = wait and self.inFlight() > len(self._done)
+            try:
+                seq, size, seconds = self._results.get(block, COLLECT_TIMEOUT)
+            except queue.Empty:
+                # a worker that should have answered by now has died
+                if block:
+                    self._recover(expireAll=True)
+                    continue
+                break
+            # a frame already given up on
+            if seq < self._next or seq in self._done:
+                continue
+            self._done[seq] = size
+            self.encodeSeconds = seconds
+            if self.stats is not None:
+                self.stats.observe("encode", seconds)
+
+        # hand back every frame that is next in line
+        self._recover()
+        ready = []
+        while self._next in self._done:
+            seq = self._next
+            size = self._done.pop(seq)
+            info = self.raw.info(seq)
+            self._next += 1
+            if size < 0:
+                self._drop()
+                continue
+            self.lag = time.time() - info[0]
+            self.maxLag = max(self.maxLag, self.lag)
+            if self.stats is not None:
+                self.stats.observe("capture_to_ring", self.lag)
+            self.encoded += 1
+            ready.append((self._outSlots[seq % self.depth, :size], info))
+        return ready
+
+    def close(self):
+        """Stops the workers and frees the staging and output slots."""
+        for worker in self._workers:
+            self._tasks.put(None)
+        for worker in self._workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        self._outSlots = None
+        self.raw.close()
+        self._out.close()
+        self._out.unlink()
+
+
+# The raw rolling buffers by name, attached once in each flush worker
+_flushRings = {}
+
+
+def _initFlushWorker(rings):
+    """Keeps the flush worker's handles on the raw rolling buffers."""
+    # a single core per worker, the pool provides the parallelism
+    cv2.setNumThreads(1)
+    for ring in rings:
+        _flushRings[ring.name] = ring
+
+
+def _encodeToFile(task):
+    """Encodes one raw frame from the rolling buffer and writes it to disk.
+
+    Parameters
+    ----------
+    task : tuple
+        The (ring name, seq, shape, dtype, codec, path, fsync, preallocate)
+        of the frame to write.
+
+    Returns
+    -------
+    int
+        Returns the encoded size in bytes, or -1 if the frame was no longer in
+        the rolling buffer or failed to encode.
+
+    Raises
+    ------
+    None
+
+    """
+    name, seq, shape, dtype, codec, path, fsync, preallocate = task
+    frame = _flushRings[name].view(seq, dtype, shape)
+    if frame is None:
+        return -1
+    with trace.span("encode", seq):
+        img = codec.encode(frame)
+    if img is None:
+        return -1
+    return writeFile(path, img, fsync, preallocate)
+
+
+def _encodeFrame(task):
+    """Encodes one raw frame from the rolling buffer.
+
+    Parameters
+    ----------
+    task : tuple
+        The (ring name, seq, shape, dtype, codec) of the frame.
+
+    Returns
+    -------
+    numpy.ndarray or None
+        Returns the encoded image, or None if the frame was no longer in the
+        rolling buffer or failed to encode.
+
+    Raises
+    ------
+    None
+
+    """
+    name, seq, shape, dtype, codec = task
+    frame = _flushRings[name].view(seq, dtype, shape)
+    if frame is None:
+        return None
+    with trace.span("encode", seq):
+        return codec.encode(frame)
+
+
+class FlushEncoder:
+    """Encodes raw frames from the rolling buffer on every core during an event.
+
+    The worker processes are started once and sleep on their task queue between
+    events, so the CPU is only busy while an event is being written.
+
+    Parameters
+    ----------
+    rings : list
+        The rolling buffers holding raw frames.
+    frame : numpy.ndarray
+        A raw frame from the camera, giving the shape and type of the frames.
+    codec : codec
+        The codec to encode with, see pipeline/codec.py.
+    numWorkers : int
+        The number of worker processes, one per core when None.
+    fsync : bool
+        Flush each image to storage before closing it.
+    preallocate : bool
+        Reserve each image's full size before writing it.
+
+    """
+
+    def __init__(
+        self,
+        rings,
+        frame,
+        codec,
+        numWorkers=None,
+        fsync=False,
+        preallocate=True,
+    ):
+        self.shape = frame.shape
+        self.dtype = frame.dtype.str
+        self.codec = codec
+        self.fsync = fsync
+        self.preallocate = preallocate
+        self.numWorkers = numWorkers or mp.cpu_count()
+        self._pool = mp.Pool(self.numWorkers, _initFlushWorker, (list(rings),))
+
+    def encodeToFiles(self, ring, seqs, paths):
+        """Encodes the frames with the given sequence numbers to image files.
+
+        Parameters
+        ----------
+        ring : FrameRing
+            The rolling buffer holding the frames.
+        seqs : list
+            The sequence numbers of the frames in the rolling buffer.
+        paths : list
+            The path to write each frame to.
+
+        Returns
+        -------
+        list
+            Returns the encoded size of every frame, -1 for frames that could
+            not be written.
+
+        Raises
+        ------
+        None
+
+        """
+        tasks = [
+            (
+                ring.name,
+                seq,
+                self.shape,
+                self.dtype,
+                self.codec,
+                path,
+                self.fsync,
+                self.preallocate,
+            )
+            for seq, path in zip(seqs, paths)
+        ]
+        return self._pool.map(_encodeToFile, tasks, chunksize=1)
+
+    def encodeToBytes(self, ring, seqs):
+        """Encodes the frames with the given sequence numbers in memory.
+
+        Parameters
+        ----------
+        ring : FrameRing
+            The rolling buffer holding the frames.
+        seqs : list
+            The sequence numbers of the frames.
+
+        Returns
+        -------
+        iterator
+            Yields the encoded image of every frame in order as it becomes
+            ready, None for frames that could not be encoded.
+
+        Raises
+        ------
+        None
+
+        """
+        tasks = [(ring.name, seq, self.shape, self.dtype, self.codec) for seq in seqs]
+        return self._pool.imap(_encodeFrame, tasks)
+
+    def close(self):
+        """Stops the worker processes."""
+        self._pool.close()
+        self._pool.join()
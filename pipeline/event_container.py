@@ -0,0 +1,585 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Single file container for the frames of an event.
+
+Author: Imran Matin
+Email: imatin@ucsd.edu
+
+Usage:
+# print the frames stored in an event
+python -m pipeline.event_container info images/<event>/event.wgev
+# convert an event back to one image per frame for existing tooling
+python -m pipeline.event_container convert images/<event>/event.wgev <directory>
+
+Writing one file per frame costs an inode, a directory entry and their
+metadata updates per frame, which is slow on flash storage and makes listing
+old events slow. A container holds a whole event in one append-only file:
+
+    header   magic "WGEVENT1", version and reserved bytes
+    frames   the frames back to back, each starting on an ALIGNMENT boundary
+    index    one INDEX_DTYPE row per frame: offset, size, sequence number,
+             timestamp and codec
+    meta     JSON with the codec names, the raw frame shape and type and any
+             extra information about the event
+    trailer  offset of the index, number of frames, size of the meta and the
+             magic "WGEVIDX1"
+
+The index is only written when the event is complete, so a container without a
+trailer was interrupted. Frames are stored oldest first. EventContainer reads
+and decodes frames one at a time, MappedEvent memory-maps the container and
+returns raw frames as NumPy views without copying them.
+"""
+
+import os
+import sys
+import json
+import struct
+import argparse
+import numpy as np
+
+import cv2
+
+from pipeline.codec import decodeImage
+
+# Magic numbers at the start and the end of a container
+MAGIC = b"WGEVENT1"
+INDEX_MAGIC = b"WGEVIDX1"
+VERSION = 1
+# Header: magic, version, reserved
+HEADER = struct.Struct("<8sII")
+# Trailer: index offset, number of frames, meta size, magic
+TRAILER = struct.Struct("<QQQ8s")
+# Every frame starts on a multiple of this many bytes so raw frames can be
+# viewed as arrays of any pixel type
+ALIGNMENT = 64
+# One row per frame
+INDEX_DTYPE = np.dtype(
+    [
+        ("offset", "<u8"),
+        ("size", "<u8"),
+        ("seq", "<i8"),
+        ("timestamp", "<f8"),
+        ("codec", "<u2"),
+        ("reserved", "<u2", (3,)),
+    ]
+)
+# Name of the container written inside an event's directory
+CONTAINER_NAME = "event.wgev"
+# Codec of frames stored as raw pixels
+RAW_CODEC = "raw"
+
+
+def codecFromExt(ext):
+    """Returns the codec name of an image extension, ".png" is "png"."""
+    return ext.lstrip(".").lower()
+
+
+class ContainerWriter:
+    """Appends the frames of one event to a new container file.
+
+    Parameters
+    ----------
+    path : str
+        The path of the container to create.
+    meta : dict
+        Extra information stored with the event, must be JSON serializable.
+    fsync : bool
+        Flush the container and its directory to storage when it is closed.
+
+    Attributes
+    ----------
+    path : str
+        The path of the container.
+    nbytes : int
+        The number of bytes written so far.
+
+    """
+
+    def __init__(self, path, meta=None, fsync=False):
+        self.path = path
+        self.fsync = fsync
+        self._meta = dict(meta or {})
+        self._codecs = []
+        self._rows = []
+        self._file = open(path, "wb")
+        self._file.write(HEADER.pack(MAGIC, VERSION, 0))
+        self.nbytes = HEADER.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _codecId(self, codec):
+        """Returns the index of a codec in the container's codec table."""
+        if codec not in self._codecs:
+            self._codecs.append(codec)
+        return self._codecs.index(codec)
+
+    def append(self, data, codec, seq=-1, timestamp=0.0):
+        """Appends one frame.
+
+        Parameters
+        ----------
+        data : bytes-like
+            The frame, any contiguous buffer such as an encoded image or a raw
+            NumPy frame.
+        codec : str
+            The codec of the frame, for example "png" or "raw".
+        seq : int
+            The sequence number of the frame in the rolling buffer.
+        timestamp : float
+            The time the frame was captured.
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        None
+
+        """
+        view = memoryview(data).cast("B")
+        padding = -self.nbytes % ALIGNMENT
+        if padding:
+            self._file.write(bytes(padding))
+            self.nbytes += padding
+        self._rows.append(
+            (self.nbytes, view.nbytes, seq, timestamp, self._codecId(codec), (0, 0, 0))
+        )
+        self._file.write(view)
+        self.nbytes += view.nbytes
+
+    def setRawFormat(self, shape, dtype):
+        """Records the shape and type of the frames stored with the raw codec."""
+        self._meta["shape"] = list(shape)
+        self._meta["dtype"] = np.dtype(dtype).str
+
+    def close(self):
+        """Writes the index, meta and trailer and closes the container."""
+        if self._file is None:
+            return
+        index = np.array(self._rows, dtype=INDEX_DTYPE)
+        self._meta["codecs"] = self._codecs
+        meta = json.dumps(self._meta).encode("utf-8")
+        indexOffset = self.nbytes
+        self._file.write(index.tobytes())
+        self._file.write(meta)
+        self._file.write(TRAILER.pack(indexOffset, len(index), len(meta), INDEX_MAGIC))
+        self.nbytes += index.nbytes + len(meta) + TRAILER.size
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        if self.fsync:
+            # the directory entry has to reach storage too
+            fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+
+def _checkHeader(header, path):
+    """Raises ValueError if header is not the header of a supported container."""
+    magic, version, reserved = HEADER.unpack(bytes(header))
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not an event container")
+    if version > VERSION:
+        raise ValueError(f"{path} has unsupported version {version}")
+
+
+def _checkTrailer(trailer, path):
+    """Returns the index offset, frame count and meta size from a trailer."""
+    indexOffset, numFrames, metaSize, magic = TRAILER.unpack(bytes(trailer))
+    if magic != INDEX_MAGIC:
+        raise ValueError(f"{path} is incomplete, it has no frame index")
+    return indexOffset, numFrames, metaSize
+
+
+class EventContainer:
+    """Reads the frames of a container.
+
+    Parameters
+    ----------
+    path : str
+        The path of the container.
+
+    Attributes
+    ----------
+    index : numpy.ndarray
+        One INDEX_DTYPE row per frame, oldest first.
+    meta : dict
+        The information stored with the event.
+    codecs : list
+        The codec names, indexed by the codec column of the index.
+
+    Raises
+    ------
+    ValueError
+        When the file is not a complete container.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._readFooter()
+        except:
+            self._file.close()
+            raise
+
+    def _readFooter(self):
+        """Reads and checks the header, trailer, index and meta."""
+        _checkHeader(self._file.read(HEADER.size), self.path)
+        self._file.seek(-TRAILER.size, os.SEEK_END)
+        indexOffset, numFrames, metaSize = _checkTrailer(
+            self._file.read(TRAILER.size), self.path
+        )
+        self._file.seek(indexOffset)
+        self.index = np.frombuffer(
+            self._file.read(numFrames * INDEX_DTYPE.itemsize), INDEX_DTYPE
+        )
+        self.meta = json.loads(self._file.read(metaSize).decode("utf-8"))
+        self.codecs = self.meta.get("codecs", [])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def timestamps(self):
+        """The capture time of every frame, oldest first."""
+        return self.index["timestamp"]
+
+    def codec(self, i):
+        """Returns the codec name of frame i."""
+        return self.codecs[self.index["codec"][i]]
+
+    def read(self, i):
+        """Returns the stored bytes of frame i."""
+        row = self.index[i]
+        return os.pread(self._file.fileno(), int(row["size"]), int(row["offset"]))
+
+    def decode(self, i):
+        """Returns frame i as an image array.
+
+        Parameters
+        ----------
+        i : int
+            The position of the frame, oldest first.
+
+        Returns
+        -------
+        numpy.ndarray
+            Returns the decoded frame.
+
+        Raises
+        ------
+        None
+
+        """
+        data = np.frombuffer(self.read(i), np.uint8)
+        if self.codec(i) == RAW_CODEC:
+            return data.view(self.meta["dtype"]).reshape(self.meta["shape"])
+        return decodeImage(data, self.codec(i))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.decode(i)
+
+    def close(self):
+        """Closes the container."""
+        self._file.close()
+
+
+class MappedEvent:
+    """Memory-maps a container and returns its frames as zero copy views.
+
+    Only the pages of the frames that are actually looked at are read from
+    storage, so opening an event to check its index is cheap. Frames stored
+    with the raw codec are returned as NumPy arrays viewing the mapping
+    directly, other frames as uint8 views of their encoded bytes. The views
+    stay valid as long as they are referenced, even after `close()`.
+
+    Parameters
+    ----------
+    path : str
+        The path of the container.
+
+    Attributes
+    ----------
+    index : numpy.ndarray
+        One INDEX_DTYPE row per frame, oldest first.
+    meta : dict
+        The information stored with the event.
+    codecs : list
+        The codec names, indexed by the codec column of the index.
+
+    Raises
+    ------
+    ValueError
+        When the file is not a complete container.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._map = np.memmap(path, np.uint8, "r")
+        _checkHeader(self._map[: HEADER.size], path)
+        indexOffset, numFrames, metaSize = _checkTrailer(
+            self._map[-TRAILER.size :], path
+        )
+        indexEnd = indexOffset + numFrames * INDEX_DTYPE.itemsize
+        self.index = self._map[indexOffset:indexEnd].view(INDEX_DTYPE)
+        self.meta = json.loads(bytes(self._map[indexEnd : indexEnd + metaSize]))
+        self.codecs = self.meta.get("codecs", [])
+        if RAW_CODEC in self.meta.get("codecs", []):
+            self.shape = tuple(self.meta["shape"])
+            self.dtype = np.dtype(self.meta["dtype"])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            # a negative step walks down from start to just above stop
+            if step < 0:
+                return self.frames(stop + 1, start + 1)[::step]
+            return self.frames(start, stop)[::step]
+        return self.frame(key)
+
+    @property
+    def timestamps(self):
+        """The capture time of every frame, oldest first."""
+        return self.index["timestamp"]
+
+    def isRaw(self, i):
+        """Returns True if frame i is stored as raw pixels."""
+        return self.codecs[self.index["codec"][i]] == RAW_CODEC
+
+    def frame(self, i):
+        """Returns frame i without copying it.
+
+        Parameters
+        ----------
+        i : int
+            The position of the frame, oldest first.
+
+        Returns
+        -------
+        numpy.ndarray
+            Returns a view of the raw frame, or of the encoded bytes for
+            frames that are not raw.
+
+        Raises
+        ------
+        None
+
+        """
+        row = self.index[i]
+        start = int(row["offset"])
+        data = self._map[start : start + int(row["size"])]
+        if self.isRaw(i):
+            return data.view(self.dtype).reshape(self.shape)
+        return data
+
+    def frames(self, start=0, stop=None):
+        """Returns a range of raw frames as one array without copying them.
+
+        Parameters
+        ----------
+        start : int
+            The position of the first frame, oldest first.
+        stop : int
+            The position after the last frame, the end of the event when None.
+
+        Returns
+        -------
+        numpy.ndarray or list
+            Returns a (frames, *shape) view when the frames are raw and evenly
+            spaced in the file, which is how the cSBC writes them, otherwise
+            a list of per frame views.
+
+        Raises
+        ------
+        None
+
+        """
+        indices = range(*slice(start, stop).indices(len(self)))
+        rows = self.index[start:stop]
+        if len(rows) == 0:
+            return []
+        offsets = rows["offset"].astype(np.int64)
+        steps = np.diff(offsets)
+        uniform = all(self.isRaw(i) for i in indices) and (steps == steps[:1]).all()
+        if not uniform:
+            return [self.frame(i) for i in indices]
+        step = int(steps[0]) if len(steps) else 0
+        frameStrides = np.empty(self.shape, self.dtype).strides
+        return np.ndarray(
+            (len(rows),) + self.shape,
+            self.dtype,
+            self._map,
+            int(offsets[0]),
+            (step,) + frameStrides,
+        )
+
+    def between(self, startTime, stopTime):
+        """Returns the frames captured in [startTime, stopTime).
+
+        Parameters
+        ----------
+        startTime : float
+            The earliest capture time to include.
+        stopTime : float
+            The capture time to stop before.
+
+        Returns
+        -------
+        numpy.ndarray or list
+            Returns the frames like `frames()`.
+
+        Raises
+        ------
+        None
+
+        """
+        start, stop = np.searchsorted(self.timestamps, [startTime, stopTime])
+        return self.frames(int(start), int(stop))
+
+    def close(self):
+        """Drops this reader's reference to the mapping."""
+        self._map = self.index = None
+
+
+def iterEvents(directory):
+    """Yields a MappedEvent for every complete container under directory.
+
+    Parameters
+    ----------
+    directory : str
+        The image directory holding one directory per event.
+
+    Returns
+    -------
+    iterator
+        Yields (path, MappedEvent) in name order, skipping incomplete
+        containers.
+
+    Raises
+    ------
+    None
+
+    """
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name, CONTAINER_NAME)
+        if not os.path.exists(path):
+            continue
+        try:
+            event = MappedEvent(path)
+        except ValueError:
+            continue
+        yield path, event
+
+
+def toImages(path, directory, newestFirst=True):
+    """Converts a container back to one image file per frame.
+
+    Frames are named img_0, img_1, ... like the cSBC writes events, with img_0
+    the newest frame unless newestFirst is False. Encoded frames are written
+    as they are stored and raw frames are written as PNG. The frame timestamps
+    are written to timestamps.txt in the same order, which lets the replay
+    camera reproduce the event's timing.
+
+    Parameters
+    ----------
+    path : str
+        The path of the container.
+    directory : str
+        The directory to write the images to, created if missing.
+    newestFirst : bool
+        Number the frames from the newest instead of the oldest.
+
+    Returns
+    -------
+    int
+        Returns the number of images written.
+
+    Raises
+    ------
+    None
+
+    """
+    os.makedirs(directory, exist_ok=True)
+    with EventContainer(path) as container:
+        order = range(len(container))
+        if newestFirst:
+            order = reversed(order)
+        timestamps = []
+        for n, i in enumerate(order):
+            codec = container.codec(i)
+            if codec == RAW_CODEC:
+                name = os.path.join(directory, f"img_{n}.png")
+                cv2.imwrite(name, container.decode(i))
+            else:
+                name = os.path.join(directory, f"img_{n}.{codec}")
+                with open(name, "wb") as f:
+                    f.write(container.read(i))
+            timestamps.append(float(container.timestamps[i]))
+        with open(os.path.join(directory, "timestamps.txt"), "w") as f:
+            f.writelines(f"{t:.6f}\n" for t in timestamps)
+        return len(timestamps)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or convert event containers.")
+    commands = parser.add_subparsers(dest="command")
+    info = commands.add_parser("info", help="Print the frames of a container")
+    info.add_argument("path", help="Path of the container")
+    convert = commands.add_parser("convert", help="Write one image per frame")
+    convert.add_argument("path", help="Path of the container")
+    convert.add_argument("directory", help="Directory to write the images to")
+    convert.add_argument(
+        "--oldest-first", action="store_true", help="Number frames from the oldest"
+    )
+    args = parser.parse_args()
+
+    if args.command == "info":
+        with EventContainer(args.path) as container:
+            print(f"{len(container)} frames, meta: {container.meta}")
+            for i, row in enumerate(container.index):
+                print(
+                    f"{i:5d} seq={row['seq']} time={row['timestamp']:.6f} "
+                    f"size={row['size']} codec={container.codec(i)}"
+                )
+    elif args.command == "convert":
+        count = toImages(args.path, args.directory, not args.oldest_first)
+        print(f"Wrote {count} images to {args.directory}.")
+    else:
+        parser.print_help()
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,385 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Fixed size ring of frame slots in shared memory.
+
+Author: Imran Matin
+Email: imatin@ucsd.edu
+
+Replaces the deque of encoded images used as the rolling buffer. All memory is
+allocated once when the ring is created: a header, a metadata array with one
+row per slot and the slots themselves, all in one multiprocessing shared memory
+block. Frames are copied into their slot in place and any process that attaches
+to the ring by name can read the slots as NumPy views without pickling or
+copying them.
+
+There is a single writer. A slot's metadata row is invalidated before the slot
+is overwritten and published again once the frame is complete, so a reader
+checks `isValid()` after it is done with a view to know the frame was not
+overwritten underneath it.
+"""
+
+import os
+import time
+import numpy as np
+from multiprocessing import shared_memory
+
+# Header of the ring: geometry, next sequence number to write and the oldest
+# sequence number that has not been cleared
+HEADER_DTYPE = np.dtype(
+    [("num_slots", "<i8"), ("slot_size", "<i8"), ("head", "<i8"), ("tail", "<i8")]
+)
+# Shape of the small grey image of a frame used to compare frames, see
+# pipeline/dedup.py
+SIGNATURE_SHAPE = (24, 32)
+# One row per slot describing the frame in it, seq is -1 while being written:
+# wall and monotonic time of the capture, the camera's frame id and timestamp
+# in nanoseconds (-1 when unknown), the size of the frame in the slot and its
+# signature (zeros when unknown)
+META_DTYPE = np.dtype(
+    [
+        ("seq", "<i8"),
+        ("timestamp", "<f8"),
+        ("size", "<i8"),
+        ("monotonic", "<f8"),
+        ("frame_id", "<i8"),
+        ("camera_ts", "<i8"),
+        ("signature", "u1", SIGNATURE_SHAPE),
+    ]
+)
+# Alignment of each section of the shared memory block in bytes
+ALIGNMENT = 64
+
+
+def _align(size):
+    """Rounds size up to the next multiple of ALIGNMENT."""
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _openSharedMemory(name):
+    """Attaches to an existing shared memory block without taking ownership.
+
+    Only the creator of the ring unlinks it, so the attaching process must not
+    register the block with its resource tracker or it will be unlinked or
+    reported as leaked when that process exits.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # python < 3.13 has no track argument
+        from multiprocessing import resource_tracker
+
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+class FrameRing:
+    """Preallocated ring of frame slots with a metadata row per slot.
+
+    Parameters
+    ----------
+    numSlots : int
+        The number of frames the ring holds.
+    slotSize : int
+        The size of each slot in bytes, frames larger than this are dropped.
+    name : str
+        The name of the shared memory block, generated when None.
+
+    Attributes
+    ----------
+    name : str
+        The name to attach to this ring from another process.
+    numSlots : int
+        The number of frames the ring holds.
+    slotSize : int
+        The size of each slot in bytes.
+    meta : numpy.ndarray
+        The metadata rows of every slot, indexed by slot not sequence number.
+
+    """
+
+    def __init__(self, numSlots, slotSize, name=None):
+        numSlots, slotSize = int(numSlots), int(slotSize)
+        metaOffset = _align(HEADER_DTYPE.itemsize)
+        dataOffset = metaOffset + _align(numSlots * META_DTYPE.itemsize)
+        self._shm = shared_memory.SharedMemory(
+            name=name, create=True, size=dataOffset + numSlots * slotSize
+        )
+        # only the creating process unlinks, forked children inherit this object
+        self._owner = os.getpid()
+        self._map(numSlots, slotSize)
+        self._header["num_slots"] = numSlots
+        self._header["slot_size"] = slotSize
+        self._header["head"] = 0
+        self._header["tail"] = 0
+        self.meta["seq"] = -1
+
+    @classmethod
+    def attach(cls, name):
+        """Attaches to a ring created by another process.
+
+        Parameters
+        ----------
+        name : str
+            The name of the ring to attach to.
+
+        Returns
+        -------
+        FrameRing
+            Returns a ring sharing its memory with the creator's ring.
+
+        Raises
+        ------
+        FileNotFoundError
+            When no ring with this name exists.
+
+        """
+        ring = cls.__new__(cls)
+        ring._shm = _openSharedMemory(name)
+        ring._owner = None
+        header = np.ndarray((), HEADER_DTYPE, ring._shm.buf)
+        ring._map(int(header["num_slots"]), int(header["slot_size"]))
+        return ring
+
+    def _map(self, numSlots, slotSize):
+        """Creates the NumPy views of each section of the shared memory block."""
+        buf = self._shm.buf
+        metaOffset = _align(HEADER_DTYPE.itemsize)
+        dataOffset = metaOffset + _align(numSlots * META_DTYPE.itemsize)
+        self.name = self._shm.name
+        self.numSlots = numSlots
+        self.slotSize = slotSize
+        self._header = np.ndarray((), HEADER_DTYPE, buf)
+        self.meta = np.ndarray((numSlots,), META_DTYPE, buf, metaOffset)
+        self._data = np.ndarray((numSlots, slotSize), np.uint8, buf, dataOffset)
+
+    def __getstate__(self):
+        # other processes attach by name instead of pickling the frames
+        return self.name
+
+    def __setstate__(self, name):
+        self.__dict__.update(FrameRing.attach(name).__dict__)
+
+    def __len__(self):
+        return int(self._header["head"] - self.oldest())
+
+    @property
+    def head(self):
+        """The sequence number the next frame will be written with."""
+        return int(self._header["head"])
+
+    def oldest(self):
+        """Returns the sequence number of the oldest frame still in the ring."""
+        return int(max(self._header["tail"], self._header["head"] - self.numSlots))
+
+    def sequences(self):
+        """Returns the sequence numbers currently in the ring, oldest first."""
+        return range(self.oldest(), self.head)
+
+    def between(self, start, end):
+        """Returns the sequence numbers of the frames captured from start to end.
+
+        Parameters
+        ----------
+        start : float
+            The earliest capture time, inclusive.
+        end : float
+            The latest capture time, inclusive.
+
+        Returns
+        -------
+        list
+            Returns the sequence numbers, oldest first.
+
+        Raises
+        ------
+        None
+
+        """
+        seqs = np.arange(self.oldest(), self.head, dtype=np.int64)
+        rows = self.meta[seqs % self.numSlots]
+        keep = (rows["seq"] == seqs) & (rows["timestamp"] >= start)
+        keep &= rows["timestamp"] <= end
+        return seqs[keep].tolist()
+
+    def reserve(self):
+        """Claims the next slot so a frame can be written straight into it.
+
+        Returns
+        -------
+        seq
+            Returns the sequence number to pass to `commit()`.
+        slot
+            Returns the whole slot as a writable uint8 view.
+
+        Raises
+        ------
+        None
+
+        """
+        seq = self.head
+        index = seq % self.numSlots
+        # invalidate the slot before its bytes change
+        self.meta["seq"][index] = -1
+        return seq, self._data[index]
+
+    def commit(
+        self,
+        seq,
+        size,
+        timestamp=None,
+        monotonic=None,
+        frameId=-1,
+        cameraTimestamp=-1,
+        signature=None,
+    ):
+        """Publishes a frame written into a reserved slot.
+
+        Parameters
+        ----------
+        seq : int
+            The sequence number returned by `reserve()`.
+        size : int
+            The number of bytes of the slot that hold the frame.
+        timestamp : float
+            The time the frame was captured, defaults to now.
+        monotonic : float
+            The monotonic clock when the frame was captured, defaults to now.
+        frameId : int
+            The camera's id of the frame, -1 when unknown.
+        cameraTimestamp : int
+            The camera's timestamp of the frame in nanoseconds, -1 when unknown.
+        signature : numpy.ndarray
+            The frame's SIGNATURE_SHAPE grey image, None when unknown.
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        None
+
+        """
+        index = seq % self.numSlots
+        row = self.meta[index]
+        row["timestamp"] = time.time() if timestamp is None else timestamp
+        row["monotonic"] = time.monotonic() if monotonic is None else monotonic
+        row["frame_id"] = frameId
+        row["camera_ts"] = cameraTimestamp
+        row["signature"] = 0 if signature is None else signature
+        row["size"] = size
+        # the sequence number goes last so readers only see complete frames
+        row["seq"] = seq
+        self._header["head"] = seq + 1
+
+    def write(
+        self,
+        data,
+        timestamp=None,
+        monotonic=None,
+        frameId=-1,
+        cameraTimestamp=-1,
+        signature=None,
+    ):
+        """Copies a frame into the next slot.
+
+        Parameters
+        ----------
+        data : numpy.ndarray or bytes
+            The frame to store, for example the result of `cv2.imencode()`.
+        timestamp, monotonic, frameId, cameraTimestamp, signature
+            Describe the frame, see `commit()`.
+
+        Returns
+        -------
+        seq
+            Returns the sequence number of the frame, or -1 if the frame is
+            larger than a slot and was dropped.
+
+        Raises
+        ------
+        None
+
+        """
+        frame = np.frombuffer(data, np.uint8) if isinstance(data, bytes) else data
+        frame = np.ascontiguousarray(frame).reshape(-1).view(np.uint8)
+        if frame.size > self.slotSize:
+            return -1
+        seq, slot = self.reserve()
+        slot[: frame.size] = frame
+        self.commit(
+            seq, frame.size, timestamp, monotonic, frameId, cameraTimestamp, signature
+        )
+        return seq
+
+    def info(self, seq):
+        """Returns the (timestamp, monotonic, frameId, cameraTimestamp, signature)
+        of a frame.
+
+        The values can be passed on to `write()` to copy the frame's
+        description along with it.
+        """
+        row = self.meta[seq % self.numSlots]
+        return (
+            float(row["timestamp"]),
+            float(row["monotonic"]),
+            int(row["frame_id"]),
+            int(row["camera_ts"]),
+            row["signature"].copy(),
+        )
+
+    def view(self, seq, dtype=np.uint8, shape=None):
+        """Returns a zero copy view of a frame.
+
+        Parameters
+        ----------
+        seq : int
+            The sequence number of the frame.
+        dtype : numpy.dtype
+            The type to view the frame's bytes as.
+        shape : tuple
+            The shape to view the frame as, flat when None.
+
+        Returns
+        -------
+        numpy.ndarray or None
+            Returns a view into the slot, or None if the frame is no longer in
+            the ring.
+
+        Raises
+        ------
+        None
+
+        """
+        index = seq % self.numSlots
+        row = self.meta[index]
+        if row["seq"] != seq or seq < self._header["tail"]:
+            return None
+        frame = self._data[index, : row["size"]].view(dtype)
+        return frame if shape is None else frame.reshape(shape)
+
+    def isValid(self, seq):
+        """Returns True if the frame has not been overwritten or cleared."""
+        return (
+            self.meta["seq"][seq % self.numSlots] == seq and seq >= self._header["tail"]
+        )
+
+    def clear(self):
+        """Drops every frame currently in the ring without touching the slots."""
+        self._header["tail"] = self._header["head"]
+
+    def nbytes(self):
+        """Returns the number of frame bytes currently held by the ring."""
+        return int(sum(self.meta["size"][s % self.numSlots] for s in self.sequences()))
+
+    def close(self):
+        """Detaches from the ring and frees it if this process created it."""
+        # the views must go before the shared memory can be closed
+        self._header = self.meta = self._data = None
+        self._shm.close()
+        if self._owner == os.getpid():
+            self._shm.unlink()
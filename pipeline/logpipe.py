@@ -0,0 +1,402 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Logging for many processes through a single log writer process.
+
+Author: Imran Matin
+Email: imatin@ucsd.edu
+
+Usage:
+# print the records of a binary event log
+python -m pipeline.logpipe logs/cSBC.events
+
+Every cSBC process used to write to the log file itself, so the processes
+contended for the file and their records could interleave, and the capture
+loop waited on the disk whenever it logged. Now `startLogging()` starts one
+LogWriter process that owns the log files, and gives the root logger a handler
+that only puts each record on a queue for it. Processes forked afterwards
+inherit the handler, so every process logs as before with `logger.debug()`
+and friends, and none of them ever touches the disk to do so.
+
+The queue is bounded. A record that does not fit because the writer has
+fallen behind is dropped rather than stalling the process, and the number of
+records dropped is logged once the queue has room again. Messages logged
+again and again from the same line, such as warnings in the capture loop, are
+rate limited in the process that logs them: at most LOG_BURST records per line
+are passed on every interval, and the next record passed on says how many were
+suppressed. Errors are never rate limited.
+
+The writer rotates the text log once it reaches its size limit, keeping a
+number of old logs as .1, .2, ...
+
+With the binary event log enabled, `logEvent()` records what happens to
+frames and events as fixed size EVENT_DTYPE rows in a separate file, which
+is cheap enough to do for every frame and can be loaded with NumPy by
+`readEvents()`. It is off by default and `logEvent()` then returns at once.
+"""
+
+import os
+import sys
+import queue
+import time
+import signal
+import logging
+import argparse
+import logging.handlers
+import numpy as np
+import multiprocessing as mp
+
+# Binary event log: a magic header followed by EVENT_DTYPE rows
+EVENT_MAGIC = b"WGEVLOG1"
+# One row per event: wall clock time, process id, event code, camera, an
+# integer value and a real value whose meaning depends on the code
+EVENT_DTYPE = np.dtype(
+    [
+        ("time", "<f8"),
+        ("pid", "<u4"),
+        ("code", "<u2"),
+        ("camera", "<u2"),
+        ("value", "<i8"),
+        ("number", "<f8"),
+    ]
+)
+# Event codes and what their value and number hold
+FRAME = 1  # a frame was read: camera frame id, capture time
+FRAME_INCOMPLETE = 2  # a read returned no complete frame
+FRAME_DROPPED = 3  # the encoder pool was behind and dropped a frame: frame id
+EVENT_HANDOFF = 4  # an event was handed off: event id, seconds late
+EVENT_WRITTEN = 5  # an event was written: event id, seconds to write
+EVENT_FAILED = 6  # an event failed: event id, seconds spent
+EVENT_NAMES = {
+    FRAME: "FRAME",
+    FRAME_INCOMPLETE: "FRAME_INCOMPLETE",
+    FRAME_DROPPED: "FRAME_DROPPED",
+    EVENT_HANDOFF: "EVENT_HANDOFF",
+    EVENT_WRITTEN: "EVENT_WRITTEN",
+    EVENT_FAILED: "EVENT_FAILED",
+}
+# Seconds to wait for the writer to drain the queue when logging stops
+CLOSE_TIMEOUT = 10
+
+# The queue of this process tree's writer, and whether events are logged,
+# inherited by forked processes
+_queue = None
+_events = False
+
+
+class RateLimitFilter(logging.Filter):
+    """Passes at most burst records per line of code every interval seconds.
+
+    Parameters
+    ----------
+    interval : float
+        The seconds each line's allowance lasts, 0 for no limit.
+    burst : int
+        The records passed per line and interval.
+
+    """
+
+    def __init__(self, interval, burst):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        # start of the interval, records passed and suppressed by line
+        self._lines = {}
+
+    def filter(self, record):
+        if self.interval <= 0 or record.levelno >= logging.ERROR:
+            return True
+        key = (record.pathname, record.lineno)
+        start, passed, suppressed = self._lines.get(key, (0.0, 0, 0))
+        if record.created - start >= self.interval:
+            start, passed = record.created, 0
+        if passed >= self.burst:
+            self._lines[key] = (start, passed, suppressed + 1)
+            return False
+        if suppressed:
+            record.msg = f"{record.msg} ({suppressed} similar suppressed)"
+        self._lines[key] = (start, passed + 1, 0)
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Puts records on the writer's queue, dropping them when it is full."""
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            if self.dropped:
+                note = logging.makeLogRecord(
+                    {
+                        "name": record.name,
+                        "levelno": logging.WARNING,
+                        "levelname": "WARNING",
+                        "msg": f"Dropped {self.dropped} log records, the log "
+                        "writer fell behind.",
+                    }
+                )
+                self.queue.put_nowait(note)
+                self.dropped = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _rotate(path, backups):
+    """Renames a log to .1, shifting older logs up and deleting the oldest."""
+    for i in range(backups - 1, 0, -1):
+        if os.path.exists(f"{path}.{i}"):
+            os.replace(f"{path}.{i}", f"{path}.{i + 1}")
+    if backups > 0 and os.path.exists(path):
+        os.replace(path, f"{path}.1")
+
+
+def _openEvents(path, backups):
+    """Starts a new binary event log, rotating the last one."""
+    _rotate(path, backups)
+    f = open(path, "wb")
+    f.write(EVENT_MAGIC)
+    return f
+
+
+def _logWriter(records, settings):
+    """Writes the records of every process until it receives None.
+
+    Parameters
+    ----------
+    records : multiprocessing.Queue
+        The log records, and the event rows as tuples.
+    settings : dict
+        The log file, message and date formats, size limit, number of old
+        logs to keep, whether to rotate at start, and the event log path.
+
+    Returns
+    -------
+    None
+
+    Raises
+    ------
+    None
+
+    """
+    # the main process stops the writer once every other process has exited,
+    # so it keeps writing their last records after a Ctrl-C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    maxBytes, backups = settings["maxBytes"], settings["backups"]
+    # start every run with an empty log, keeping the last run's as .1
+    if settings["fresh"]:
+        _rotate(settings["path"], backups)
+        open(settings["path"], "w").close()
+    handler = logging.handlers.RotatingFileHandler(
+        settings["path"], "a", maxBytes, backups
+    )
+    handler.setFormatter(logging.Formatter(settings["format"], settings["datefmt"]))
+    events = None
+    if settings["events"]:
+        events = _openEvents(settings["events"], backups)
+    try:
+        while True:
+            record = records.get()
+            if record is None:
+                break
+            if isinstance(record, logging.LogRecord):
+                handler.handle(record)
+                continue
+            if events is None:
+                continue
+            if maxBytes and events.tell() + EVENT_DTYPE.itemsize > maxBytes:
+                events.close()
+                events = _openEvents(settings["events"], backups)
+            events.write(np.array([record], EVENT_DTYPE).tobytes())
+    finally:
+        handler.close()
+        if events is not None:
+            events.close()
+
+
+class LogWriter:
+    """The process that writes the log records of every cSBC process.
+
+    Parameters
+    ----------
+    settings : dict
+        The settings of `_logWriter()`.
+    queueSize : int
+        The most records waiting to be written.
+
+    """
+
+    def __init__(self, settings, queueSize):
+        self.queue = mp.Queue(queueSize)
+        self._process = mp.Process(
+            target=_logWriter, args=(self.queue, settings), daemon=True
+        )
+        self._process.start()
+
+    @property
+    def pid(self):
+        """The process id of the writer."""
+        return self._process.pid
+
+    def close(self):
+        """Writes the records still queued and stops the writer."""
+        self.queue.put(None)
+        self._process.join(CLOSE_TIMEOUT)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join()
+
+
+def startLogging(
+    path,
+    messageFormat,
+    dateFormat,
+    level=logging.DEBUG,
+    fresh=True,
+    maxBytes=0,
+    backups=0,
+    queueSize=10000,
+    rateInterval=0.0,
+    rateBurst=10,
+    eventsPath=None,
+):
+    """Starts the log writer and sends this process's records to it.
+
+    Call it in the main process before starting any other process, they
+    inherit the handler when they are forked.
+
+    Parameters
+    ----------
+    path : str
+        The text log to write.
+    messageFormat, dateFormat : str
+        The formats of the text log's records and their times.
+    level : int
+        The lowest level logged.
+    fresh : bool
+        Start with an empty log, keeping the last one as .1.
+    maxBytes : int
+        The size a log is rotated at, 0 to never rotate it.
+    backups : int
+        The number of rotated logs to keep.
+    queueSize : int
+        The most records waiting to be written before records are dropped.
+    rateInterval : float
+        The seconds over which the records of each line are rate limited, 0
+        for no limit.
+    rateBurst : int
+        The records of each line passed every rateInterval.
+    eventsPath : str
+        The binary event log to write, None to not log events.
+
+    Returns
+    -------
+    LogWriter
+        Returns the writer, to be closed once every other process has exited.
+
+    Raises
+    ------
+    None
+
+    """
+    global _queue, _events
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    writer = LogWriter(
+        {
+            "path": path,
+            "format": messageFormat,
+            "datefmt": dateFormat,
+            "fresh": fresh,
+            "maxBytes": maxBytes,
+            "backups": backups,
+            "events": eventsPath,
+        },
+        queueSize,
+    )
+    handler = _QueueHandler(writer.queue)
+    handler.addFilter(RateLimitFilter(rateInterval, rateBurst))
+    root = logging.getLogger()
+    for old in list(root.handlers):
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level)
+    _queue, _events = writer.queue, eventsPath is not None
+    return writer
+
+
+def logEvent(code, camera=0, value=0, number=0.0):
+    """Records an event in the binary event log, if it is enabled.
+
+    Parameters
+    ----------
+    code : int
+        What happened, one of the event codes.
+    camera : int
+        The camera it happened to.
+    value : int
+        An integer describing it, see the event codes.
+    number : float
+        A real number describing it, see the event codes.
+
+    Returns
+    -------
+    None
+
+    Raises
+    ------
+    None
+
+    """
+    if not _events:
+        return
+    try:
+        _queue.put_nowait((time.time(), os.getpid(), code, camera, value, number))
+    except queue.Full:
+        pass
+
+
+def readEvents(path):
+    """Loads a binary event log as an array of EVENT_DTYPE rows.
+
+    Parameters
+    ----------
+    path : str
+        The binary event log.
+
+    Returns
+    -------
+    numpy.ndarray
+        Returns the events, oldest first.
+
+    Raises
+    ------
+    ValueError
+        When the file is not a binary event log.
+
+    """
+    with open(path, "rb") as f:
+        if f.read(len(EVENT_MAGIC)) != EVENT_MAGIC:
+            raise ValueError(f"{path} is not a binary event log")
+        data = f.read()
+    # a row cut short by a crash is left out
+    usable = len(data) // EVENT_DTYPE.itemsize * EVENT_DTYPE.itemsize
+    return np.frombuffer(data[:usable], EVENT_DTYPE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print a binary event log.")
+    parser.add_argument("path", help="The binary event log")
+    args = parser.parse_args()
+    for row in readEvents(args.path):
+        print(
+            f"{row['time']:.6f} pid={row['pid']} camera={row['camera']} "
+            f"{EVENT_NAMES.get(int(row['code']), row['code'])} "
+            f"value={row['value']} number={row['number']:.6f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
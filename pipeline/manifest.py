@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Per-frame metadata of an event, stored as one binary manifest.
+
+Author: Imran Matin
+Email: imatin@ucsd.edu
+
+Every frame in the rolling buffer carries its capture time on the host's wall
+and monotonic clocks and the camera's frame id and timestamp. When an event is
+written these are copied into a table with one row per frame, together with
+the number of bytes written for the frame, and saved next to the images as a
+single NumPy .npy file. Rows are in the order the frames were written, so row i
+describes img_i of an image event. A container only holds the frames that were
+written, in the order of the rows with a size.
+
+Frames skipped as near duplicates (see pipeline/dedup.py) keep their row, with
+no size and the sequence number of the written frame they duplicate as ref.
+
+Gaps in the camera's frame ids show frames the camera delivered that never
+reached the rolling buffer, and gaps in the sequence numbers show frames that
+were dropped on their way into it.
+"""
+
+import io
+import os
+import numpy as np
+
+# Name of the manifest in the event directory
+MANIFEST_NAME = "manifest.npy"
+# One row per frame: rolling buffer sequence number, host monotonic and wall
+# time of the capture, camera frame id and timestamp in nanoseconds (-1 when
+# unknown), the bytes written for the frame (-1 when it was not written) and
+# the sequence number of the frame it duplicates (-1 when it is not skipped)
+MANIFEST_DTYPE = np.dtype(
+    [
+        ("seq", "<i8"),
+        ("monotonic", "<f8"),
+        ("timestamp", "<f8"),
+        ("frame_id", "<i8"),
+        ("camera_ts", "<i8"),
+        ("size", "<i8"),
+        ("ref", "<i8"),
+    ]
+)
+
+
+def buildManifest(ring, seqs, sizes, refs=None):
+    """Copies the metadata of an event's frames out of the rolling buffer.
+
+    Parameters
+    ----------
+    ring : FrameRing
+        The rolling buffer holding the frames.
+    seqs : list
+        The sequence numbers of the frames in the order they were written.
+    sizes : list
+        The bytes written for each frame, -1 for frames that were not written.
+    refs : list
+        The sequence number of the frame each frame duplicates, -1 for frames
+        that are not skipped, None when none are.
+
+    Returns
+    -------
+    numpy.ndarray
+        Returns the manifest, one MANIFEST_DTYPE row per frame.
+
+    Raises
+    ------
+    None
+
+    """
+    seqs = np.asarray(seqs, np.int64)
+    rows = ring.meta[seqs % ring.numSlots]
+    manifest = np.empty(len(seqs), MANIFEST_DTYPE)
+    manifest["seq"] = seqs
+    for field in ("monotonic", "timestamp", "frame_id", "camera_ts"):
+        manifest[field] = rows[field]
+    manifest["size"] = sizes
+    manifest["ref"] = -1 if refs is None else refs
+    return manifest
+
+
+def encodeManifest(manifest):
+    """Returns the manifest as the bytes of a .npy file."""
+    buf = io.BytesIO()
+    np.save(buf, manifest, allow_pickle=False)
+    return buf.getbuffer()
+
+
+def readManifest(directory):
+    """Loads the manifest of an event directory.
+
+    Parameters
+    ----------
+    directory : str
+        The event directory.
+
+    Returns
+    -------
+    numpy.ndarray
+        Returns the manifest, one MANIFEST_DTYPE row per frame.
+
+    Raises
+    ------
+    FileNotFoundError
+        When the event has no manifest.
+
+    """
+    return np.load(os.path.join(directory, MANIFEST_NAME), allow_pickle=False)
+
+
+def skippedFrames(manifest):
+    """Returns how many frames of the event were skipped as duplicates."""
+    return int(np.count_nonzero(manifest["ref"] >= 0))
+
+
+def missingFrames(manifest):
+    """Returns how many frames the camera delivered that are not in the event."""
+    ids = np.sort(manifest["frame_id"][manifest["frame_id"] >= 0])
+    if ids.size < 2:
+        return 0
+    return int(ids[-1] - ids[0] + 1 - np.unique(ids).size)
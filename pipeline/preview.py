@@ -0,0 +1,474 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compact preview products of an event for the satellite downlink.
+
+Author: Imran Matin
+Email: imatin@ucsd.edu
+
+Usage:
+# build the previews of an event that is already on disk
+python -m pipeline.preview images/<event>
+
+A whole event is far too large to send over the glider's link, so once an
+event is written a low priority process builds three small products from it in
+the event's preview directory:
+
+    thumbnails.wgev  a few evenly spaced frames, downscaled, as JPEG frames in
+                     an event container
+    sheet.jpg        a contact sheet, a grid of small tiles of evenly spaced
+                     frames in one JPEG
+    clip.wgev        every few frames, downscaled further, as JPEG frames in an
+                     event container
+
+Each product has a byte budget. Its frames are encoded at falling JPEG
+qualities, and then shrunk, until the product fits. A product is written under
+a temporary name and renamed once complete, so it is never read half written.
+The containers are read with EventContainer like any other event.
+"""
+
+import os
+import sys
+import math
+import argparse
+import numpy as np
+import multiprocessing as mp
+
+import cv2
+
+from pipeline import trace
+from pipeline.codec import readImage
+from pipeline.manifest import readManifest
+from pipeline.event_container import (
+    ContainerWriter,
+    EventContainer,
+    codecFromExt,
+    CONTAINER_NAME,
+)
+
+# Products
+THUMBNAILS = "thumbnails"
+CONTACT_SHEET = "sheet"
+CLIP = "clip"
+PRODUCTS = (THUMBNAILS, CONTACT_SHEET, CLIP)
+# Directory in the event's directory holding the products, and their names
+PREVIEW_DIR = "preview"
+PRODUCT_FILES = {
+    THUMBNAILS: "thumbnails.wgev",
+    CONTACT_SHEET: "sheet.jpg",
+    CLIP: "clip.wgev",
+}
+# Default byte budget of each product
+BUDGETS = {THUMBNAILS: 48000, CONTACT_SHEET: 24000, CLIP: 60000}
+# JPEG qualities tried in turn before the frames are shrunk
+QUALITIES = (80, 60, 45, 30, 20)
+# Factor the width is shrunk by when no quality fits, and the smallest width
+SHRINK = 0.75
+MIN_WIDTH = 16
+# Seconds to wait for the worker to build the last event's previews on close
+CLOSE_TIMEOUT = 30
+
+
+def productPath(directory, product):
+    """Returns the path of an event's preview product."""
+    return os.path.join(directory, PREVIEW_DIR, PRODUCT_FILES[product])
+
+
+def eventFrames(directory):
+    """Finds the frames of an event directory without decoding them.
+
+    Parameters
+    ----------
+    directory : str
+        The event directory, holding a container or one image per frame.
+
+    Returns
+    -------
+    timestamps
+        Returns the capture time of every frame on disk, oldest first.
+    load
+        Returns a function that decodes the frames at a list of positions in
+        timestamps, as a dict by position.
+
+    Raises
+    ------
+    FileNotFoundError
+        When the event has neither a container nor a manifest.
+
+    """
+    path = os.path.join(directory, CONTAINER_NAME)
+    if os.path.exists(path):
+        with EventContainer(path) as container:
+            timestamps = np.array(container.timestamps)
+
+        def loadFrames(positions):
+            with EventContainer(path) as container:
+                return {i: container.decode(i) for i in positions}
+
+        return timestamps, loadFrames
+    # images are named by their row in the manifest, newest first, and frames
+    # that were not written have no file
+    manifest = readManifest(directory)
+    names = {}
+    for name in os.listdir(directory):
+        stem, ext = os.path.splitext(name)
+        if stem.startswith("img_"):
+            names[int(stem[4:])] = name
+    rows = [i for i in range(len(manifest)) if i in names]
+    rows.sort(key=lambda i: manifest["timestamp"][i])
+    timestamps = manifest["timestamp"][rows]
+
+    def loadFrames(positions):
+        return {
+            i: readImage(os.path.join(directory, names[rows[i]])) for i in positions
+        }
+
+    return timestamps, loadFrames
+
+
+def spaced(numFrames, count):
+    """Returns the positions of count evenly spaced frames out of numFrames."""
+    if numFrames <= 0 or count <= 0:
+        return []
+    return (
+        np.unique(np.linspace(0, numFrames - 1, min(count, numFrames)).round())
+        .astype(int)
+        .tolist()
+    )
+
+
+def to8Bit(img):
+    """Returns a frame as 8 bit pixels, JPEG stores no more."""
+    if img.dtype == np.uint8:
+        return img
+    bits = np.iinfo(img.dtype).bits if img.dtype.kind in "ui" else 8
+    return (img >> (bits - 8)).astype(np.uint8)
+
+
+def resize(img, width):
+    """Returns a frame shrunk to width pixels wide, keeping its aspect."""
+    width = max(1, min(int(width), img.shape[1]))
+    if width == img.shape[1]:
+        return img
+    height = max(1, round(img.shape[0] * width / img.shape[1]))
+    return cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA)
+
+
+def encodeJpeg(img, quality):
+    """Returns a frame as the bytes of a JPEG."""
+    success, data = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not success:
+        raise ValueError("Could not encode a preview frame as JPEG")
+    return data
+
+
+def fitBudget(build, width):
+    """Builds a product at falling qualities and widths until it fits.
+
+    Parameters
+    ----------
+    build : function
+        Builds the product at a (quality, width) and returns whether it fits
+        its budget.
+    width : int
+        The width to start at.
+
+    Returns
+    -------
+    quality
+        Returns the JPEG quality the product was built at.
+    width
+        Returns the width the product was built at.
+    fits
+        Returns False if the product is over budget even at the lowest quality
+        and MIN_WIDTH, it is then built at those.
+
+    Raises
+    ------
+    None
+
+    """
+    while True:
+        for quality in QUALITIES:
+            if build(quality, width):
+                return quality, width, True
+        if width <= MIN_WIDTH:
+            return quality, width, False
+        width = max(MIN_WIDTH, int(width * SHRINK))
+
+
+def writeAtomic(path, data):
+    """Writes a file under a temporary name and renames it once complete."""
+    temp = path + ".tmp"
+    with open(temp, "wb") as f:
+        f.write(data)
+    os.replace(temp, path)
+
+
+def buildFrames(path, frames, timestamps, budget, width):
+    """Writes frames as a container of JPEGs within a byte budget.
+
+    Parameters
+    ----------
+    path : str
+        The path of the container.
+    frames : list
+        The 8 bit frames, oldest first.
+    timestamps : list
+        The capture time of every frame.
+    budget : int
+        The most bytes the container may take.
+    width : int
+        The width to start shrinking the frames from.
+
+    Returns
+    -------
+    dict
+        Returns the frames, bytes, quality and width of the product and
+        whether it fits its budget.
+
+    Raises
+    ------
+    None
+
+    """
+    temp = path + ".tmp"
+
+    def build(quality, width):
+        with ContainerWriter(temp, {"preview": True}) as container:
+            for frame, timestamp in zip(frames, timestamps):
+                data = encodeJpeg(resize(frame, width), quality)
+                container.append(data, codecFromExt(".jpg"), -1, float(timestamp))
+        return os.path.getsize(temp) <= budget
+
+    quality, width, fits = fitBudget(build, width)
+    os.replace(temp, path)
+    return {
+        "frames": len(frames),
+        "bytes": os.path.getsize(path),
+        "quality": quality,
+        "width": width,
+        "fits": fits,
+    }
+
+
+def contactSheet(frames, tileWidth):
+    """Tiles frames into a grid, as square as possible, left to right."""
+    tiles = [resize(frame, tileWidth) for frame in frames]
+    height = max(tile.shape[0] for tile in tiles)
+    width = max(tile.shape[1] for tile in tiles)
+    columns = math.ceil(math.sqrt(len(tiles)))
+    rows = math.ceil(len(tiles) / columns)
+    sheet = np.zeros((rows * height, columns * width) + tiles[0].shape[2:], np.uint8)
+    for i, tile in enumerate(tiles):
+        top, left = (i // columns) * height, (i % columns) * width
+        sheet[top : top + tile.shape[0], left : left + tile.shape[1]] = tile
+    return sheet
+
+
+def buildSheet(path, frames, budget, tileWidth):
+    """Writes a contact sheet of frames as one JPEG within a byte budget.
+
+    Parameters
+    ----------
+    path : str
+        The path of the JPEG.
+    frames : list
+        The 8 bit frames, oldest first.
+    budget : int
+        The most bytes the JPEG may take.
+    tileWidth : int
+        The width to start shrinking the tiles from.
+
+    Returns
+    -------
+    dict
+        Returns the frames, bytes, quality and tile width of the product and
+        whether it fits its budget.
+
+    Raises
+    ------
+    None
+
+    """
+    result = {}
+
+    def build(quality, width):
+        result["data"] = encodeJpeg(contactSheet(frames, width), quality)
+        return result["data"].nbytes <= budget
+
+    quality, width, fits = fitBudget(build, tileWidth)
+    writeAtomic(path, result["data"])
+    return {
+        "frames": len(frames),
+        "bytes": result["data"].nbytes,
+        "quality": quality,
+        "width": width,
+        "fits": fits,
+    }
+
+
+def buildPreviews(
+    directory,
+    budgets=BUDGETS,
+    thumbnails=8,
+    thumbnailWidth=320,
+    sheetFrames=16,
+    tileWidth=160,
+    clipStep=4,
+    clipWidth=160,
+):
+    """Builds every preview product of an event.
+
+    Parameters
+    ----------
+    directory : str
+        The event directory.
+    budgets : dict
+        The most bytes of each product, by product name.
+    thumbnails : int
+        The number of thumbnails.
+    thumbnailWidth : int
+        The width of the thumbnails before shrinking to fit.
+    sheetFrames : int
+        The number of frames in the contact sheet.
+    tileWidth : int
+        The width of each tile before shrinking to fit.
+    clipStep : int
+        The clip keeps every clipStep-th frame.
+    clipWidth : int
+        The width of the clip's frames before shrinking to fit.
+
+    Returns
+    -------
+    dict
+        Returns a report of every product built, by product name, see
+        `buildFrames()`.
+
+    Raises
+    ------
+    FileNotFoundError
+        When the directory holds no event.
+
+    """
+    timestamps, load = eventFrames(directory)
+    os.makedirs(os.path.join(directory, PREVIEW_DIR), exist_ok=True)
+    # decode each frame once even if several products use it
+    wanted = {
+        THUMBNAILS: spaced(len(timestamps), thumbnails),
+        CONTACT_SHEET: spaced(len(timestamps), sheetFrames),
+        CLIP: list(range(0, len(timestamps), max(1, clipStep))),
+    }
+    frames = load(sorted(set().union(*wanted.values())))
+    frames = {i: to8Bit(frame) for i, frame in frames.items()}
+    reports = {}
+    if not frames:
+        return reports
+    for product, positions in wanted.items():
+        path = productPath(directory, product)
+        images = [frames[i] for i in positions]
+        if product == CONTACT_SHEET:
+            reports[product] = buildSheet(path, images, budgets[product], tileWidth)
+            continue
+        width = thumbnailWidth if product == THUMBNAILS else clipWidth
+        times = timestamps[positions]
+        reports[product] = buildFrames(path, images, times, budgets[product], width)
+    return reports
+
+
+def _previewWorker(tasks, settings, logger):
+    """Builds the previews of every event directory queued until it gets None.
+
+    Parameters
+    ----------
+    tasks : multiprocessing.Queue
+        The event directories to build previews of.
+    settings : dict
+        The keyword arguments of `buildPreviews()`.
+    logger : logging
+        The logger of the process that started the worker.
+
+    Returns
+    -------
+    None
+
+    Raises
+    ------
+    None
+
+    """
+    # only run when nothing else wants the cores
+    if hasattr(os, "sched_setscheduler") and hasattr(os, "SCHED_IDLE"):
+        os.sched_setscheduler(0, os.SCHED_IDLE, os.sched_param(0))
+    else:
+        os.nice(19)
+    cv2.setNumThreads(1)
+    while True:
+        directory = tasks.get()
+        if directory is None:
+            break
+        try:
+            with trace.span("preview"):
+                reports = buildPreviews(directory, **settings)
+            for product, report in reports.items():
+                log = logger.debug if report["fits"] else logger.warning
+                log(
+                    f"Built {product} preview of {directory}: {report['frames']} "
+                    f"frames, {report['bytes']} bytes at quality {report['quality']} "
+                    f"and width {report['width']}"
+                    + ("." if report["fits"] else ", over its budget.")
+                )
+        except:
+            logger.error("Exception occurred", exc_info=True)
+
+
+class PreviewBuilder:
+    """A background process that builds the previews of written events.
+
+    Parameters
+    ----------
+    settings : dict
+        The keyword arguments of `buildPreviews()`.
+    logger : logging
+        The logger the worker reports to.
+
+    """
+
+    def __init__(self, settings, logger):
+        self._tasks = mp.Queue()
+        self._worker = mp.Process(
+            target=_previewWorker, args=(self._tasks, settings, logger), daemon=True
+        )
+        self._worker.start()
+
+    def submit(self, directory):
+        """Queues an event directory, returns at once."""
+        self._tasks.put(directory)
+
+    def pending(self):
+        """Returns the event directories waiting to be built, -1 if unknown."""
+        try:
+            return self._tasks.qsize()
+        except NotImplementedError:
+            # macOS cannot count a queue
+            return -1
+
+    def close(self):
+        """Builds the events still queued and stops the worker."""
+        self._tasks.put(None)
+        self._worker.join(CLOSE_TIMEOUT)
+        if self._worker.is_alive():
+            self._worker.terminate()
+            self._worker.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the previews of an event.")
+    parser.add_argument("directory", help="The event directory")
+    args = parser.parse_args()
+    for product, report in buildPreviews(args.directory).items():
+        print(f"{product}: {report}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,467 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Framed binary command protocol between the mSBC and the cSBCs.
+
+Author: Imran Matin
+Email: imatin@ucsd.edu
+
+The mSBC keeps one TCP connection open to each cSBC and sends every command
+over it. Each message is a frame with a fixed little endian header followed by
+a payload:
+
+    uint32  payload length in bytes
+    uint32  request id, chosen by the client and echoed in the response
+    uint16  command code in a request, status code in a response
+
+A request's payload is the struct in REQUESTS for its command, or empty for
+the defaults. A response's payload is the struct in RESPONSES for its command
+when the status is OK, so answers are a few bytes instead of formatted
+strings. The responses of commands in TRAILING_DATA carry bytes, such as a
+preview product, the JSON of the pipeline statistics or the path of a trace,
+after their struct. Requests can be pipelined: the client may send several
+before reading any response, and matches the responses to the requests by id.
+The blocking cSBC server answers the requests of a connection in the order
+they were sent, the asyncio server answers each as soon as it is done, so a
+quick command is not held up behind an EVENT.
+"""
+
+import time
+import socket
+import struct
+import asyncio
+
+# Header of every frame: payload length, request id, command or status code
+HEADER = struct.Struct("<IIH")
+# Largest payload accepted, anything larger means the stream is corrupt, a
+# preview product is the largest payload sent
+MAX_PAYLOAD = 1 << 20
+
+# Command codes
+UPTIME = 1
+EVENT = 2
+SHUTDOWN = 3
+EVENT_STATUS = 4
+PREVIEW = 5
+STATS = 6
+TRACE = 7
+COMMAND_NAMES = {
+    UPTIME: "UPTIME",
+    EVENT: "EVENT",
+    SHUTDOWN: "SHUTDOWN",
+    EVENT_STATUS: "EVENT_STATUS",
+    PREVIEW: "PREVIEW",
+    STATS: "STATS",
+    TRACE: "TRACE",
+}
+COMMAND_CODES = {name: code for code, name in COMMAND_NAMES.items()}
+
+# Status codes
+OK = 0
+ERROR = 1
+UNKNOWN_COMMAND = 2
+NOT_FOUND = 3
+STATUS_NAMES = {
+    OK: "OK",
+    ERROR: "ERROR",
+    UNKNOWN_COMMAND: "UNKNOWN_COMMAND",
+    NOT_FOUND: "NOT_FOUND",
+}
+
+# What became of an EVENT trigger
+TRIGGER_ACCEPTED = 0
+TRIGGER_COALESCED = 1
+TRIGGER_DROPPED_BUSY = 2
+TRIGGER_DROPPED_FULL = 3
+TRIGGER_DROPPED_SHUTDOWN = 4
+TRIGGER_NAMES = {
+    TRIGGER_ACCEPTED: "ACCEPTED",
+    TRIGGER_COALESCED: "COALESCED",
+    TRIGGER_DROPPED_BUSY: "DROPPED_BUSY",
+    TRIGGER_DROPPED_FULL: "DROPPED_FULL",
+    TRIGGER_DROPPED_SHUTDOWN: "DROPPED_SHUTDOWN",
+}
+
+# States of an event
+EVENT_UNKNOWN = 0
+EVENT_PENDING = 1
+EVENT_WRITING = 2
+EVENT_WRITTEN = 3
+EVENT_FAILED = 4
+EVENT_STATE_NAMES = {
+    EVENT_UNKNOWN: "UNKNOWN",
+    EVENT_PENDING: "PENDING",
+    EVENT_WRITING: "WRITING",
+    EVENT_WRITTEN: "WRITTEN",
+    EVENT_FAILED: "FAILED",
+}
+
+# When an EVENT is answered
+WAIT_NONE = 0
+WAIT_WRITTEN = 1
+WAIT_CAPTURED = 2
+
+# Preview products of an event, see pipeline/preview.py
+PREVIEW_THUMBNAILS = 0
+PREVIEW_CONTACT_SHEET = 1
+PREVIEW_CLIP = 2
+PRODUCT_NAMES = {
+    PREVIEW_THUMBNAILS: "thumbnails",
+    PREVIEW_CONTACT_SHEET: "sheet",
+    PREVIEW_CLIP: "clip",
+}
+PRODUCT_CODES = {name: code for code, name in PRODUCT_NAMES.items()}
+
+# What a TRACE does, see pipeline/trace.py
+TRACE_STATUS = 0
+TRACE_START = 1
+TRACE_STOP = 2
+TRACE_DUMP = 3
+TRACE_ACTION_NAMES = {
+    TRACE_STATUS: "status",
+    TRACE_START: "start",
+    TRACE_STOP: "stop",
+    TRACE_DUMP: "dump",
+}
+TRACE_ACTION_CODES = {name: code for code, name in TRACE_ACTION_NAMES.items()}
+
+# Payload of a request by command, an empty payload takes the defaults
+REQUESTS = {
+    # when to respond (see WAIT_), seconds before and after the trigger to
+    # write, negative for the cSBC's defaults, and the trigger's wall clock
+    # time, 0 for the time the request arrives
+    EVENT: struct.Struct("<Bddd"),
+    # event id
+    EVENT_STATUS: struct.Struct("<I"),
+    # event id, 0 for the newest written event, product and camera
+    PREVIEW: struct.Struct("<IBB"),
+    # trace action, see TRACE_, the default dumps the trace
+    TRACE: struct.Struct("<B"),
+}
+
+# Payload of an OK response by command
+RESPONSES = {
+    # uptime in seconds
+    UPTIME: struct.Struct("<d"),
+    # event id, trigger result and event state, the id is 0 when dropped
+    EVENT: struct.Struct("<IBB"),
+    # images written to disk in total
+    SHUTDOWN: struct.Struct("<q"),
+    # event id, event state and number of triggers coalesced into the event
+    EVENT_STATUS: struct.Struct("<IBH"),
+    # event id and product, followed by the product's bytes
+    PREVIEW: struct.Struct("<IB"),
+    # wall clock time of the snapshot, followed by the statistics as JSON, see
+    # pipeline/stats.py
+    STATS: struct.Struct("<d"),
+    # whether tracing is on and the spans recorded, followed by the path on
+    # the cSBC of the trace written by a dump, empty otherwise
+    TRACE: struct.Struct("<?I"),
+}
+
+# Commands whose OK response carries bytes after its struct
+TRAILING_DATA = {PREVIEW, STATS, TRACE}
+
+
+class ProtocolError(Exception):
+    """Raised when a frame cannot be read from the stream."""
+
+
+def pack(requestId, code, payload=b""):
+    """Builds one frame.
+
+    Parameters
+    ----------
+    requestId : int
+        The id of the request, echoed in its response.
+    code : int
+        The command code of a request or the status code of a response.
+    payload : bytes
+        The body of the frame.
+
+    Returns
+    -------
+    bytes
+        Returns the header and payload ready to send.
+
+    Raises
+    ------
+    None
+
+    """
+    return HEADER.pack(len(payload), requestId & 0xFFFFFFFF, code) + payload
+
+
+def packRequest(requestId, command, values=()):
+    """Builds the request frame of a command, see REQUESTS for the values."""
+    payload = b""
+    if values and command in REQUESTS:
+        payload = REQUESTS[command].pack(*values)
+    return pack(requestId, command, payload)
+
+
+def unpackRequest(command, payload):
+    """Returns the values of a request as a tuple, empty if it has none."""
+    if not payload or command not in REQUESTS:
+        return ()
+    return REQUESTS[command].unpack(payload)
+
+
+def packResponse(requestId, command, values=(), status=OK, data=b""):
+    """Builds the response frame to a command, see RESPONSES for the values.
+
+    The data is sent after the values for commands in TRAILING_DATA.
+    """
+    payload = b""
+    if status == OK and command in RESPONSES:
+        payload = RESPONSES[command].pack(*values)
+    if status == OK and command in TRAILING_DATA:
+        payload += bytes(data)
+    return pack(requestId, status, payload)
+
+
+def unpackResponse(command, status, payload):
+    """Returns the values of a response as a tuple, empty unless it is OK.
+
+    The bytes after the values are the last value for commands in
+    TRAILING_DATA.
+    """
+    if status != OK or command not in RESPONSES:
+        return ()
+    if command in TRAILING_DATA:
+        size = RESPONSES[command].size
+        return RESPONSES[command].unpack(payload[:size]) + (payload[size:],)
+    return RESPONSES[command].unpack(payload)
+
+
+def describeResponse(command, status, values):
+    """Returns a response as readable text for logging."""
+    if status != OK:
+        return STATUS_NAMES.get(status, str(status))
+    if command == EVENT:
+        eventId, result, state = values
+        return (
+            f"event {eventId} {TRIGGER_NAMES.get(result, result)} "
+            f"{EVENT_STATE_NAMES.get(state, state)}"
+        )
+    if command == PREVIEW:
+        eventId, product, data = values
+        return (
+            f"{PRODUCT_NAMES.get(product, product)} preview of event {eventId}, "
+            f"{len(data)} bytes"
+        )
+    if command == STATS:
+        snapshotTime, data = values
+        return f"stats, {len(data)} bytes"
+    if command == TRACE:
+        enabled, spans, path = values
+        return f"tracing {'on' if enabled else 'off'}, {spans} spans" + (
+            f" dumped to {path.decode()}" if path else ""
+        )
+    if command == EVENT_STATUS:
+        eventId, state, triggers = values
+        return (
+            f"event {eventId} {EVENT_STATE_NAMES.get(state, state)} "
+            f"from {triggers} triggers"
+        )
+    return f"OK {values}"
+
+
+def readFrame(stream):
+    """Reads one frame from a buffered stream.
+
+    Parameters
+    ----------
+    stream : io.BufferedReader
+        The reading side of a connection, from `socket.makefile("rb")`.
+
+    Returns
+    -------
+    tuple or None
+        Returns the (request id, code, payload) of the frame, or None if the
+        connection was closed between frames.
+
+    Raises
+    ------
+    ProtocolError
+        When the connection closes inside a frame or the length is invalid.
+
+    """
+    header = stream.read(HEADER.size)
+    if not header:
+        return None
+    if len(header) < HEADER.size:
+        raise ProtocolError("Connection closed inside a frame header")
+    length, requestId, code = HEADER.unpack(header)
+    if length > MAX_PAYLOAD:
+        raise ProtocolError(f"Frame payload of {length} bytes is too large")
+    payload = stream.read(length) if length else b""
+    if len(payload) < length:
+        raise ProtocolError("Connection closed inside a frame payload")
+    return requestId, code, payload
+
+
+async def readFrameAsync(reader):
+    """Reads one frame from an asyncio stream, see `readFrame()`.
+
+    Parameters
+    ----------
+    reader : asyncio.StreamReader
+        The reading side of a connection.
+
+    Returns
+    -------
+    tuple or None
+        Returns the (request id, code, payload) of the frame, or None if the
+        connection was closed between frames.
+
+    Raises
+    ------
+    ProtocolError
+        When the connection closes inside a frame or the length is invalid.
+
+    """
+    try:
+        header = await reader.readexactly(HEADER.size)
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise ProtocolError("Connection closed inside a frame header")
+    length, requestId, code = HEADER.unpack(header)
+    if length > MAX_PAYLOAD:
+        raise ProtocolError(f"Frame payload of {length} bytes is too large")
+    try:
+        payload = await reader.readexactly(length) if length else b""
+    except asyncio.IncompleteReadError:
+        raise ProtocolError("Connection closed inside a frame payload")
+    return requestId, code, payload
+
+
+def configureSocket(sock):
+    """Sends small frames immediately instead of waiting to coalesce them."""
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+class Client:
+    """A persistent connection to one cSBC.
+
+    Parameters
+    ----------
+    host : str
+        The cSBC's hostname or IP address.
+    port : int
+        The port the cSBC listens on.
+    timeout : float
+        The seconds to wait to connect, None to wait forever.
+
+    Attributes
+    ----------
+    pending : dict
+        The command code and send time of every request without a response,
+        by request id.
+
+    """
+
+    def __init__(self, host, port, timeout=None):
+        self._sock = socket.create_connection((host, port), timeout)
+        # commands like EVENT take as long as the event, so never time out reads
+        self._sock.settimeout(None)
+        configureSocket(self._sock)
+        self._reader = self._sock.makefile("rb")
+        self._nextId = 1
+        self.pending = {}
+
+    def send(self, command, values=()):
+        """Sends a request without waiting for its response.
+
+        Parameters
+        ----------
+        command : int
+            The command code.
+        values : tuple
+            The values of the request, see REQUESTS.
+
+        Returns
+        -------
+        int
+            Returns the request id to match the response with.
+
+        Raises
+        ------
+        OSError
+            When the connection is lost.
+
+        """
+        return self.sendMany([(command, values)])[0]
+
+    def sendMany(self, commands):
+        """Pipelines several requests in a single write and returns their ids.
+
+        Each command is a command code, or a (command code, values) pair.
+        """
+        ids, frames = [], []
+        now = time.perf_counter()
+        for command in commands:
+            command, values = command if isinstance(command, tuple) else (command, ())
+            requestId, self._nextId = self._nextId, (self._nextId + 1) & 0xFFFFFFFF
+            self.pending[requestId] = (command, now)
+            ids.append(requestId)
+            frames.append(packRequest(requestId, command, values))
+        self._sock.sendall(b"".join(frames))
+        return ids
+
+    def receive(self):
+        """Waits for the next response.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        requestId
+            Returns the id of the request answered.
+        command
+            Returns the command code of that request.
+        status
+            Returns the status code of the response.
+        values
+            Returns the values of the response, see RESPONSES.
+        seconds
+            Returns the round trip time of the request.
+
+        Raises
+        ------
+        ConnectionError
+            When the cSBC closes the connection.
+        ProtocolError
+            When the response cannot be read.
+
+        """
+        frame = readFrame(self._reader)
+        if frame is None:
+            raise ConnectionError("cSBC closed the connection")
+        requestId, status, payload = frame
+        command, sent = self.pending.pop(requestId, (None, time.perf_counter()))
+        values = unpackResponse(command, status, payload)
+        return requestId, command, status, values, time.perf_counter() - sent
+
+    def request(self, command, values=()):
+        """Sends a request and waits for its response, see `receive()`."""
+        self.send(command, values)
+        return self.receive()
+
+    def close(self):
+        """Closes the connection, waking any thread waiting in `receive()`."""
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            # already disconnected
+            pass
+        self._reader.close()
+        self._sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
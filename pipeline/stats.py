@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Live counters, gauges and latency histograms of the cSBC pipeline.
+
+Author: Imran Matin
+Email: imatin@ucsd.edu
+
+Every capture process owns a CaptureStats block in shared memory and updates
+it as it works, without a lock: each value is only ever written by one thread,
+and 8 byte values are read whole, so a reader at worst sees a snapshot that is
+a few frames out of date. The per frame cost is a handful of stores into
+shared memory. What changes slowly, the achieved frame rate, the occupancy of
+the rolling buffer and the depth of the queues, is measured by the capture
+loop itself and published at most every PUBLISH_INTERVAL seconds.
+
+The STATS command reads every camera's block from the connection handler and
+adds the CPU time and resident memory of every cSBC process, read from /proc,
+so answering it never waits for the capture process. Latencies are kept in
+histograms with power of two buckets in milliseconds, from which the median
+and 99th percentile are estimated to within a factor of two.
+"""
+
+import os
+import math
+import time
+import numpy as np
+import multiprocessing as mp
+
+# Counters of a capture process: frames read, reads that returned no complete
+# frame, frames dropped by the encoder pool or too large for a rolling buffer
+# slot, frames the camera numbered but never delivered, and events written,
+# failed and their frames
+COUNTERS = (
+    "frames",
+    "incomplete",
+    "encoder_dropped",
+    "ring_dropped",
+    "camera_gaps",
+    "events",
+    "events_failed",
+    "event_frames",
+)
+# Gauges published every PUBLISH_INTERVAL: achieved frames per second, frames
+# and bytes in the rolling buffer and its capacity, frames waiting for the
+# encoder pool, event directories waiting for their previews, whether an event
+# is being written, and the process id
+GAUGES = (
+    "fps",
+    "ring_frames",
+    "ring_bytes",
+    "ring_slots",
+    "ring_capacity",
+    "encoder_queue",
+    "preview_queue",
+    "flushing",
+    "pid",
+)
+# Latency histograms in milliseconds: encoding a frame, from capture until the
+# encoded frame is in the rolling buffer, from an event being due until it is
+# handed off, and writing a whole event
+HISTOGRAMS = ("encode", "capture_to_ring", "handoff", "write")
+# Upper bound of every bucket in milliseconds, the last bucket is unbounded
+BUCKET_BOUNDS = tuple(2.0**k for k in range(-4, 16))
+NUM_BUCKETS = len(BUCKET_BOUNDS) + 1
+# Most seconds between publishing the gauges
+PUBLISH_INTERVAL = 1.0
+
+
+def _bucket(ms):
+    """Returns the histogram bucket of a latency in milliseconds."""
+    if ms <= BUCKET_BOUNDS[0]:
+        return 0
+    # the exponent of the first power of two bound at or above ms
+    return min(NUM_BUCKETS - 1, (math.ceil(ms / BUCKET_BOUNDS[0]) - 1).bit_length())
+
+
+def _percentile(counts, fraction):
+    """Returns the upper bound of the bucket holding a fraction of the samples."""
+    total = sum(counts)
+    if not total:
+        return 0.0
+    seen = 0
+    for i, count in enumerate(counts):
+        seen += count
+        if seen >= fraction * total:
+            return BUCKET_BOUNDS[min(i, len(BUCKET_BOUNDS) - 1)]
+    return BUCKET_BOUNDS[-1]
+
+
+class CaptureStats:
+    """Statistics of one capture process, shared with the connection handler.
+
+    Parameters
+    ----------
+    None
+
+    Attributes
+    ----------
+    counters, gauges : multiprocessing.RawArray
+        The values of COUNTERS and GAUGES in order.
+
+    """
+
+    def __init__(self):
+        self.counters = mp.RawArray("q", len(COUNTERS))
+        self.gauges = mp.RawArray("d", len(GAUGES))
+        # bucket counts, and the sum and largest value, of every histogram
+        self._buckets = mp.RawArray("q", len(HISTOGRAMS) * NUM_BUCKETS)
+        self._sums = mp.RawArray("d", len(HISTOGRAMS))
+        self._maxima = mp.RawArray("d", len(HISTOGRAMS))
+        self._counterIndex = {name: i for i, name in enumerate(COUNTERS)}
+        self._gaugeIndex = {name: i for i, name in enumerate(GAUGES)}
+        self._histogramIndex = {name: i for i, name in enumerate(HISTOGRAMS)}
+        # measured by the capture process only
+        self._windowStart = time.monotonic()
+        self._windowFrames = 0
+        self._lastFrameId = -1
+
+    def count(self, name, n=1):
+        """Adds n to a counter."""
+        self.counters[self._counterIndex[name]] += n
+
+    def set(self, name, value):
+        """Sets a gauge."""
+        self.gauges[self._gaugeIndex[name]] = value
+
+    def observe(self, name, seconds):
+        """Adds a latency in seconds to a histogram."""
+        h = self._histogramIndex[name]
+        ms = seconds * 1000
+        self._buckets[h * NUM_BUCKETS + _bucket(ms)] += 1
+        self._sums[h] += ms
+        if ms > self._maxima[h]:
+            self._maxima[h] = ms
+
+    def frame(self, frameId):
+        """Counts a frame read from the camera and any the camera skipped.
+
+        Parameters
+        ----------
+        frameId : int
+            The camera's number of the frame, -1 when unknown.
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        None
+
+        """
+        self.count("frames")
+        self._windowFrames += 1
+        if frameId > self._lastFrameId + 1 and self._lastFrameId >= 0:
+            self.count("camera_gaps", frameId - self._lastFrameId - 1)
+        self._lastFrameId = frameId
+
+    def due(self):
+        """Returns True once the gauges should be published again."""
+        return time.monotonic() - self._windowStart >= PUBLISH_INTERVAL
+
+    def publish(self, rollBuf, encoderQueue=0, previewQueue=0, flushing=False):
+        """Measures the frame rate and publishes the gauges.
+
+        Parameters
+        ----------
+        rollBuf : FrameRing
+            The rolling buffer being captured into.
+        encoderQueue : int
+            The frames waiting for or in encoding.
+        previewQueue : int
+            The event directories waiting for their previews, -1 if unknown.
+        flushing : bool
+            Whether an event is being written.
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        None
+
+        """
+        now = time.monotonic()
+        self.set("fps", self._windowFrames / max(now - self._windowStart, 1e-9))
+        self._windowStart, self._windowFrames = now, 0
+        seqs = np.arange(rollBuf.oldest(), rollBuf.head) % rollBuf.numSlots
+        self.set("ring_frames", len(seqs))
+        self.set("ring_bytes", int(rollBuf.meta["size"][seqs].sum()))
+        self.set("ring_slots", rollBuf.numSlots)
+        self.set("ring_capacity", rollBuf.numSlots * rollBuf.slotSize)
+        self.set("encoder_queue", encoderQueue)
+        self.set("preview_queue", previewQueue)
+        self.set("flushing", int(flushing))
+        self.set("pid", os.getpid())
+
+    def snapshot(self):
+        """Returns every value as a dict, see the module documentation."""
+        result = dict(zip(COUNTERS, self.counters[:]))
+        # every gauge but the frame rate counts something
+        result.update((name, int(value)) for name, value in zip(GAUGES, self.gauges))
+        result["fps"] = self.gauges[0]
+        buckets = self._buckets[:]
+        histograms = {}
+        for h, name in enumerate(HISTOGRAMS):
+            counts = buckets[h * NUM_BUCKETS : (h + 1) * NUM_BUCKETS]
+            total = sum(counts)
+            histograms[name] = {
+                "count": total,
+                "mean_ms": self._sums[h] / total if total else 0.0,
+                "p50_ms": min(_percentile(counts, 0.5), self._maxima[h]),
+                "p99_ms": min(_percentile(counts, 0.99), self._maxima[h]),
+                "max_ms": self._maxima[h],
+                "buckets": counts,
+            }
+        result["latency"] = histograms
+        return result
+
+
+def _readProc(pid):
+    """Returns the (ppid, cpu seconds, start ticks, rss bytes) of a process."""
+    with open(f"/proc/{pid}/stat") as f:
+        stat = f.read()
+    # the name in parentheses may hold spaces, the fields follow it
+    fields = stat[stat.rfind(")") + 2 :].split()
+    ticks = os.sysconf("SC_CLK_TCK")
+    cpu = (int(fields[11]) + int(fields[12])) / ticks
+    rss = int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+    return int(fields[1]), cpu, int(fields[19]), rss
+
+
+def _children(pid):
+    """Returns the process ids of the children of a process."""
+    children = []
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                children += [int(child) for child in f.read().split()]
+    except OSError:
+        pass
+    return children
+
+
+class ProcessStats:
+    """Measures the CPU use and memory of a process and all its descendants.
+
+    The CPU use of each process is averaged since the previous call, or since
+    the process started on the first call.
+
+    Parameters
+    ----------
+    root : int
+        The process id at the top of the tree.
+    names : dict
+        Names of known processes by id, others are named after their parent.
+
+    """
+
+    def __init__(self, root, names=None):
+        self.root = root
+        self.names = dict(names or {})
+        # (time, cpu seconds) of every process at the last call
+        self._last = {}
+
+    def snapshot(self):
+        """Returns the pid, ppid, name, cpu seconds, cpu percent and rss in
+        megabytes of every process in the tree, as a list of dicts."""
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        ticks = os.sysconf("SC_CLK_TCK")
+        now = time.monotonic()
+        processes, last = [], {}
+        pending = [(self.root, None)]
+        while pending:
+            pid, parent = pending.pop(0)
+            try:
+                ppid, cpu, started, rss = _readProc(pid)
+            except (OSError, ValueError, IndexError):
+                continue
+            name = self.names.get(pid) or f"{parent or ppid} child"
+            previous = self._last.get(pid)
+            if previous is None:
+                elapsed, used = uptime - started / ticks, cpu
+            else:
+                elapsed, used = now - previous[0], cpu - previous[1]
+            last[pid] = (now, cpu)
+            processes.append(
+                {
+                    "pid": pid,
+                    "ppid": ppid,
+                    "name": name,
+                    "cpu_s": cpu,
+                    "cpu_pct": 100 * used / elapsed if elapsed > 0 else 0.0,
+                    "rss_mb": rss / 1e6,
+                }
+            )
+            pending += [(child, name) for child in _children(pid)]
+        self._last = last
+        return processes
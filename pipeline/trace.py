@@ -0,0 +1,404 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Spans of every pipeline stage, exported as a Chrome trace.
+
+Author: Imran Matin
+Email: imatin@ucsd.edu
+
+Usage:
+# sum up the time spent in every stage of a trace written by TRACE
+python -m pipeline.trace logs/trace_20210101T000000.json
+
+When an event is slow the statistics tell that it was slow, a trace tells
+where the time went: reading the camera, encoding, writing files or waiting
+in a command. `startTracing()` creates a Tracer in shared memory before the
+cSBC forks, and every process then records the begin and end of the stages it
+runs with `span()` or `record()`. Each process claims its own ring of spans
+the first time it records one, so processes never wait on each other, and a
+ring keeps the newest spans and overwrites the oldest. The threads of a
+process share its ring and are told apart by their thread ids.
+
+Tracing is switched on and off at runtime through shared memory, so the TRACE
+command switches it for every process at once. While it is off `span()` only
+reads the switch and returns a context manager that does nothing. The rings
+of every process are read by `Tracer.dump()` into the Chrome trace event
+format, which chrome://tracing and https://ui.perfetto.dev open. Times are
+from `time.perf_counter()`, the system wide monotonic clock on Linux, so the
+spans of different processes line up. A span being recorded while the rings
+are read may be torn, which at worst misplaces that one span.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+import threading
+import contextlib
+import numpy as np
+import multiprocessing as mp
+
+# One span: its begin and end in perf_counter seconds, the process and thread
+# that ran it, the stage and a value whose meaning depends on the stage
+SPAN_DTYPE = np.dtype(
+    [
+        ("begin", "<f8"),
+        ("end", "<f8"),
+        ("pid", "<u4"),
+        ("tid", "<u4"),
+        ("stage", "<u2"),
+        ("arg", "<i8"),
+    ]
+)
+# Stages and what their value holds: reading a frame (camera), encoding a
+# frame (frame id or sequence number), copying it into the rolling buffer
+# (frame id), handing off an event (event id), writing a whole event (event
+# id), choosing its frames, writing its frames, writing its manifest (0),
+# writing one file (bytes), answering a command (command code), waiting for an
+# event to be written (event id) and building its previews (0)
+STAGES = (
+    "read",
+    "encode",
+    "store",
+    "handoff",
+    "flush",
+    "select",
+    "write",
+    "manifest",
+    "write_file",
+    "command",
+    "wait",
+    "preview",
+)
+STAGE_CODES = {name: code for code, name in enumerate(STAGES)}
+
+# The tracer of this process tree, inherited by forked processes
+_tracer = None
+# This process's ring, claimed at its first span, and its next position
+_ring = None
+_next = itertools.count()
+# Returned by span() while tracing is off
+_NULL = contextlib.nullcontext()
+
+
+def _forked():
+    """Makes a forked process claim a ring of its own."""
+    global _ring, _next
+    _ring, _next = None, itertools.count()
+
+
+os.register_at_fork(after_in_child=_forked)
+
+
+class Tracer:
+    """The rings of spans of every process, in shared memory.
+
+    Parameters
+    ----------
+    numRings : int
+        The most processes that can record spans.
+    numSpans : int
+        The newest spans kept per process.
+    enabled : bool
+        Record spans from the start.
+
+    Attributes
+    ----------
+    rings : numpy.ndarray
+        The numRings x numSpans SPAN_DTYPE spans, those never written end at 0.
+
+    """
+
+    def __init__(self, numRings=32, numSpans=4096, enabled=False):
+        self.numRings = numRings
+        self.numSpans = numSpans
+        self._on = mp.RawValue("b", enabled)
+        self._buffer = mp.RawArray("B", numRings * numSpans * SPAN_DTYPE.itemsize)
+        self.rings = np.frombuffer(self._buffer, SPAN_DTYPE).reshape(numRings, numSpans)
+        # rings claimed so far, and spans lost because every ring was claimed
+        self._claimed = mp.Value("i", 0)
+        self._lost = mp.RawValue("q", 0)
+
+    @property
+    def enabled(self):
+        """Whether spans are recorded, settable from any process."""
+        return bool(self._on.value)
+
+    @enabled.setter
+    def enabled(self, value):
+        self._on.value = bool(value)
+
+    @property
+    def lost(self):
+        """The spans not recorded because every ring was claimed."""
+        return self._lost.value
+
+    def _claim(self):
+        """Returns the next free ring, or numRings once all are claimed."""
+        with self._claimed.get_lock():
+            ring = self._claimed.value
+            if ring < self.numRings:
+                self._claimed.value += 1
+        return ring
+
+    def record(self, stage, begin, end, arg=0):
+        """Records a span in this process's ring.
+
+        Parameters
+        ----------
+        stage : str
+            The stage, one of STAGES.
+        begin, end : float
+            The perf_counter times the stage began and ended.
+        arg : int
+            The value of the span, see STAGES.
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        None
+
+        """
+        global _ring
+        if _ring is None:
+            _ring = self._claim()
+        if _ring >= self.numRings:
+            self._lost.value += 1
+            return
+        # next() is atomic, so threads never share a position
+        i = next(_next) % self.numSpans
+        self.rings[_ring, i] = (
+            begin,
+            end,
+            os.getpid(),
+            threading.get_native_id(),
+            STAGE_CODES[stage],
+            arg,
+        )
+
+    def spans(self):
+        """Returns a copy of every span recorded, oldest first."""
+        spans = self.rings.reshape(-1).copy()
+        spans = spans[spans["end"] > 0]
+        return spans[np.argsort(spans["begin"], kind="stable")]
+
+    def clear(self):
+        """Forgets every span recorded."""
+        self.rings[:] = 0
+
+    def dump(self, path, names=None):
+        """Writes every span recorded as a Chrome trace.
+
+        Parameters
+        ----------
+        path : str
+            The JSON file to write.
+        names : dict
+            Names of the processes by id, the others are named by id.
+
+        Returns
+        -------
+        int
+            Returns the number of spans written.
+
+        Raises
+        ------
+        OSError
+            When the file cannot be written.
+
+        """
+        spans = self.spans()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # readers never see a half written trace
+        temp = path + ".tmp"
+        with open(temp, "w") as f:
+            json.dump(chromeTrace(spans, names), f, separators=(",", ":"))
+        os.replace(temp, path)
+        return len(spans)
+
+
+def chromeTrace(spans, names=None):
+    """Converts spans to the Chrome trace event format.
+
+    Parameters
+    ----------
+    spans : numpy.ndarray
+        The SPAN_DTYPE spans.
+    names : dict
+        Names of the processes by id.
+
+    Returns
+    -------
+    dict
+        Returns the trace, ready to be written as JSON.
+
+    Raises
+    ------
+    None
+
+    """
+    names = names or {}
+    events = [
+        {
+            "name": "process_name",
+            "ph": "M",
+            "pid": int(pid),
+            "args": {"name": f"{names.get(int(pid), 'process')} ({pid})"},
+        }
+        for pid in np.unique(spans["pid"])
+    ]
+    for span in spans.tolist():
+        begin, end, pid, tid, stage, arg = span
+        events.append(
+            {
+                "name": STAGES[stage],
+                "cat": "cSBC",
+                "ph": "X",
+                "ts": round(begin * 1e6, 3),
+                "dur": round((end - begin) * 1e6, 3),
+                "pid": pid,
+                "tid": tid,
+                "args": {"arg": arg},
+            }
+        )
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def startTracing(numRings=32, numSpans=4096, enabled=False):
+    """Creates the tracer every process records its spans to.
+
+    Call it in the main process before starting any other process, they
+    inherit the tracer when they are forked.
+
+    Parameters
+    ----------
+    numRings : int
+        The most processes that can record spans.
+    numSpans : int
+        The newest spans kept per process.
+    enabled : bool
+        Record spans from the start.
+
+    Returns
+    -------
+    Tracer
+        Returns the tracer, to switch tracing and dump the spans with.
+
+    Raises
+    ------
+    None
+
+    """
+    global _tracer
+    _tracer = Tracer(numRings, numSpans, enabled)
+    return _tracer
+
+
+def span(stage, arg=0):
+    """Returns a context manager recording its block as a span of a stage.
+
+    Parameters
+    ----------
+    stage : str
+        The stage, one of STAGES.
+    arg : int
+        The value of the span, see STAGES.
+
+    Returns
+    -------
+    context manager
+        Returns one that records the span, or does nothing while tracing is
+        off.
+
+    Raises
+    ------
+    None
+
+    """
+    if _tracer is None or not _tracer._on.value:
+        return _NULL
+    return _Span(stage, arg)
+
+
+def record(stage, begin, end, arg=0):
+    """Records a span already timed with perf_counter, if tracing is on."""
+    if _tracer is not None and _tracer._on.value:
+        _tracer.record(stage, begin, end, arg)
+
+
+class _Span:
+    """Records the time spent in a with block."""
+
+    __slots__ = ("stage", "arg", "begin")
+
+    def __init__(self, stage, arg):
+        self.stage = stage
+        self.arg = arg
+
+    def __enter__(self):
+        self.begin = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _tracer.record(self.stage, self.begin, time.perf_counter(), self.arg)
+
+
+def summarize(trace):
+    """Returns the count, total, mean and largest milliseconds of every stage.
+
+    Parameters
+    ----------
+    trace : dict
+        A trace written by `Tracer.dump()`.
+
+    Returns
+    -------
+    list
+        Returns a dict per stage, the one with the most time first.
+
+    Raises
+    ------
+    None
+
+    """
+    durations = {}
+    for event in trace["traceEvents"]:
+        if event["ph"] == "X":
+            durations.setdefault(event["name"], []).append(event["dur"] / 1000)
+    results = [
+        {
+            "stage": stage,
+            "count": len(ms),
+            "total_ms": sum(ms),
+            "mean_ms": sum(ms) / len(ms),
+            "max_ms": max(ms),
+        }
+        for stage, ms in durations.items()
+    ]
+    return sorted(results, key=lambda result: -result["total_ms"])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Sum up the time spent in every stage of a trace."
+    )
+    parser.add_argument("path", help="A trace written by the TRACE command")
+    args = parser.parse_args()
+    with open(args.path) as f:
+        trace = json.load(f)
+    print(f"{'stage':<12} {'count':>8} {'total ms':>12} {'mean ms':>10} {'max ms':>10}")
+    for result in summarize(trace):
+        print(
+            f"{result['stage']:<12} {result['count']:>8} "
+            f"{result['total_ms']:>12.3f} {result['mean_ms']:>10.3f} "
+            f"{result['max_ms']:>10.3f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Parallel, batched writer for the images of an event.
+
+Author: Imran Matin
+Email: imatin@ucsd.edu
+
+Usage:
+# find the best number of writer threads for the storage holding ./images
+python -m pipeline.writer --dir images
+
+Splits an event's images into one contiguous batch per thread and writes the
+batches concurrently, since SD cards and eMMC only reach their full write speed
+with several requests in flight. Each file's full size is reserved before it is
+written so the filesystem can lay it out in one extent. How durable the images
+are when the write returns is selectable:
+- "none" leaves flushing the images to the operating system.
+- "event" fsyncs every image and the event directory once the whole event is
+  written.
+- "file" fsyncs each image before it is closed.
+"""
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from pipeline import trace
+
+# Durability modes
+FSYNC_NONE = "none"
+FSYNC_EVENT = "event"
+FSYNC_FILE = "file"
+DURABILITY_MODES = (FSYNC_NONE, FSYNC_EVENT, FSYNC_FILE)
+
+
+def writeFile(path, data, fsync=False, preallocate=True):
+    """Writes a buffer to a new file.
+
+    Parameters
+    ----------
+    path : str
+        The path of the file to create.
+    data : bytes-like
+        The contents of the file, any contiguous buffer such as a NumPy array.
+    fsync : bool
+        Flush the file to storage before closing it.
+    preallocate : bool
+        Reserve the file's full size before writing it.
+
+    Returns
+    -------
+    int
+        Returns the number of bytes written.
+
+    Raises
+    ------
+    OSError
+        When the file cannot be created or written.
+
+    """
+    view = memoryview(data).cast("B")
+    with trace.span("write_file", view.nbytes):
+        return _writeFile(path, view, fsync, preallocate)
+
+
+def _writeFile(path, view, fsync, preallocate):
+    """Writes a byte memoryview to a new file, see `writeFile()`."""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        if preallocate and view.nbytes:
+            try:
+                os.posix_fallocate(fd, 0, view.nbytes)
+            except (AttributeError, OSError):
+                # not every platform or filesystem supports it
+                pass
+        written = 0
+        while written < view.nbytes:
+            written += os.write(fd, view[written:])
+        if fsync:
+            os.fsync(fd)
+        return written
+    finally:
+        os.close(fd)
+
+
+def syncPath(path):
+    """Flushes an already written file or directory to storage."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def makeReport(files, nbytes, seconds):
+    """Summarizes the write of one event.
+
+    Parameters
+    ----------
+    files : int
+        The number of files written.
+    nbytes : int
+        The number of bytes written.
+    seconds : float
+        The time the write took.
+
+    Returns
+    -------
+    dict
+        Returns the files, bytes, seconds and megabytes per second.
+
+    Raises
+    ------
+    None
+
+    """
+    return {
+        "files": files,
+        "bytes": nbytes,
+        "seconds": seconds,
+        "mbps": nbytes / seconds / 1e6 if seconds > 0 else 0.0,
+    }
+
+
+class DiskWriter:
+    """Writes the images of an event on a pool of threads.
+
+    Parameters
+    ----------
+    numThreads : int
+        The number of files written at once.
+    durability : str
+        One of "none", "event" or "file", see the module documentation.
+    preallocate : bool
+        Reserve each file's full size before writing it.
+
+    """
+
+    def __init__(self, numThreads=4, durability=FSYNC_NONE, preallocate=True):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability {durability}")
+        self.numThreads = max(1, int(numThreads))
+        self.durability = durability
+        self.preallocate = preallocate
+        self._pool = ThreadPoolExecutor(self.numThreads)
+
+    def _writeBatch(self, batch):
+        """Writes a batch of (path, data) in order and returns the bytes written."""
+        fsync = self.durability == FSYNC_FILE
+        return sum(writeFile(p, d, fsync, self.preallocate) for p, d in batch)
+
+    def _batches(self, items):
+        """Splits items into one contiguous batch per thread."""
+        size = -(-len(items) // self.numThreads)
+        return [items[i : i + size] for i in range(0, len(items), size)]
+
+    def writeFiles(self, directory, items):
+        """Writes an event's files and makes them as durable as configured.
+
+        Parameters
+        ----------
+        directory : str
+            The event directory, which must already exist.
+        items : list
+            The (name, data) of every file, data is any contiguous buffer.
+
+        Returns
+        -------
+        dict
+            Returns the files, bytes, seconds and megabytes per second of the
+            write, see `makeReport()`.
+
+        Raises
+        ------
+        OSError
+            When a file cannot be written.
+
+        """
+        start = time.perf_counter()
+        items = [(os.path.join(directory, name), data) for name, data in items]
+        nbytes = 0
+        if items:
+            nbytes = sum(self._pool.map(self._writeBatch, self._batches(items)))
+        self.syncFiles(directory, [path for path, data in items])
+        return makeReport(len(items), nbytes, time.perf_counter() - start)
+
+    def syncFiles(self, directory, paths):
+        """Fsyncs files written elsewhere if the durability is "event".
+
+        Parameters
+        ----------
+        directory : str
+            The event directory holding the files.
+        paths : list
+            The paths of the files.
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        OSError
+            When a file cannot be flushed.
+
+        """
+        if self.durability != FSYNC_EVENT:
+            return
+        list(self._pool.map(syncPath, paths))
+        # the directory entries have to reach storage too
+        syncPath(directory)
+
+    def close(self):
+        """Stops the writer threads."""
+        self._pool.shutdown()
+
+
+def benchmark(directory, numFiles, fileSize, threads, durability, repeats=3):
+    """Measures the write throughput of the storage for each thread count.
+
+    Parameters
+    ----------
+    directory : str
+        A directory on the storage to measure, the files are written to a
+        temporary directory inside it and deleted afterwards.
+    numFiles : int
+        The number of files per simulated event.
+    fileSize : int
+        The size of each file in bytes.
+    threads : list
+        The thread counts to try.
+    durability : str
+        The durability to write with.
+    repeats : int
+        The number of events written for each thread count.
+
+    Returns
+    -------
+    results
+        Returns the best report of every thread count, by thread count.
+    best
+        Returns the thread count with the highest throughput.
+
+    Raises
+    ------
+    None
+
+    """
+    # random bytes so compressing filesystems do not flatter the numbers
+    data = os.urandom(fileSize)
+    results = {}
+    for numThreads in threads:
+        writer = DiskWriter(numThreads, durability)
+        reports = []
+        for i in range(repeats):
+            eventDir = tempfile.mkdtemp(dir=directory)
+            items = [(f"img_{n}.bin", data) for n in range(numFiles)]
+            try:
+                reports.append(writer.writeFiles(eventDir, items))
+            finally:
+                shutil.rmtree(eventDir)
+        writer.close()
+        results[numThreads] = max(reports, key=lambda r: r["mbps"])
+    best = max(results, key=lambda n: results[n]["mbps"])
+    return results, best
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Find the number of writer threads that writes events fastest."
+    )
+    parser.add_argument(
+        "-d", "--dir", default=".", help="Directory on the storage to test"
+    )
+    parser.add_argument(
+        "-n", "--files", type=int, default=150, help="Files per event (Default: 150)"
+    )
+    parser.add_argument(
+        "-s",
+        "--size",
+        type=int,
+        default=2304000,
+        help="File size in bytes (Default: 2304000)",
+    )
+    parser.add_argument(
+        "-t",
+        "--threads",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4, 8, 16],
+        help="Thread counts to try (Default: 1 2 4 8 16)",
+    )
+    parser.add_argument(
+        "-D",
+        "--durability",
+        choices=DURABILITY_MODES,
+        default=FSYNC_EVENT,
+        help="Durability to write with (Default: event)",
+    )
+    parser.add_argument(
+        "-r",
+        "--repeats",
+        type=int,
+        default=3,
+        help="Events per thread count (Default: 3)",
+    )
+    args = parser.parse_args()
+
+    results, best = benchmark(
+        args.dir, args.files, args.size, args.threads, args.durability, args.repeats
+    )
+    for numThreads, report in results.items():
+        print(
+            f"{numThreads:3d} threads: {report['mbps']:8.1f} MB/s, "
+            f"{report['seconds']:.3f} seconds for {report['files']} files."
+        )
+    print(f"Fastest: WRITER_THREADS = {best}")
+
+
+if __name__ == "__main__":
+    main()
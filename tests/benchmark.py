@@ -0,0 +1,415 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmark Suite.
+
+Author: Imran Matin
+Email: imatin@ucsd.edu
+
+Usage:
+# in a new terminal, from the tests directory
+python benchmark.py
+# without a camera attached
+python benchmark.py --backend simulated
+# only some of the benchmarks
+python benchmark.py capture encode
+# store these results as the baseline later runs are compared against
+python benchmark.py --save-baseline
+
+Runs every benchmark of the cSBC pipeline against the camera configured in the
+camera_config file in the directory, or the backend given:
+- capture: the frame rate achieved and the time of each read.
+- encode: the encode and decode time and size of a frame for every codec.
+- write: the throughput of writing an event's files for each thread count.
+- event: capturing and encoding into a rolling buffer for EVENT_SECONDS and
+  writing the event to disk, like the cSBC does.
+- protocol: the round trip time of a command and the commands per second of
+  pipelined commands over a loopback connection.
+
+The results are written as JSON to a timestamped file in the results
+directory and compared against the baseline in BASELINE, if there is one.
+Every metric more than the tolerance worse than the baseline is reported as a
+regression and the benchmark exits with status 1. Baselines are only
+comparable on the same machine with the same camera settings, so a baseline
+from another camera backend is not compared against.
+"""
+
+import EasyPySpin
+import cv2
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import argparse
+import datetime
+import platform
+import tempfile
+import threading
+import numpy as np
+from camera_config import *
+
+# the pipeline lives at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pipeline import protocol
+from pipeline.codec import available, benchmark as benchmarkCodecs, getCodec
+from pipeline.frame_ring import FrameRing
+from pipeline.writer import DiskWriter, benchmark as benchmarkWrites
+
+RESULTS_DIR = "results"
+# Results every run is compared against, written by --save-baseline
+BASELINE = os.path.join(RESULTS_DIR, "baseline.json")
+# Fraction a metric may be worse than its baseline before it is a regression
+TOLERANCE = 0.25
+BENCHMARKS = ["capture", "encode", "write", "event", "protocol"]
+# Frames read by the capture benchmark, the first ENCODE_FRAMES are encoded
+NUM_FRAMES = 120
+ENCODE_FRAMES = 10
+# Codecs compared by the encode benchmark
+CODECS = ["png:1", "png:3", "png:9", "jpg:90", "raw", "raw+zlib:1", "raw+lz4"]
+# Files per event, thread counts and events per thread count of the write
+# benchmark
+WRITE_FILES = 150
+WRITE_THREADS = [1, 2, 4, 8]
+WRITE_REPEATS = 3
+# Seconds captured and codec of the event benchmark
+EVENT_SECONDS = 3
+EVENT_CODEC = "png:1"
+# Commands timed one at a time and sent pipelined by the protocol benchmark
+NUM_REQUESTS = 500
+# Metrics that are better the higher they are, by their last name, every
+# other metric ending in _ms, _s or bytes is better the lower it is, except
+# the largest times, which are too noisy to compare
+HIGHER_IS_BETTER = {"fps", "mbps", "ratio", "encode_mbps", "frames", "per_s"}
+LOWER_IS_BETTER_SUFFIXES = ("_ms", "_s", "bytes")
+NOT_COMPARED = {"max_ms"}
+
+
+def initializeCamera(backend):
+    """Initializes camera object with the correct settings."""
+    cap = EasyPySpin.create_capture(CAMERA_INDEX, backend, **CAMERA_OPTIONS[backend])
+
+    cap.set_many(
+        {
+            cv2.CAP_PROP_EXPOSURE: EXPOSURE,
+            cv2.CAP_PROP_GAIN: GAIN,
+            cv2.CAP_PROP_BRIGHTNESS: BRIGHTNESS,
+            cv2.CAP_PROP_GAMMA: GAMMA,
+            cv2.CAP_PROP_FPS: FPS,
+            cv2.CAP_PROP_BACKLIGHT: BACKLIGHT,
+        }
+    )
+
+    return cap
+
+
+def percentiles(seconds):
+    """Returns the median, 99th percentile and largest of times in ms."""
+    ms = np.asarray(seconds) * 1000
+    return {
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+    }
+
+
+def benchmarkCapture(cap):
+    """Reads NUM_FRAMES frames and times them, returns the results and frames."""
+    frames, reads, incomplete = [], [], 0
+    start = time.perf_counter()
+    while len(reads) < NUM_FRAMES:
+        readStart = time.perf_counter()
+        ret, frame = cap.read()
+        if not ret:
+            incomplete += 1
+            continue
+        reads.append(time.perf_counter() - readStart)
+        if len(frames) < ENCODE_FRAMES:
+            frames.append(frame.copy())
+    seconds = time.perf_counter() - start
+    result = {
+        "fps": NUM_FRAMES / seconds,
+        "incomplete": incomplete,
+        "read": percentiles(reads),
+        "width": frames[0].shape[1],
+        "height": frames[0].shape[0],
+    }
+    return result, frames
+
+
+def benchmarkEncode(frames):
+    """Encodes and decodes the frames with every codec installed."""
+    results = {}
+    for result in benchmarkCodecs(frames, available(CODECS)):
+        spec = result.pop("codec")
+        results[spec] = result
+    return results
+
+
+def benchmarkWrite(frames):
+    """Writes events of PNG sized files with every thread count."""
+    fileSize = int(np.mean([getCodec("png:1").encode(f).nbytes for f in frames]))
+    results, best = benchmarkWrites(
+        RESULTS_DIR, WRITE_FILES, fileSize, WRITE_THREADS, "none", WRITE_REPEATS
+    )
+    return {
+        "file_size": fileSize,
+        "best_threads": best,
+        "threads": {
+            str(threads): {"mbps": report["mbps"], "event_s": report["seconds"]}
+            for threads, report in results.items()
+        },
+    }
+
+
+def benchmarkEvent(cap):
+    """Captures into a rolling buffer for EVENT_SECONDS and writes the event."""
+    codec = getCodec(EVENT_CODEC)
+    ret, frame = cap.read()
+    # room for every frame at the configured rate and a margin
+    numSlots = int(max(FPS, 1) * EVENT_SECONDS * 2) + 1
+    rollBuf = FrameRing(numSlots, frame.nbytes + 1024)
+    # read into preallocated frames as the cSBC does
+    frames = EasyPySpin.FramePool(frame.shape, frame.dtype)
+    writer = DiskWriter()
+    eventDir = tempfile.mkdtemp(dir=RESULTS_DIR)
+    try:
+        encodes = []
+        start = time.perf_counter()
+        while time.perf_counter() - start < EVENT_SECONDS:
+            ret, frame = frames.read(cap)
+            if not ret:
+                continue
+            encodeStart = time.perf_counter()
+            img = codec.encode(frame)
+            encodes.append(time.perf_counter() - encodeStart)
+            rollBuf.write(img)
+        seconds = time.perf_counter() - start
+        seqs = rollBuf.sequences()
+        items = [
+            (f"img_{i}{codec.ext}", rollBuf.view(seq)) for i, seq in enumerate(seqs)
+        ]
+        report = writer.writeFiles(eventDir, items)
+        return {
+            "frames": len(seqs),
+            "fps": len(encodes) / seconds,
+            "encode": percentiles(encodes),
+            "write_s": report["seconds"],
+            "write_mbps": report["mbps"],
+        }
+    finally:
+        shutil.rmtree(eventDir)
+        writer.close()
+        rollBuf.close()
+
+
+def serveUptime(server):
+    """Answers every UPTIME sent over one connection until it closes."""
+    conn, addr = server.accept()
+    with conn, conn.makefile("rb") as reader:
+        protocol.configureSocket(conn)
+        while True:
+            frame = protocol.readFrame(reader)
+            if frame is None:
+                return
+            requestId, command, payload = frame
+            conn.sendall(protocol.packResponse(requestId, command, (0.0,)))
+
+
+def benchmarkProtocol():
+    """Times commands over a loopback connection, one at a time and pipelined."""
+    server = socket.create_server(("127.0.0.1", 0))
+    handler = threading.Thread(target=serveUptime, args=(server,), daemon=True)
+    handler.start()
+    client = protocol.Client("127.0.0.1", server.getsockname()[1], 5)
+    try:
+        rtts = []
+        for i in range(NUM_REQUESTS):
+            client.send(protocol.UPTIME)
+            rtts.append(client.receive()[4])
+        start = time.perf_counter()
+        client.sendMany([protocol.UPTIME] * NUM_REQUESTS)
+        for i in range(NUM_REQUESTS):
+            client.receive()
+        seconds = time.perf_counter() - start
+    finally:
+        client.close()
+        handler.join()
+        server.close()
+    return {"rtt": percentiles(rtts), "pipelined": {"per_s": NUM_REQUESTS / seconds}}
+
+
+def flatten(results, prefix=""):
+    """Returns the numbers of nested results by dotted name."""
+    flat = {}
+    for name, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + name] = value
+    return flat
+
+
+def direction(metric):
+    """Returns 1 if a metric is better higher, -1 if lower, 0 if neither."""
+    name = metric.rsplit(".", 1)[-1]
+    if name in NOT_COMPARED:
+        return 0
+    if name in HIGHER_IS_BETTER or name.endswith("mbps"):
+        return 1
+    if name.endswith(LOWER_IS_BETTER_SUFFIXES):
+        return -1
+    return 0
+
+
+def compare(results, baseline, tolerance):
+    """Compares every metric with its baseline.
+
+    Parameters
+    ----------
+    results : dict
+        The results of this run.
+    baseline : dict
+        The results of the baseline run.
+    tolerance : float
+        The fraction a metric may be worse than its baseline.
+
+    Returns
+    -------
+    list
+        Returns the (metric, baseline, value, change, regressed) of every
+        metric in both, change is the fraction it got better by.
+
+    Raises
+    ------
+    None
+
+    """
+    current, base = flatten(results), flatten(baseline)
+    comparisons = []
+    for metric in sorted(current.keys() & base.keys()):
+        sign = direction(metric)
+        if not sign or not base[metric]:
+            continue
+        change = sign * (current[metric] - base[metric]) / abs(base[metric])
+        comparisons.append(
+            (metric, base[metric], current[metric], change, change < -tolerance)
+        )
+    return comparisons
+
+
+def runBenchmarks(names, backend):
+    """Runs the named benchmarks and returns their results by name."""
+    results = {}
+    needsCamera = {"capture", "encode", "write", "event"} & set(names)
+    cap = initializeCamera(backend) if needsCamera else None
+    try:
+        frames = []
+        if needsCamera:
+            print("Running capture benchmark...")
+            capture, frames = benchmarkCapture(cap)
+            if "capture" in names:
+                results["capture"] = capture
+        if "encode" in names:
+            print("Running encode benchmark...")
+            results["encode"] = benchmarkEncode(frames)
+        if "write" in names:
+            print("Running write benchmark...")
+            results["write"] = benchmarkWrite(frames)
+        if "event" in names:
+            print("Running event benchmark...")
+            results["event"] = benchmarkEvent(cap)
+        if "protocol" in names:
+            print("Running protocol benchmark...")
+            results["protocol"] = benchmarkProtocol()
+    finally:
+        if cap is not None:
+            cap.release()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cSBC pipeline.")
+    parser.add_argument(
+        "benchmarks", nargs="*", default=BENCHMARKS, help="Benchmarks to run"
+    )
+    parser.add_argument(
+        "--backend", default=CAMERA_BACKEND, help="Camera backend to capture from"
+    )
+    parser.add_argument("--output", help="File to write the results to")
+    parser.add_argument("--baseline", default=BASELINE, help="Results to compare to")
+    parser.add_argument(
+        "--tolerance", type=float, default=TOLERANCE, help="Fraction a metric may drop"
+    )
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="Store results as the baseline"
+    )
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks {sorted(unknown)}, choose from {BENCHMARKS}")
+
+    print("Starting Benchmarks...")
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    now = datetime.datetime.now()
+    report = {
+        "time": now.isoformat(timespec="seconds"),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "backend": args.backend,
+        "camera": {
+            "fps": FPS,
+            "exposure": EXPOSURE,
+            "gain": GAIN,
+            "brightness": BRIGHTNESS,
+            "gamma": GAMMA,
+            "backlight": BACKLIGHT,
+        },
+        "results": runBenchmarks(args.benchmarks, args.backend),
+    }
+
+    # machine readable results of every run
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{now:%Y-%m-%dT%H:%M:%S}_benchmark.json"
+    )
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote results to {output}.")
+    if args.save_baseline:
+        shutil.copyfile(output, args.baseline)
+        print(f"Stored results as the baseline {args.baseline}.")
+        return 0
+
+    # compare against the baseline of the same backend
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save-baseline to store one.")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline["backend"] != args.backend:
+        print(
+            f"Baseline is of the {baseline['backend']} backend, not comparing it to "
+            f"{args.backend}."
+        )
+        return 0
+    regressions = 0
+    print(f"Compared to the baseline of {baseline['time']}:")
+    for metric, base, value, change, regressed in compare(
+        report["results"], baseline["results"], args.tolerance
+    ):
+        flag = "REGRESSION" if regressed else ""
+        print(f"{metric:<45} {base:>12.4g} {value:>12.4g} {change:>+8.1%} {flag}")
+        regressions += regressed
+    if regressions:
+        print(
+            f"REGRESSION: {regressions} metrics are more than {args.tolerance:.0%} "
+            f"worse than the baseline."
+        )
+        return 1
+    print("Completed Benchmarks, no regressions...")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
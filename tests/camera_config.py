@@ -13,3 +13,14 @@ GAIN = 0
 BRIGHTNESS = 10
 GAMMA = 0
 BACKLIGHT = 1
+# Camera backend: "flir" for the FLIR camera, "simulated" for synthesized frames
+# or "replay" for recorded frames, the last two need no camera attached
+CAMERA_BACKEND = "flir"
+# Camera index or serial number, or the directory of frames to replay
+CAMERA_INDEX = 0
+# Extra options for each backend, see EasyPySpin/SimulatedCapture.py
+CAMERA_OPTIONS = {
+    "flir": {},
+    "simulated": {"width": 1920, "height": 1200, "bit_depth": 8},
+    "replay": {"loop": True, "reverse": True},
+}
@@ -27,7 +27,9 @@ PROMPT = "Navigate to the open window. Press (s) to save the image and close the
 
 def initializeCamera():
     """Initializes camera object with the correct settings."""
-    cap = EasyPySpin.VideoCapture(0)
+    cap = EasyPySpin.create_capture(
+        CAMERA_INDEX, CAMERA_BACKEND, **CAMERA_OPTIONS[CAMERA_BACKEND]
+    )
 
     cap.set(cv2.CAP_PROP_EXPOSURE, EXPOSURE)
     cap.set(cv2.CAP_PROP_GAIN, GAIN)
@@ -12,16 +12,22 @@ python cSBC.py
 python test_send_rapid_events.py
 
 Tests the functionality of the cSBC when it is processing an event, and 
-another event is triggered and sent to it. Functions as the mSBC. Note, change
+another event is triggered and sent to it. Functions as the mSBC, pipelining
+the events over one connection. Each event is accepted, coalesced or dropped
+as set by EVENT_POLICY in the cSBC's config. Note, change
 the HOST variable to be the IP of the cSBC if you are not running it on the 
 localhost. Set the number of events to be sent back to back and how many times
 to send them.
 """
 
-# Import socket module
-import socket
+import os
+import sys
 from time import sleep
 
+# the protocol lives at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pipeline import protocol
+
 # The server's hostname or IP address
 HOST = "127.0.0.1"
 # The port used by the server
@@ -32,34 +38,33 @@ NUM_EVENTS = 5
 NUM_TRIALS = 3
 
 
-def send_events(num_events):
-    """Sends num_events back to back commands to the cSBC."""
-    # Send num_events back to back event requests
-    for i in range(0, num_events):
-        try:
-            # open a socket for this client
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                # connect to the server
-                s.connect((HOST, PORT))
-                print("Sending event")
-                # send a command to the server
-                s.sendall(b"EVENT")
-                sleep(0.05)
-        except Exception as e:
-            print(f"\n{e}\n")
+def send_events(client, num_events):
+    """Pipelines num_events back to back event commands to the cSBC."""
+    try:
+        # Send num_events back to back event requests without waiting
+        print(f"Sending {num_events} events")
+        client.sendMany([protocol.EVENT] * num_events)
+        # Wait for every event to be written
+        for i in range(0, num_events):
+            requestId, command, status, values, seconds = client.receive()
+            print(
+                f"Event request {requestId}: "
+                f"{protocol.describeResponse(command, status, values)} "
+                f"after {seconds:.3f} seconds"
+            )
+    except Exception as e:
+        print(f"\n{e}\n")
 
 
 def send_shutdown():
     """Continuously sends shutdown command to cSBC until it is shutdown."""
     while True:
         try:
-            # open a socket for this client
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                # connect to the server
-                s.connect((HOST, PORT))
+            # open a connection for this client
+            with protocol.Client(HOST, PORT) as client:
                 print("Sending shutdown")
                 # send a command to the server
-                s.sendall(b"SHUTDOWN")
+                print(client.request(protocol.SHUTDOWN))
                 break
         except Exception as e:
             print(f"\n{e}\n")
@@ -69,10 +74,12 @@ def send_shutdown():
 if __name__ == "__main__":
     print("Starting Send Rapid Events Test...")
     try:
-        for i in range(0, NUM_TRIALS):
-            # wait period to allow for cSBC to place collect images
-            sleep(5)
-            send_events(NUM_EVENTS)
+        # one persistent connection for every event
+        with protocol.Client(HOST, PORT) as client:
+            for i in range(0, NUM_TRIALS):
+                # wait period to allow for cSBC to place collect images
+                sleep(5)
+                send_events(client, NUM_EVENTS)
 
         # Shutdown the cSBC
         send_shutdown()
@@ -28,7 +28,9 @@ PROMPT = "Navigate to the open window. Press (s) to capture an image, (q) close
 
 def initializeCamera():
     """Initializes camera object with the correct settings."""
-    cap = EasyPySpin.VideoCapture(0)
+    cap = EasyPySpin.create_capture(
+        CAMERA_INDEX, CAMERA_BACKEND, **CAMERA_OPTIONS[CAMERA_BACKEND]
+    )
 
     cap.set(cv2.CAP_PROP_EXPOSURE, EXPOSURE)
     cap.set(cv2.CAP_PROP_GAIN, GAIN)
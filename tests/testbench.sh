@@ -8,9 +8,12 @@
 # Usage:
 # in a new terminal
 # sh testbench.sh
+# # without a camera attached
+# sh testbench.sh --backend simulated
 # 
-# Executes all tests in the test directory, and saves the results into a
-# timestamped file in the ./results directory.
+# Runs every benchmark in benchmark.py, and saves the results into a
+# timestamped file in the ./results directory, as text and as JSON. Exits with
+# status 1 if a benchmark regressed against the baseline, see benchmark.py.
 
 # create the outfile to store the results using the current time
 now=$(date +"%Y-%m-%dT%H:%M:%S")
@@ -29,20 +32,9 @@ cat camera_config.py >> ${outfile}
 
 printf "\n" >> ${outfile}
 
-printf "================ Test: test_compression_size.py ===============\n" >> ${outfile}
-python test_compression_size.py >> ${outfile}
-
-printf "\n" >> ${outfile}
-
-printf "================ Test: test_event_delay.py ====================\n" >> ${outfile}
-python test_event_delay.py >> ${outfile}
-
-printf "\n" >> ${outfile}
-
-printf "================ Test: test_frame_rate.py =====================\n" >> ${outfile}
-python test_frame_rate.py >> ${outfile}
-
-printf "\n" >> ${outfile}
-
-printf "================ Test: test_write_speed.py ====================\n" >> ${outfile}
-python test_write_speed.py >> ${outfile}
\ No newline at end of file
+printf "================ Benchmarks: benchmark.py ==================\n" >> ${outfile}
+python benchmark.py --output "results/${now}_benchmark.json" "$@" >> ${outfile}
+# a regression against the baseline fails the testbench
+status=$?
+cat ${outfile}
+exit ${status}